@@ -0,0 +1,20 @@
+# alerts.py
+from typing import List, Tuple
+import config
+
+ALERT_COLUMNS = ['id', 'category', 'month', 'year', 'threshold', 'spent', 'budget', 'currency', 'created_at']
+
+
+def crossed_thresholds(before: float, after: float) -> List[int]:
+    """Alert thresholds (percent) that budget usage moving from `before` to `after` (fractions) rises past"""
+    return [t for t in config.BUDGET_ALERT_THRESHOLDS if before * 100 < t <= after * 100]
+
+
+def usage(spent: float, budget: float) -> float:
+    """Fraction of a budget used; 0 for a missing or zero budget"""
+    return spent / budget if budget > 0 else 0.0
+
+
+def month_of(date: str) -> Tuple[str, int, int]:
+    """('YYYY-MM', month, year) for an ISO date, as running totals and budgets key them"""
+    return date[:7], int(date[5:7]), int(date[:4])
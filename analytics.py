@@ -1,17 +1,28 @@
 # analytics.py
 import pandas as pd
 import plotly.express as px
+from typing import Optional
+import config
+from calendar_dim import attach_calendar
+from currency import symbol
+from rolling import MOVING_AVERAGE_WINDOWS, RollingStats
 
 
 class ExpenseAnalytics:
     """Analytics class for expense data visualization and calculations"""
 
-    def __init__(self, df: pd.DataFrame):
+    def __init__(self, df: pd.DataFrame, currency: Optional[str] = None):
+        # Amounts are expected in one currency, e.g. from currency.convert_frame
+        self.currency = currency or config.BASE_CURRENCY
+        self.symbol = symbol(self.currency).strip()
         self.df = df.copy()
         if not df.empty:
-            self.df['date'] = pd.to_datetime(self.df['date'])
-            self.df['month'] = self.df['date'].dt.to_period('M')
-            self.df['week'] = self.df['date'].dt.to_period('W')
+            # Month and week buckets come from the shared calendar dimension,
+            # joined on the integer day number
+            self.df = attach_calendar(self.df)
+            self.df['date'] = self.df['day'].to_numpy().astype('datetime64[D]')
+            self.df['month'] = self.df['month_key']
+            self.df['week'] = self.df['week_key']
 
     def get_category_spending(self) -> pd.DataFrame:
         """Get spending by category"""
@@ -23,8 +34,9 @@ class ExpenseAnalytics:
         """Get monthly spending trends"""
         if self.df.empty:
             return pd.DataFrame()
-        monthly_data = self.df.groupby('month')['amount'].sum().reset_index()
-        monthly_data['month_str'] = monthly_data['month'].astype(str)
+        monthly_data = self.df.groupby('month_index').agg(
+            month=('month', 'first'), amount=('amount', 'sum')).reset_index(drop=True)
+        monthly_data['month_str'] = monthly_data['month']
         return monthly_data
 
     def get_daily_spending(self) -> pd.DataFrame:
@@ -91,7 +103,7 @@ class ExpenseAnalytics:
         )
 
         fig.update_traces(
-            texttemplate='₹%{text:,.0f}',
+            texttemplate=self.symbol + '%{text:,.0f}',
             textposition='outside',
             marker_line_width=1,
             marker_line_color='white'
@@ -101,7 +113,7 @@ class ExpenseAnalytics:
             title_font_size=16,
             title_x=0.5,
             xaxis_title="<b>Month</b>",
-            yaxis_title="<b>Amount (₹)</b>",
+            yaxis_title=f"<b>Amount ({self.symbol})</b>",
             font=dict(size=12),
             showlegend=False,
             margin=dict(t=50, b=50, l=50, r=50)
@@ -134,10 +146,72 @@ class ExpenseAnalytics:
             title_font_size=16,
             title_x=0.5,
             xaxis_title="<b>Date</b>",
-            yaxis_title="<b>Amount (₹)</b>",
+            yaxis_title=f"<b>Amount ({self.symbol})</b>",
             font=dict(size=12),
             hovermode='x unified',
             margin=dict(t=50, b=50, l=50, r=50)
         )
 
         return fig
+
+    def create_moving_average_chart(self, rolling: RollingStats, days: int = 180):
+        """Create line chart of trailing moving averages over the last `days` days"""
+        averages = rolling.moving_averages(start_day=rolling.today - days + 1)
+        if averages['amount'].sum() == 0:
+            return None
+        labels = {f'ma_{window}': f'{window}-day average' for window in MOVING_AVERAGE_WINDOWS}
+        long_data = averages.melt(id_vars='date', value_vars=list(labels), var_name='series', value_name='average')
+        long_data['series'] = long_data['series'].map(labels)
+
+        fig = px.line(
+            long_data,
+            x='date',
+            y='average',
+            color='series',
+            title="<b>Moving Average of Daily Spending</b>",
+            color_discrete_sequence=['#667eea', '#764ba2', '#f59e0b']
+        )
+
+        fig.update_traces(line=dict(width=3))
+
+        fig.update_layout(
+            title_font_size=16,
+            title_x=0.5,
+            xaxis_title="<b>Date</b>",
+            yaxis_title=f"<b>Per Day ({self.symbol})</b>",
+            font=dict(size=12),
+            hovermode='x unified',
+            legend_title_text="",
+            margin=dict(t=50, b=50, l=50, r=50)
+        )
+
+        return fig
+
+    def create_month_to_date_chart(self, rolling: RollingStats):
+        """Create cumulative month-to-date chart against last month"""
+        curve = rolling.month_to_date_curve()
+        if curve['amount'].max() == 0:
+            return None
+
+        fig = px.line(
+            curve,
+            x='day_of_month',
+            y='amount',
+            color='period',
+            title="<b>Month-to-Date Spending</b>",
+            markers=True,
+            color_discrete_map={"This month": '#667eea', "Last month": '#9ca3af'}
+        )
+
+        fig.update_layout(
+            title_font_size=16,
+            title_x=0.5,
+            xaxis_title="<b>Day of Month</b>",
+            yaxis_title=f"<b>Cumulative ({self.symbol})</b>",
+            font=dict(size=12),
+            hovermode='x unified',
+            legend_title_text="",
+            margin=dict(t=50, b=50, l=50, r=50)
+        )
+
+        return fig
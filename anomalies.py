@@ -0,0 +1,239 @@
+# anomalies.py
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Dict, List, Optional
+from session_memory import get_manager
+
+# Day numbers fit comfortably in the low 32 bits of the composite index key
+_DAY_BITS = 32
+_DAY_OFFSET = 1 << 31
+
+
+class ExpenseAnomalyDetector:
+    """Near-duplicate and outlier detection over a user's expenses"""
+
+    def __init__(self, duplicate_window_days: int = 1, outlier_window: int = 20,
+                 outlier_threshold: float = 5.0, min_history: int = 5):
+        self.duplicate_window_days = duplicate_window_days
+        self.outlier_window = outlier_window
+        self.outlier_threshold = outlier_threshold
+        self.min_history = min_history
+        self._reset()
+
+    def _reset(self):
+        """Clear all indexes and results"""
+        self._row_hashes = pd.Series(dtype='uint64')
+        # Hashed index: (category, amount in paise) -> small integer code
+        self._key_codes: Dict[tuple, int] = {}
+        # Sorted index: (code << 32 | day) composite keys with matching ids
+        self._composite = np.empty(0, dtype=np.int64)
+        self._composite_ids = np.empty(0, dtype=np.int64)
+        # Per-category amount history in date order, for outlier windows
+        self._history: Dict[str, np.ndarray] = {}
+        self.duplicates = pd.DataFrame(columns=['id', 'duplicate_of'])
+        self.outliers = pd.DataFrame(columns=['id', 'median', 'score'])
+
+    @staticmethod
+    def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+        """Extract the columns used for detection"""
+        prepared = pd.DataFrame({
+            'id': df['id'].astype('int64').to_numpy(),
+            'category': df['category'].astype(str).to_numpy(),
+            'cents': np.round(df['amount'].astype(float).to_numpy() * 100).astype(np.int64),
+            'day': (pd.to_datetime(df['date']).to_numpy().astype('datetime64[D]')
+                    .astype(np.int64)),
+        })
+        prepared['amount'] = prepared['cents'] / 100
+        return prepared
+
+    @staticmethod
+    def _hash_rows(df: pd.DataFrame) -> pd.Series:
+        """Hash each row's detection-relevant content, indexed by id"""
+        hashes = pd.util.hash_pandas_object(
+            df[['id', 'category', 'cents', 'day']], index=False)
+        return pd.Series(hashes.to_numpy(), index=df['id'].to_numpy())
+
+    def _codes_for(self, prepared: pd.DataFrame) -> np.ndarray:
+        """Map (category, amount) pairs to integer codes, growing the table as needed"""
+        codes = np.empty(len(prepared), dtype=np.int64)
+        for i, key in enumerate(zip(prepared['category'], prepared['cents'])):
+            code = self._key_codes.get(key)
+            if code is None:
+                code = len(self._key_codes)
+                self._key_codes[key] = code
+            codes[i] = code
+        return codes
+
+    @staticmethod
+    def _composite_keys(codes: np.ndarray, days: np.ndarray) -> np.ndarray:
+        return (codes << _DAY_BITS) | (days + _DAY_OFFSET)
+
+    def refresh(self, expenses_df: pd.DataFrame) -> bool:
+        """Sync with the latest expenses; returns True when results changed.
+
+        Only rows that were added since the last call are scanned, unless
+        existing rows were edited or deleted, which triggers a full rescan.
+        """
+        if expenses_df.empty:
+            changed = not self._row_hashes.empty
+            self._reset()
+            return changed
+
+        prepared = self._prepare(expenses_df)
+        hashes = self._hash_rows(prepared)
+        known = self._row_hashes
+
+        if not known.empty and known.index.isin(hashes.index).all():
+            unchanged = (hashes.loc[known.index].to_numpy() == known.to_numpy()).all()
+            if unchanged:
+                new_rows = prepared[~prepared['id'].isin(known.index)]
+                if new_rows.empty:
+                    return False
+                self._scan_incremental(new_rows.sort_values(['day', 'id']))
+                self._row_hashes = hashes
+                return True
+
+        self._scan_full(prepared)
+        self._row_hashes = hashes
+        return True
+
+    def _scan_full(self, prepared: pd.DataFrame):
+        """Rebuild indexes and results in one vectorized pass"""
+        self._reset()
+        prepared = prepared.sort_values(['day', 'id'])
+        codes = self._codes_for(prepared)
+        composite = self._composite_keys(codes, prepared['day'].to_numpy())
+        order = np.argsort(composite, kind='stable')
+        self._composite = composite[order]
+        self._composite_ids = prepared['id'].to_numpy()[order]
+
+        # Neighbours in (code, day) order that share a code and fall inside the window
+        sorted_codes = self._composite >> _DAY_BITS
+        sorted_days = (self._composite & ((1 << _DAY_BITS) - 1)) - _DAY_OFFSET
+        is_dup = ((sorted_codes[1:] == sorted_codes[:-1]) &
+                  (sorted_days[1:] - sorted_days[:-1] <= self.duplicate_window_days))
+        self.duplicates = pd.DataFrame({
+            'id': self._composite_ids[1:][is_dup],
+            'duplicate_of': self._composite_ids[:-1][is_dup],
+        })
+
+        outlier_frames = []
+        for category, group in prepared.groupby('category', sort=False):
+            amounts = group['amount'].to_numpy(dtype=float)
+            self._history[category] = amounts
+            medians, scores = self._robust_scores(amounts)
+            flagged = scores > self.outlier_threshold
+            if flagged.any():
+                outlier_frames.append(pd.DataFrame({
+                    'id': group['id'].to_numpy()[flagged],
+                    'median': medians[flagged],
+                    'score': scores[flagged],
+                }))
+        if outlier_frames:
+            self.outliers = pd.concat(outlier_frames, ignore_index=True)
+
+    def _robust_scores(self, amounts: np.ndarray):
+        """Score each amount against the rolling median/MAD of the amounts before it"""
+        w = self.outlier_window
+        padded = np.concatenate([np.full(w, np.nan), amounts])
+        windows = sliding_window_view(padded[:-1], w)
+        counts = np.minimum(np.arange(len(amounts)), w)
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            # Leading windows are all-NaN until the category has some history
+            warnings.simplefilter('ignore', RuntimeWarning)
+            medians = np.nanmedian(windows, axis=1)
+            mads = np.nanmedian(np.abs(windows - medians[:, None]), axis=1)
+            scores = 0.6745 * (amounts - medians) / mads
+        scores = np.where((counts >= self.min_history) & (mads > 0), scores, 0.0)
+        return medians, np.nan_to_num(scores)
+
+    def _scan_incremental(self, new_rows: pd.DataFrame):
+        """Check new rows against the existing indexes, then insert them"""
+        duplicate_rows = []
+        outlier_rows = []
+        codes = self._codes_for(new_rows)
+        for code, row in zip(codes, new_rows.itertuples(index=False)):
+            matches = self._window_matches(code, row.day)
+            if len(matches):
+                duplicate_rows.append((row.id, int(matches[-1])))
+
+            history = self._history.get(row.category, np.empty(0))
+            median, score = self._score_against(history, row.amount)
+            if score > self.outlier_threshold:
+                outlier_rows.append((row.id, median, score))
+            self._history[row.category] = np.append(history, row.amount)
+
+            key = self._composite_keys(np.int64(code), np.int64(row.day))
+            pos = np.searchsorted(self._composite, key, side='right')
+            self._composite = np.insert(self._composite, pos, key)
+            self._composite_ids = np.insert(self._composite_ids, pos, row.id)
+
+        if duplicate_rows:
+            self.duplicates = pd.concat([
+                self.duplicates,
+                pd.DataFrame(duplicate_rows, columns=['id', 'duplicate_of'])
+            ], ignore_index=True)
+        if outlier_rows:
+            self.outliers = pd.concat([
+                self.outliers,
+                pd.DataFrame(outlier_rows, columns=['id', 'median', 'score'])
+            ], ignore_index=True)
+
+    def _window_matches(self, code: int, day: int) -> np.ndarray:
+        """Ids of indexed expenses with the same key within the duplicate window"""
+        lo = self._composite_keys(np.int64(code), np.int64(day - self.duplicate_window_days))
+        hi = self._composite_keys(np.int64(code), np.int64(day + self.duplicate_window_days))
+        start = np.searchsorted(self._composite, lo, side='left')
+        end = np.searchsorted(self._composite, hi, side='right')
+        return self._composite_ids[start:end]
+
+    def _score_against(self, history: np.ndarray, amount: float):
+        """Robust z-score of one amount against the tail of its category history"""
+        window = history[-self.outlier_window:]
+        if len(window) < self.min_history:
+            return float('nan'), 0.0
+        median = float(np.median(window))
+        mad = float(np.median(np.abs(window - median)))
+        if mad <= 0:
+            return median, 0.0
+        return median, 0.6745 * (amount - median) / mad
+
+    def check_candidate(self, amount: float, category: str, date: str) -> List[int]:
+        """Ids of existing expenses that a not-yet-saved expense would duplicate"""
+        code = self._key_codes.get((category, int(round(amount * 100))))
+        if code is None:
+            return []
+        day = int(np.datetime64(date, 'D').astype(np.int64))
+        return [int(i) for i in self._window_matches(code, day)]
+
+    def flags(self) -> Dict[int, List[str]]:
+        """Map expense id to its anomaly labels"""
+        labels: Dict[int, List[str]] = {}
+        for expense_id in self.duplicates['id']:
+            labels.setdefault(int(expense_id), []).append('duplicate')
+        for expense_id in self.outliers['id']:
+            labels.setdefault(int(expense_id), []).append('outlier')
+        return labels
+
+
+def get_detector(session_state, user_id: int) -> ExpenseAnomalyDetector:
+    """Fetch this session's detector for a user, creating it on first use.
+
+    Detectors live in the session memory manager rather than in session
+    state, so they count against the global budget; an evicted detector is
+    simply rebuilt by the next full refresh.
+    """
+    manager = get_manager()
+    key = f"anomaly_detector_{user_id}"
+    detector = manager.get(session_state, key)
+    if detector is None:
+        detector = ExpenseAnomalyDetector()
+        manager.put(session_state, key, detector)
+    return detector
+
+
+def get_existing_detector(session_state, user_id: int) -> Optional[ExpenseAnomalyDetector]:
+    """Return this session's detector for a user only if one has already been built"""
+    return get_manager().get(session_state, f"anomaly_detector_{user_id}")
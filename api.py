@@ -0,0 +1,480 @@
+# api.py
+"""Local REST/JSON API over the storage backend and analytics.
+
+Clients exchange a username and password for a bearer token at
+POST /api/token and send it as `Authorization: Bearer <token>`. Reads carry
+an ETag built from the user's data version (the per-user stats row), so a
+matching If-None-Match is answered with 304 before any expense is loaded.
+Responses are gzip-compressed when the client accepts it.
+
+Usage: python api.py [--host HOST] [--port PORT]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import config
+from analytics import ExpenseAnalytics
+from backend import StorageBackend, get_backend
+from currency import convert_frame, converted_stats, get_rates
+from querylog import is_query_timeout
+from sketches import merge_all, percentile_table, range_sketches
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH_OPERATIONS = 500
+GZIP_MIN_BYTES = 512
+
+
+class ApiError(Exception):
+    """Error returned to the client as {"error": message} with an HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _json_default(value: Any):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (date, datetime, pd.Timestamp)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def records(df: pd.DataFrame) -> List[Dict]:
+    """DataFrame rows as JSON-ready dicts, with missing values as null"""
+    if df.empty:
+        return []
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _parse_date(value: Any, field: str) -> str:
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise ApiError(400, f"'{field}' must be a YYYY-MM-DD date")
+
+
+def _parse_int(value: Any, field: str, minimum: Optional[int] = None, maximum: Optional[int] = None) -> int:
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"'{field}' must be an integer")
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise ApiError(400, f"'{field}' is out of range")
+    return number
+
+
+def _parse_amount(value: Any) -> float:
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, "'amount' must be a number")
+    if not np.isfinite(amount) or amount <= 0:
+        raise ApiError(400, "'amount' must be positive")
+    return amount
+
+
+def _required(body: Dict, field: str) -> Any:
+    if body.get(field) in (None, ""):
+        raise ApiError(400, f"'{field}' is required")
+    return body[field]
+
+
+def _currency_code(value: Any) -> Optional[str]:
+    return str(value).strip().upper() if value else None
+
+
+def _expense_fields(body: Dict) -> Dict:
+    """Validated keyword arguments for add_expense/update_expense"""
+    return {
+        "amount": _parse_amount(_required(body, "amount")),
+        "category": str(_required(body, "category")),
+        "description": str(body.get("description") or ""),
+        "date": _parse_date(_required(body, "date"), "date"),
+        "currency": _currency_code(body.get("currency")),
+    }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Routes requests to `handle_*` methods; `server.db` is the shared backend"""
+
+    server_version = "DailyBudgetAPI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # (method, path pattern, handler name, requires auth)
+    routes: List[Tuple[str, "re.Pattern", str, bool]] = [
+        ("POST", re.compile(r"/api/token"), "handle_create_token", False),
+        ("DELETE", re.compile(r"/api/token"), "handle_revoke_token", True),
+        ("GET", re.compile(r"/api/stats"), "handle_stats", True),
+        ("GET", re.compile(r"/api/expenses"), "handle_list_expenses", True),
+        ("POST", re.compile(r"/api/expenses"), "handle_add_expense", True),
+        ("PUT", re.compile(r"/api/expenses/(\d+)"), "handle_update_expense", True),
+        ("DELETE", re.compile(r"/api/expenses/(\d+)"), "handle_delete_expense", True),
+        ("POST", re.compile(r"/api/batch"), "handle_batch", True),
+        ("GET", re.compile(r"/api/changes"), "handle_changes", True),
+        ("GET", re.compile(r"/api/budgets"), "handle_budgets", True),
+        ("PUT", re.compile(r"/api/budgets"), "handle_set_budget", True),
+        ("GET", re.compile(r"/api/recurring"), "handle_recurring", True),
+        ("GET", re.compile(r"/api/analytics/(categories|monthly|daily|quantiles)"), "handle_analytics", True),
+    ]
+
+    # Plumbing
+
+    @property
+    def db(self) -> StorageBackend:
+        return self.server.db
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.user: Optional[Dict] = None
+        try:
+            path_matched = False
+            for route_method, pattern, handler_name, needs_auth in self.routes:
+                match = pattern.fullmatch(url.path.rstrip("/"))
+                if not match:
+                    continue
+                path_matched = True
+                if route_method != method:
+                    continue
+                if needs_auth:
+                    self._authenticate()
+                status, payload, etag = getattr(self, handler_name)(*match.groups())
+                self._send(status, payload, etag)
+                return
+            raise ApiError(405 if path_matched else 404,
+                           "Method not allowed" if path_matched else "Not found")
+        except ApiError as e:
+            self._send(e.status, {"error": e.message})
+        except Exception as e:
+            if is_query_timeout(e):
+                self._send(503, {"error": "The query took too long; try a narrower date range"})
+                return
+            self.log_error("Unhandled error: %r", e)
+            self._send(500, {"error": "Internal server error"})
+
+    def _authenticate(self):
+        header = self.headers.get("Authorization", "")
+        scheme, _, token = header.partition(" ")
+        user = self.db.get_api_token_user(token.strip()) if scheme.lower() == "bearer" and token else None
+        if user is None:
+            raise ApiError(401, "A valid bearer token is required")
+        self.user = user
+
+    def _body(self) -> Any:
+        length = _parse_int(self.headers.get("Content-Length", 0), "Content-Length", minimum=0)
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "Request body too large")
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+
+    def _object_body(self) -> Dict:
+        body = self._body()
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def _not_modified(self, etag: str) -> bool:
+        """True if the client already holds this representation"""
+        candidates = [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]
+        return etag in candidates or "*" in candidates
+
+    def _etag(self, *parts: Any) -> str:
+        """Weak ETag for this user, request path and the given version parts"""
+        key = "|".join(str(part) for part in (self.user["id"], self.path, *parts))
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+    def _versioned(self, produce: Callable[[], Any], *parts: Any) -> Tuple[int, Any, str]:
+        """Respond 304 for a current ETag; otherwise build the payload.
+
+        The ETag is derived from the user's data version (plus any extra
+        parts such as the rate table version), so it is known before the
+        payload is produced.
+        """
+        version = self.db.get_user_stats(self.user["id"])["version"]
+        etag = self._etag(version, *parts)
+        if self._not_modified(etag):
+            return 304, None, etag
+        return 200, produce(), etag
+
+    def _hashed(self, payload: Any) -> Tuple[int, Any, str]:
+        """Like `_versioned` for data the stats version does not cover; the ETag hashes the payload"""
+        digest = hashlib.sha1(json.dumps(payload, default=_json_default, sort_keys=True).encode()).hexdigest()
+        etag = self._etag(digest)
+        if self._not_modified(etag):
+            return 304, None, etag
+        return 200, payload, etag
+
+    def _send(self, status: int, payload: Any = None, etag: Optional[str] = None):
+        body = b""
+        if payload is not None and status != 304:
+            body = json.dumps(payload, default=_json_default, separators=(",", ":")).encode()
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Vary", "Accept-Encoding, Authorization")
+            if len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=6)
+                self.send_header("Content-Encoding", "gzip")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "private, no-cache")
+        if status == 401:
+            self.send_header("WWW-Authenticate", "Bearer")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _currency(self) -> str:
+        return _currency_code(self.query.get("currency")) or config.BASE_CURRENCY
+
+    def _date_range(self) -> Tuple[Optional[str], Optional[str]]:
+        start, end = self.query.get("start"), self.query.get("end")
+        return (_parse_date(start, "start") if start else None,
+                _parse_date(end, "end") if end else None)
+
+    # Auth
+
+    def handle_create_token(self):
+        body = self._object_body()
+        user = self.db.authenticate_user(str(body.get("username", "")), str(body.get("password", "")))
+        if user is None:
+            raise ApiError(401, "Invalid username or password")
+        token = self.db.create_api_token(user["id"])
+        if token is None:
+            raise ApiError(500, "Could not issue a token")
+        return 201, {"token": token, "expires_in_hours": config.API_TOKEN_TTL_HOURS, "user": user}, None
+
+    def handle_revoke_token(self):
+        _, _, token = self.headers.get("Authorization", "").partition(" ")
+        self.db.revoke_api_token(token.strip())
+        return 204, None, None
+
+    # Expenses
+
+    def handle_stats(self):
+        base = self._currency()
+        rates = get_rates()
+
+        def produce():
+            stats = converted_stats(self.db.get_user_stats(self.user["id"]), self.user["id"], base)
+            return {key: stats[key] for key in
+                    ("count", "total", "currency", "min_date", "max_date", "version", "categories")}
+        return self._versioned(produce, base, rates.version)
+
+    def handle_list_expenses(self):
+        limit = _parse_int(self.query.get("limit", config.API_PAGE_SIZE), "limit", 1, config.API_MAX_PAGE_SIZE)
+        offset = _parse_int(self.query.get("offset", 0), "offset", minimum=0)
+        start, end = self._date_range()
+        base = _currency_code(self.query.get("currency"))
+        rates = get_rates()
+
+        def produce():
+            expenses = self.db.get_expenses(self.user["id"], start, end)
+            page = expenses.iloc[offset:offset + limit]
+            if base:
+                page = convert_frame(page, base)
+            return {
+                "items": records(page),
+                "total": len(expenses),
+                "offset": offset,
+                "limit": limit,
+                "next_offset": offset + limit if offset + limit < len(expenses) else None,
+            }
+        return self._versioned(produce, rates.version if base else "")
+
+    def _add(self, body: Dict) -> Dict:
+        if not self.db.add_expense(self.user["id"], **_expense_fields(body)):
+            raise ApiError(500, "Could not add expense")
+        return {"ok": True}
+
+    def _update(self, expense_id: int, body: Dict) -> Dict:
+        if not self.db.update_expense(expense_id, self.user["id"], **_expense_fields(body)):
+            raise ApiError(404, "Expense not found")
+        return {"ok": True, "id": expense_id}
+
+    def _delete(self, expense_id: int) -> Dict:
+        if not self.db.delete_expense(expense_id, self.user["id"]):
+            raise ApiError(404, "Expense not found")
+        return {"ok": True, "id": expense_id}
+
+    def handle_add_expense(self):
+        return 201, self._add(self._object_body()), None
+
+    def handle_update_expense(self, expense_id: str):
+        return 200, self._update(int(expense_id), self._object_body()), None
+
+    def handle_delete_expense(self, expense_id: str):
+        return 200, self._delete(int(expense_id)), None
+
+    def handle_batch(self):
+        """Apply a list of add/update/delete operations, reporting each result.
+
+        Operations are independent: a failing one is reported in its slot
+        and the rest still run.
+        """
+        operations = self._object_body().get("operations")
+        if not isinstance(operations, list):
+            raise ApiError(400, "'operations' must be a list")
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise ApiError(413, f"At most {MAX_BATCH_OPERATIONS} operations per batch")
+        results = []
+        for operation in operations:
+            try:
+                if not isinstance(operation, dict):
+                    raise ApiError(400, "Each operation must be a JSON object")
+                op = operation.get("op")
+                if op == "add":
+                    result = self._add(operation)
+                elif op == "update":
+                    result = self._update(_parse_int(_required(operation, "id"), "id"), operation)
+                elif op == "delete":
+                    result = self._delete(_parse_int(_required(operation, "id"), "id"))
+                else:
+                    raise ApiError(400, "'op' must be add, update or delete")
+                results.append({"status": 200, **result})
+            except ApiError as e:
+                results.append({"status": e.status, "error": e.message})
+        return 200, {"results": results}, None
+
+    def handle_changes(self):
+        """Delta sync: net changes after `since`; see StorageBackend.get_changes_since"""
+        since = _parse_int(self.query.get("since", 0), "since", minimum=0)
+        limit = _parse_int(self.query.get("limit", config.API_MAX_PAGE_SIZE), "limit", 1, config.API_MAX_PAGE_SIZE)
+
+        def produce():
+            batch = self.db.get_changes_since(self.user["id"], since, limit)
+            return {
+                "changes": records(batch["changes"]),
+                "last_seq": batch["last_seq"],
+                "has_more": batch["has_more"],
+                "reset": batch["reset"],
+            }
+        return self._versioned(produce)
+
+    # Budgets and recurring rules
+
+    def handle_budgets(self):
+        today = date.today()
+        month = _parse_int(self.query.get("month", today.month), "month", 1, 12)
+        year = _parse_int(self.query.get("year", today.year), "year", 1900, 9999)
+        months = _parse_int(self.query.get("months", 1), "months", 1, 24)
+        budgets = self.db.get_budgets(self.user["id"], month, year, months)
+        return self._hashed({"month": month, "year": year, "months": months, "items": records(budgets)})
+
+    @staticmethod
+    def _budget_row(item: Dict) -> Tuple:
+        if not isinstance(item, dict):
+            raise ApiError(400, "Each budget must be a JSON object")
+        return (str(_required(item, "category")),
+                _parse_int(_required(item, "month"), "month", 1, 12),
+                _parse_int(_required(item, "year"), "year", 1900, 9999),
+                _parse_amount(_required(item, "amount")),
+                _currency_code(item.get("currency")))
+
+    def handle_set_budget(self):
+        """Set one budget, or many at once with {"items": [...]} in a single transaction"""
+        body = self._object_body()
+        if "items" not in body:
+            category, month, year, amount, currency = self._budget_row(body)
+            if not self.db.set_budget(self.user["id"], category, amount, month, year, currency):
+                raise ApiError(500, "Could not save budget")
+            return 200, {"ok": True}, None
+        items = body["items"]
+        if not isinstance(items, list):
+            raise ApiError(400, "'items' must be a list")
+        if len(items) > MAX_BATCH_OPERATIONS:
+            raise ApiError(413, f"At most {MAX_BATCH_OPERATIONS} budgets per request")
+        rows = [self._budget_row(item) for item in items]
+        try:
+            saved = self.db.set_budgets_bulk(self.user["id"], rows)
+        except Exception:
+            raise ApiError(500, "Could not save budgets")
+        return 200, {"ok": True, "saved": saved}, None
+
+    def handle_recurring(self):
+        return self._hashed({"items": records(self.db.get_recurring_expenses(self.user["id"]))})
+
+    # Analytics
+
+    def handle_analytics(self, kind: str):
+        start, end = self._date_range()
+        base = self._currency()
+        rates = get_rates()
+        if kind == "quantiles":
+            return self._versioned(lambda: self._quantiles(start, end, base), base, rates.version)
+
+        def produce():
+            expenses = convert_frame(self.db.get_expenses(self.user["id"], start, end), base)
+            analytics = ExpenseAnalytics(expenses, base)
+            if kind == "categories":
+                data = analytics.get_category_spending()
+            elif kind == "monthly":
+                data = analytics.get_monthly_spending().drop(columns="month_str", errors="ignore")
+            else:
+                data = analytics.get_daily_spending()
+                if not data.empty:
+                    data["date"] = data["date"].dt.strftime("%Y-%m-%d")
+            return {"currency": base, "items": records(data)}
+        return self._versioned(produce, base, rates.version)
+
+    def _quantiles(self, start: Optional[str], end: Optional[str], base: str) -> Dict:
+        """Per-category and overall median, typical range and p90 from the stored amount sketches"""
+        stats = self.db.get_user_stats(self.user["id"])
+        start, end = start or stats["min_date"], end or stats["max_date"]
+        if not stats["count"] or start > end:
+            return {"currency": base, "overall": None, "items": []}
+        sketches = range_sketches(self.db, self.user["id"], base, stats["version"],
+                                  date.fromisoformat(start), date.fromisoformat(end))
+        overall = merge_all(sketches.values())
+        return {"currency": base, "overall": overall.summary() if overall.count else None,
+                "items": records(percentile_table(sketches))}
+
+
+def make_server(host: Optional[str] = None, port: Optional[int] = None,
+                db: Optional[StorageBackend] = None) -> ThreadingHTTPServer:
+    """Build (but do not start) an API server; one backend is shared by all request threads"""
+    server = ThreadingHTTPServer((host or config.API_HOST, config.API_PORT if port is None else port), ApiHandler)
+    server.daemon_threads = True
+    server.db = db or get_backend()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=None, help="Interface to bind (default from config)")
+    parser.add_argument("--port", type=int, default=None, help="Port to listen on (default from config)")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port)
+    print(f"Serving the API on http://{server.server_address[0]}:{server.server_address[1]}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
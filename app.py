@@ -1,6 +1,14 @@
 import streamlit as st
-from database import ExpenseTrackerDB
+from backend import get_backend
 from utils import load_css
+from recurring import run_scheduler_if_due
+from archive import run_archiver_if_due
+from changelog import run_compaction_if_due
+from backup import run_backup_if_due
+from session_memory import get_manager
+from prefetch import get_prefetcher
+from currency import available_currencies, converted_stats, format_amount, session_currency, symbol
+from querylog import is_query_timeout
 
 # Import the page functions from the new 'views' directory
 from views.auth import show_auth_page
@@ -9,6 +17,9 @@ from views.add_expense import show_add_expense
 from views.manage_expenses import show_manage_expenses
 from views.budget import show_budget_tracker
 from views.export import show_export_data
+from views.recurring import show_recurring_expenses
+from views.diagnostics import show_diagnostics_panel
+from views.alerts import show_budget_alerts
 
 # Configure the page (must be the first Streamlit command)
 st.set_page_config(
@@ -24,13 +35,28 @@ def main():
     # Load external CSS
     load_css("static/style.css")
 
-    # Initialize the database
-    db = ExpenseTrackerDB()
+    # Initialize the configured storage backend
+    db = get_backend()
+
+    # Materialize due recurring expenses for all users (once per day per process)
+    run_scheduler_if_due(db)
+
+    # Move expenses past the archive horizon into compressed blocks (once per day per process)
+    run_archiver_if_due(db)
+
+    # Drop superseded and expired change-log entries (once per day per process)
+    run_compaction_if_due(db)
+
+    # Take the daily online backup in the background (once per day per process)
+    run_backup_if_due(db)
 
     # Initialize session state
     if 'user' not in st.session_state:
         st.session_state.user = None
 
+    # Keep this session's memory accounting current and release idle sessions
+    get_manager().track(st.session_state)
+
     # Main application header
     st.markdown('''
     <div class="main-header">
@@ -54,12 +80,12 @@ def main():
 
             page_options = [
                 "Dashboard", "Add Expense", "Manage Expenses",
-                "Budget Tracker", "Export Data"
+                "Recurring", "Budget Tracker", "Export Data"
             ]
 
             page_icons = {
                 "Dashboard": "📊", "Add Expense": "➕", "Manage Expenses": "✏️",
-                "Budget Tracker": "🎯", "Export Data": "📥"
+                "Recurring": "🔁", "Budget Tracker": "🎯", "Export Data": "📥"
             }
 
             # This is our custom navigator, which we want to keep
@@ -69,24 +95,43 @@ def main():
                 format_func=lambda x: f"{page_icons.get(x, '')} {x}"
             )
 
+            # Amounts from all currencies are shown converted into this one
+            currencies = available_currencies()
+            current_currency = session_currency(st.session_state)
+            st.selectbox(
+                "💱 Display Currency",
+                options=currencies,
+                index=currencies.index(current_currency) if current_currency in currencies else 0,
+                format_func=lambda code: f"{code} ({symbol(code).strip()})",
+                key="base_currency"
+            )
+
             st.markdown("---")
 
-            # Quick stats in the sidebar
-            expenses_df = db.get_expenses(st.session_state.user['id'])
-            if not expenses_df.empty:
-                total_spent = expenses_df['amount'].sum()
-                total_expenses = len(expenses_df)
+            show_budget_alerts(db)
+
+            # Quick stats in the sidebar, read from the running per-user stats row
+            base_currency = session_currency(st.session_state)
+            stats = converted_stats(db.get_user_stats(st.session_state.user['id']),
+                                    st.session_state.user['id'], base_currency)
+            if stats['count']:
+                total_spent = format_amount(stats['total'], base_currency)
+                total_expenses = stats['count']
                 st.markdown(f'''
                 <div style="background: #f8fafc; padding: 1rem; border-radius: 8px; margin: 1rem 0;">
                     <h4 style="margin: 0 0 0.5rem 0; color: #1f2937;">Quick Stats</h4>
-                    <p style="margin: 0.25rem 0;"><i class="fas fa-dollar-sign"></i> Total Spent: <strong>₹{total_spent:,.2f}</strong></p>
+                    <p style="margin: 0.25rem 0;"><i class="fas fa-dollar-sign"></i> Total Spent: <strong>{total_spent}</strong></p>
                     <p style="margin: 0.25rem 0;"><i class="fas fa-list"></i> Total Records: <strong>{total_expenses}</strong></p>
                 </div>
                 ''', unsafe_allow_html=True)
 
             st.markdown("---")
 
+            show_diagnostics_panel(db)
+
             if st.button("🚪 Logout", use_container_width=True, type="secondary"):
+                get_prefetcher().cancel(st.session_state)
+                get_manager().release(st.session_state)
                 st.session_state.user = None
                 st.rerun()
 
@@ -95,6 +140,7 @@ def main():
             "Dashboard": show_dashboard,
             "Add Expense": show_add_expense,
             "Manage Expenses": show_manage_expenses,
+            "Recurring": show_recurring_expenses,
             "Budget Tracker": show_budget_tracker,
             "Export Data": show_export_data
         }
@@ -102,7 +148,18 @@ def main():
         # Call the selected page's function
         page_function = page_map.get(page)
         if page_function:
-            page_function(db)
+            try:
+                page_function(db)
+            except Exception as e:
+                # A read that ran past its time budget was interrupted; the rest of the app stays usable
+                if not is_query_timeout(e):
+                    raise
+                st.error("⏱️ This page took too long to load and was stopped. "
+                         "Try a shorter date range or reload in a moment.")
+            else:
+                # Once the page is drawn, prefetch the page this user usually opens next
+                get_prefetcher().visit(st.session_state, db, st.session_state.user['id'],
+                                       base_currency, page)
 
 
 if __name__ == "__main__":
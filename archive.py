@@ -0,0 +1,141 @@
+# archive.py
+"""Compressed archival tier for old expense history.
+
+Expenses older than a horizon move out of the hot `expenses` table into one
+zlib-compressed NumPy column block per user and month. Monthly rollups for
+the archived months stay in the database, and `get_expenses` reads blocks
+back only when a requested date range reaches past the archive horizon.
+
+Usage: python archive.py [--horizon DAYS]
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from typing import List, Optional
+import config
+from backend import StorageBackend
+from daily import once_a_day
+
+# Column name -> on-disk dtype; strings are stored as fixed-width unicode so
+# blocks load without pickle
+BLOCK_COLUMNS = {
+    'id': np.int64,
+    'amount': np.float64,
+    'category': str,
+    'description': str,
+    'day': np.int64,
+    'created_at': str,
+    'currency': str,
+    'recurring_id': np.int64,
+}
+
+
+class ExpenseArchive:
+    """Per-user, per-month compressed column blocks on disk"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _user_dir(self, user_id: int) -> str:
+        return os.path.join(self.root, f"user_{user_id}")
+
+    def _block_path(self, user_id: int, month_key: str) -> str:
+        return os.path.join(self._user_dir(user_id), f"{month_key}.npz")
+
+    def months(self, user_id: int) -> List[str]:
+        """Archived months ('YYYY-MM') for a user, oldest first"""
+        directory = self._user_dir(user_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.npz'))
+
+    def _load_block(self, path: str) -> pd.DataFrame:
+        with np.load(path, allow_pickle=False) as block:
+            return pd.DataFrame({column: block[column] for column in BLOCK_COLUMNS})
+
+    def write_month(self, user_id: int, month_key: str, rows: pd.DataFrame) -> pd.DataFrame:
+        """Merge `rows` into a month's block and return the whole block.
+
+        Rows already in the block (by id) are replaced, so re-running an
+        interrupted archive pass never duplicates expenses. The block is
+        written to a temporary file and swapped in.
+        """
+        path = self._block_path(user_id, month_key)
+        if os.path.exists(path):
+            existing = self._load_block(path)
+            rows = pd.concat([existing[~existing['id'].isin(rows['id'])], rows], ignore_index=True)
+        rows = rows.sort_values(['day', 'id']).reset_index(drop=True)
+
+        os.makedirs(self._user_dir(user_id), exist_ok=True)
+        building = f"{path}.building.npz"
+        np.savez_compressed(building, **{
+            column: rows[column].fillna('' if dtype is str else -1).to_numpy().astype(dtype)
+            for column, dtype in BLOCK_COLUMNS.items()
+        })
+        os.replace(building, path)
+        return rows
+
+    def read(self, user_id: int, start_day: Optional[int] = None, end_day: Optional[int] = None) -> pd.DataFrame:
+        """Archived rows with `day` in [start_day, end_day]; only overlapping months are opened"""
+        frames = []
+        for month_key in self.months(user_id):
+            first = np.datetime64(month_key, 'M').astype('datetime64[D]').astype(np.int64)
+            last = (np.datetime64(month_key, 'M') + 1).astype('datetime64[D]').astype(np.int64) - 1
+            if (start_day is not None and last < start_day) or (end_day is not None and first > end_day):
+                continue
+            block = self._load_block(self._block_path(user_id, month_key))
+            # Blocks are sorted by day, so the range is a searchsorted slice
+            days = block['day'].to_numpy()
+            lo = 0 if start_day is None else np.searchsorted(days, start_day, 'left')
+            hi = len(days) if end_day is None else np.searchsorted(days, end_day, 'right')
+            frames.append(block.iloc[lo:hi])
+        if not frames:
+            return pd.DataFrame({column: pd.Series(dtype=object if dtype is str else dtype)
+                                 for column, dtype in BLOCK_COLUMNS.items()})
+        return pd.concat(frames, ignore_index=True)
+
+    def remove_user(self, user_id: int):
+        """Delete all of a user's blocks"""
+        for month_key in self.months(user_id):
+            os.remove(self._block_path(user_id, month_key))
+
+
+def monthly_rollup(block: pd.DataFrame, month_key: str) -> pd.DataFrame:
+    """Per-category, per-currency count and total for one archived month"""
+    rollup = block.groupby(['category', 'currency'], as_index=False).agg(
+        expense_count=('id', 'size'), total_amount=('amount', 'sum'))
+    rollup.insert(0, 'month', month_key)
+    return rollup
+
+
+def archive_horizon(horizon_days: Optional[int] = None, today: Optional[date] = None) -> Optional[str]:
+    """First date that stays in the hot table, or None when archiving is disabled"""
+    horizon_days = config.ARCHIVE_HORIZON_DAYS if horizon_days is None else horizon_days
+    if horizon_days <= 0:
+        return None
+    cutoff = (today or date.today()) - timedelta(days=horizon_days)
+    # Archive whole months only, so a month is never split between tiers
+    return cutoff.replace(day=1).isoformat()
+
+
+@once_a_day()
+def run_archiver_if_due(db: StorageBackend, today: date) -> int:
+    """Archive expenses past the horizon"""
+    before = archive_horizon(today=today)
+    return db.archive_expenses(before) if before else 0
+
+
+if __name__ == "__main__":
+    from backend import get_backend
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--horizon", type=int, default=None,
+                        help="Days of history to keep in the hot table (default from config)")
+    args = parser.parse_args()
+    cutoff = archive_horizon(args.horizon)
+    if cutoff is None:
+        print("Archiving is disabled (horizon is 0 days)")
+    else:
+        print(f"Archived {get_backend().archive_expenses(cutoff)} expenses dated before {cutoff}")
@@ -0,0 +1,237 @@
+# backend.py
+import hashlib
+import threading
+import pandas as pd
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+import config
+
+BACKENDS = ("sqlite", "memory")
+
+# Columns of the change batches returned by get_changes_since
+CHANGE_COLUMNS = ['seq', 'op', 'id', 'amount', 'category', 'description', 'date', 'currency']
+
+
+class StorageBackend(ABC):
+    """Storage interface used by the views, analytics and background jobs"""
+
+    name = "abstract"
+
+    def hash_password(self, password: str) -> str:
+        """Hash password using SHA-256"""
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        """Hash an API token for storage"""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    # Users
+
+    @abstractmethod
+    def create_user(self, username: str, email: str, password: str) -> bool:
+        """Create new user account"""
+
+    @abstractmethod
+    def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
+        """Authenticate user login"""
+
+    @abstractmethod
+    def create_api_token(self, user_id: int) -> Optional[str]:
+        """Issue an API token valid for `API_TOKEN_TTL_HOURS`; returns the plain token"""
+
+    @abstractmethod
+    def get_api_token_user(self, token: str) -> Optional[Dict]:
+        """User an unexpired API token belongs to"""
+
+    @abstractmethod
+    def revoke_api_token(self, token: str) -> bool:
+        """Invalidate an API token"""
+
+    # Expenses
+
+    @abstractmethod
+    def add_expense(self, user_id: int, amount: float, category: str, description: str, date: str,
+                    currency: Optional[str] = None) -> bool:
+        """Add new expense; currency defaults to the configured base currency"""
+
+    @abstractmethod
+    def add_expenses(self, user_id: int, rows: List[Tuple]) -> int:
+        """Add many expenses in one transaction; rows are (amount, category, description, date, currency).
+
+        Returns the number added; nothing is added if any row fails.
+        """
+
+    @abstractmethod
+    def get_user_stats(self, user_id: int) -> Dict:
+        """Get count, total, min_date, max_date, version and per-category totals for a user.
+
+        Totals are in stored units; `breakdown` lists (category, currency,
+        total) so callers can convert with `currency.converted_stats`.
+        """
+
+    @abstractmethod
+    def get_expenses(self, user_id: int, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None) -> pd.DataFrame:
+        """Get a user's expenses, newest first, optionally limited to [start_date, end_date]"""
+
+    @abstractmethod
+    def delete_expense(self, expense_id: int, user_id: int) -> bool:
+        """Delete an expense; False if the user has no such (unarchived) expense"""
+
+    @abstractmethod
+    def update_expense(self, expense_id: int, user_id: int, amount: float, category: str, description: str, date: str,
+                       currency: Optional[str] = None) -> bool:
+        """Update an expense; the currency is kept unless a new one is given.
+
+        False if the user has no such (unarchived) expense.
+        """
+
+    # Change log (delta sync)
+
+    @abstractmethod
+    def get_changes_since(self, user_id: int, seq: int, limit: int = 1000) -> Dict:
+        """Net expense changes after `seq` as {changes, last_seq, has_more, reset}.
+
+        `changes` has CHANGE_COLUMNS; `op` is "upsert" (the row's current
+        values) or "delete". When `reset` is true the client must reload
+        everything with `get_expenses` and continue from `last_seq`.
+        """
+
+    @abstractmethod
+    def compact_change_log(self, before: str) -> int:
+        """Drop superseded entries and entries logged before `before` (UTC); returns rows removed"""
+
+    # Categories
+
+    @abstractmethod
+    def get_categories(self, user_id: int) -> pd.DataFrame:
+        """Built-in categories followed by the user's own (CATEGORY_COLUMNS)"""
+
+    @abstractmethod
+    def add_category(self, user_id: int, name: str, icon: Optional[str] = None, description: str = "") -> bool:
+        """Create a user-defined category; False if the user already has one by that name.
+
+        Expense and budget writes with a name the user does not have yet
+        create the category on the fly.
+        """
+
+    # Categorization
+
+    @abstractmethod
+    def get_category_model(self, user_id: int) -> Tuple[Dict[str, int], pd.DataFrame]:
+        """Training counts of a user's categorizer: expenses per category and (category, feature, count) rows.
+
+        Write methods keep them current; see categorizer.feature_ids.
+        """
+
+    # Amount distribution
+
+    @abstractmethod
+    def get_amount_sketches(self, user_id: int, start_month: Optional[str] = None,
+                            end_month: Optional[str] = None) -> pd.DataFrame:
+        """Amount sketch rows (SKETCH_COLUMNS) for months in [start_month, end_month] ('YYYY-MM').
+
+        Write methods keep one sketch per month, category and currency; see
+        sketches.QuantileSketch.
+        """
+
+    # Budgets
+
+    @abstractmethod
+    def set_budget(self, user_id: int, category: str, amount: float, month: int, year: int,
+                   currency: Optional[str] = None) -> bool:
+        """Set budget for a category"""
+
+    @abstractmethod
+    def set_budgets_bulk(self, user_id: int, rows: List[Tuple]) -> int:
+        """Upsert many budgets in one transaction; rows are (category, month, year, amount, currency)"""
+
+    @abstractmethod
+    def get_budgets(self, user_id: int, month: int, year: int, months: int = 1) -> pd.DataFrame:
+        """Get budgets (category, amount, currency) for a specific month/year.
+
+        With `months` > 1, budgets for that many consecutive months starting
+        there, with month and year columns.
+        """
+
+    @abstractmethod
+    def get_budget_alerts(self, user_id: int, include_dismissed: bool = False, limit: int = 20) -> pd.DataFrame:
+        """Budget threshold crossings (ALERT_COLUMNS) raised by expense and budget writes, newest first"""
+
+    @abstractmethod
+    def dismiss_budget_alerts(self, user_id: int, alert_ids: Optional[List[int]] = None) -> bool:
+        """Mark alerts (all of a user's when `alert_ids` is None) as seen"""
+
+    # Recurring expenses
+
+    @abstractmethod
+    def add_recurring_expense(self, user_id: int, amount: float, category: str, description: str,
+                              frequency: str, start_date: str, interval: int = 1,
+                              cron: Optional[str] = None, end_date: Optional[str] = None,
+                              currency: Optional[str] = None) -> bool:
+        """Create a recurring expense rule"""
+
+    @abstractmethod
+    def get_recurring_expenses(self, user_id: int) -> pd.DataFrame:
+        """Get active recurring expense rules for a user"""
+
+    @abstractmethod
+    def deactivate_recurring_expense(self, rule_id: int, user_id: int) -> bool:
+        """Stop a recurring rule; already materialized expenses are kept"""
+
+    @abstractmethod
+    def get_due_recurring_expenses(self, until: str) -> pd.DataFrame:
+        """Get active rules for all users whose high-water mark is behind `until`.
+
+        The `shard` column names the partition each rule lives in and is
+        passed back to `materialize_recurring`.
+        """
+
+    @abstractmethod
+    def materialize_recurring(self, shard: str, rows: List[Tuple], watermarks: List[Tuple[str, int]]) -> int:
+        """Insert occurrences and advance high-water marks atomically; returns rows inserted"""
+
+    # Archive (backends without an archival tier keep everything hot)
+
+    def archive_expenses(self, before: str, user_id: Optional[int] = None) -> int:
+        """Move expenses dated before `before` out of the hot store; returns rows moved"""
+        return 0
+
+    def get_archive_horizon(self, user_id: int) -> Optional[str]:
+        """First date still in the hot store for a user, or None if nothing is archived"""
+        return None
+
+    def get_archived_rollups(self, user_id: int) -> pd.DataFrame:
+        """Monthly per-category, per-currency totals for a user's archived months"""
+        return pd.DataFrame(columns=['month', 'category', 'currency', 'expense_count', 'total_amount'])
+
+    # Instrumentation
+
+    def get_diagnostics(self, user_id: Optional[int] = None) -> Dict[str, str]:
+        """Backend details for the diagnostics panel"""
+        return {"Backend": self.name}
+
+
+_backend_lock = threading.Lock()
+_memory_backend = None
+
+
+def get_backend(name: Optional[str] = None) -> StorageBackend:
+    """Create the configured storage backend.
+
+    The in-memory backend is a process-wide singleton so its data survives
+    reruns; the SQLite backend is cheap to build and keeps its state on disk.
+    """
+    global _memory_backend
+    name = name or config.BACKEND
+    if name == "sqlite":
+        from database import ExpenseTrackerDB
+        return ExpenseTrackerDB()
+    if name == "memory":
+        with _backend_lock:
+            if _memory_backend is None:
+                from memory_backend import InMemoryBackend
+                _memory_backend = InMemoryBackend()
+            return _memory_backend
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,191 @@
+# backup.py
+"""Online backups and per-user point-in-time restore.
+
+Backups copy every database file with the SQLite backup API a few pages at a
+time, so writers only wait for one step at a time. Files unchanged since the
+previous backup are hard-linked rather than copied. Each backup is a
+directory named by its UTC start time; its manifest is written last, so a
+directory without one is incomplete and is ignored.
+
+A restore reads a user's expenses from the newest backup that finished
+before the requested time and rolls them forward with the append-only
+`expense_audit` log (see ExpenseTrackerDB.restore_user).
+
+Usage: python backup.py backup | list | restore --user ID --at "YYYY-MM-DD HH:MM:SS"
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, List, Optional
+import config
+from daily import once_a_day
+
+MANIFEST = "manifest.json"
+
+# Called with (file name, pages remaining, total pages) after each backup step
+Progress = Callable[[str, int, int], None]
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def backup_root(db) -> str:
+    """Directory holding all backups for a backend's catalog"""
+    return config.BACKUP_DIR or os.path.join(os.path.dirname(os.path.abspath(db.db_path)), "backups")
+
+
+def backup_name(db, path: str) -> str:
+    """Name of a database file inside a backup directory"""
+    if os.path.abspath(path) == os.path.abspath(db.db_path):
+        return os.path.basename(path)
+    return os.path.join("shards", os.path.basename(path))
+
+
+def _file_state(path: str) -> List[float]:
+    """Modification time and size of a database and its WAL, to detect unchanged files"""
+    state = []
+    for candidate in (path, f"{path}-wal"):
+        if os.path.exists(candidate):
+            stat = os.stat(candidate)
+            state += [stat.st_mtime, stat.st_size]
+        else:
+            state += [0, 0]
+    return state
+
+
+def backup_file(source_path: str, target_path: str, pages: Optional[int] = None,
+                progress: Optional[Callable[[int, int, int], None]] = None):
+    """Copy a live database with the backup API in steps of `pages` pages"""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    building = f"{target_path}.building"
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(building)
+    try:
+        source.backup(target, pages=pages or config.BACKUP_PAGES, progress=progress)
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+    os.replace(building, target_path)
+
+
+def list_backups(db) -> List[Dict]:
+    """Manifests of complete backups, oldest first"""
+    root = backup_root(db)
+    if not os.path.isdir(root):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(root)):
+        manifest_path = os.path.join(root, name, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            manifest["path"] = os.path.join(root, name)
+            manifests.append(manifest)
+    return manifests
+
+
+def run_backup(db, progress: Optional[Progress] = None) -> Dict:
+    """Back up the catalog and every shard; returns the new backup's manifest"""
+    previous = (list_backups(db) or [None])[-1]
+    started_at = _utc_now()
+    directory = os.path.join(backup_root(db), started_at.replace("-", "").replace(":", "").replace(" ", "T"))
+    files = {}
+    for path in db.router.shard_paths():
+        name = backup_name(db, path)
+        target = os.path.join(directory, name)
+        state = _file_state(path)
+        earlier = previous["files"].get(name) if previous else None
+        if earlier and earlier["state"] == state:
+            # Unchanged since the last backup: share its copy
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            source = os.path.join(previous["path"], name)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+            files[name] = {"state": state, "copied": False}
+            continue
+        step = (lambda status, remaining, total, name=name: progress(name, remaining, total)) if progress else None
+        backup_file(path, target, progress=step)
+        files[name] = {"state": state, "copied": True}
+
+    manifest = {"started_at": started_at, "finished_at": _utc_now(), "files": files}
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    prune_backups(db)
+    manifest["path"] = directory
+    return manifest
+
+
+def prune_backups(db, keep: Optional[int] = None) -> int:
+    """Delete all but the newest `keep` backups (and any incomplete ones); returns backups removed"""
+    keep = config.BACKUP_KEEP if keep is None else keep
+    root = backup_root(db)
+    complete = {os.path.basename(m["path"]) for m in list_backups(db)}
+    newest = sorted(complete)[-keep:] if keep > 0 else []
+    removed = 0
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        # Leave a backup that is still being written alone
+        if name in newest or (name not in complete and name >= max(complete, default="")):
+            continue
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def restore_user(db, user_id: int, at: str) -> Dict[str, int]:
+    """Restore a user's expenses to their state at `at` (UTC, 'YYYY-MM-DD HH:MM:SS')"""
+    name = backup_name(db, db.router.path_for_user(user_id))
+    candidates = [m for m in list_backups(db) if m["finished_at"] <= at and name in m["files"]]
+    if not candidates:
+        raise ValueError(f"No backup of {name} finished before {at}")
+    chosen = candidates[-1]
+    return db.restore_user(user_id, os.path.join(chosen["path"], name), chosen["started_at"], at)
+
+
+def run_backup_if_due(db) -> bool:
+    """Start a background backup at most once per day per process; returns True if one started"""
+    if config.BACKUP_KEEP <= 0 or db.name != "sqlite":
+        return False
+    return _start_daily_backup(db)
+
+
+@once_a_day(skipped=False)
+def _start_daily_backup(db, today: date) -> bool:
+    # Runs off the request thread; the paged copy lets writers continue meanwhile
+    threading.Thread(target=run_backup, args=(db,), name="daily-backup", daemon=True).start()
+    return True
+
+
+if __name__ == "__main__":
+    from database import ExpenseTrackerDB
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backup", help="Back up the catalog and all shards now")
+    commands.add_parser("list", help="List complete backups")
+    restore = commands.add_parser("restore", help="Restore one user's expenses to a point in time")
+    restore.add_argument("--user", type=int, required=True, help="User id")
+    restore.add_argument("--at", required=True, help="UTC time, e.g. '2025-01-31 18:00:00'")
+    args = parser.parse_args()
+
+    db = ExpenseTrackerDB()
+    if args.command == "backup":
+        def report(name: str, remaining: int, total: int):
+            print(f"\r{name}: {total - remaining}/{total} pages", end="" if remaining else "\n")
+        manifest = run_backup(db, progress=report)
+        copied = sum(1 for f in manifest["files"].values() if f["copied"])
+        print(f"Backup {manifest['path']}: {copied} files copied, {len(manifest['files']) - copied} unchanged")
+    elif args.command == "list":
+        for manifest in list_backups(db):
+            print(f"{manifest['started_at']}  ->  {manifest['finished_at']}  {len(manifest['files'])} files")
+    else:
+        counts = restore_user(db, args.user, args.at)
+        print(f"Restored user {args.user} to {args.at}: {counts['inserted']} inserted, "
+              f"{counts['updated']} updated, {counts['deleted']} deleted")
@@ -0,0 +1,98 @@
+# benchmark.py
+"""Split dashboard/budget page latency into storage, pandas and Plotly time.
+
+Usage: python benchmark.py [--backend sqlite|memory|both] [--users N] [--expenses N] [--repeat N]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+from analytics import ExpenseAnalytics
+from backend import StorageBackend
+from categories import DEFAULT_CATEGORY_NAMES
+
+CATEGORIES = DEFAULT_CATEGORY_NAMES
+
+
+def make_backend(name: str) -> StorageBackend:
+    """Build a fresh, empty backend instance"""
+    if name == "memory":
+        from memory_backend import InMemoryBackend
+        return InMemoryBackend()
+    from database import ExpenseTrackerDB
+    from storage import StorageRouter
+    path = os.path.join(tempfile.mkdtemp(prefix="daily_budget_bench_"), "bench.db")
+    return ExpenseTrackerDB(router=StorageRouter(db_path=path, shard_mode="none"))
+
+
+def seed(db: StorageBackend, users: int, expenses: int, rng: random.Random) -> List[int]:
+    """Create users with random expense histories and a budget per category"""
+    today = date.today()
+    user_ids = []
+    for i in range(users):
+        db.create_user(f"bench{i}", f"bench{i}@example.com", "benchmark")
+        user_id = db.authenticate_user(f"bench{i}", "benchmark")['id']
+        user_ids.append(user_id)
+        for _ in range(expenses):
+            day = today - timedelta(days=rng.randint(0, 730))
+            db.add_expense(user_id, round(rng.uniform(10, 2000), 2), rng.choice(CATEGORIES),
+                           "benchmark expense", day.isoformat())
+        for category in CATEGORIES:
+            db.set_budget(user_id, category, 5000, today.month, today.year)
+    return user_ids
+
+
+def timed(samples: Dict[str, List[float]], phase: str, func: Callable):
+    start = time.perf_counter()
+    result = func()
+    samples.setdefault(phase, []).append((time.perf_counter() - start) * 1000)
+    return result
+
+
+def run_page_cycle(db: StorageBackend, user_id: int, samples: Dict[str, List[float]]):
+    """One dashboard + budget render, timing each layer separately"""
+    today = date.today()
+    expenses_df = timed(samples, "storage", lambda: db.get_expenses(user_id))
+    timed(samples, "storage", lambda: db.get_budgets(user_id, today.month, today.year))
+    analytics = timed(samples, "pandas", lambda: ExpenseAnalytics(expenses_df))
+    timed(samples, "pandas", lambda: (analytics.get_category_spending(),
+                                      analytics.get_monthly_spending(),
+                                      analytics.get_daily_spending()))
+    timed(samples, "plotly", lambda: (analytics.create_category_pie_chart(),
+                                      analytics.create_monthly_bar_chart(),
+                                      analytics.create_daily_line_chart()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["sqlite", "memory", "both"], default="both")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--expenses", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    backends = ["sqlite", "memory"] if args.backend == "both" else [args.backend]
+    for name in backends:
+        db = make_backend(name)
+        user_ids = seed(db, args.users, args.expenses, random.Random(42))
+        samples: Dict[str, List[float]] = {}
+        for _ in range(args.repeat):
+            for user_id in user_ids:
+                cycle: Dict[str, List[float]] = {}
+                run_page_cycle(db, user_id, cycle)
+                for phase, values in cycle.items():
+                    samples.setdefault(phase, []).append(sum(values))
+
+        total = sum(statistics.mean(values) for values in samples.values())
+        print(f"\n{name} backend — {args.users} users × {args.expenses} expenses, {args.repeat} rounds")
+        for phase in ("storage", "pandas", "plotly"):
+            mean = statistics.mean(samples[phase])
+            print(f"  {phase:<8} {mean:8.2f} ms/page  ({mean / total * 100:5.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
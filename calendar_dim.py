@@ -0,0 +1,107 @@
+# calendar_dim.py
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Optional, Union
+import config
+
+# Calendar rows are built once per process for a padded day range and grown
+# only when data falls outside it
+_calendar_lock = threading.Lock()
+_calendar: Optional[pd.DataFrame] = None
+_PAD_DAYS = 366
+
+
+def to_day(value: Union[str, date, pd.Timestamp]) -> int:
+    """Integer day number (days since 1970-01-01) for a single date"""
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
+
+
+def day_numbers(dates) -> np.ndarray:
+    """Integer day numbers for a column of ISO date strings or datetimes"""
+    values = np.asarray(dates)
+    if values.dtype.kind != 'M':
+        try:
+            # Plain 'YYYY-MM-DD' strings parse in C without Timestamp objects
+            values = values.astype('datetime64[D]')
+        except ValueError:
+            values = pd.to_datetime(pd.Series(values)).to_numpy()
+    return values.astype('datetime64[D]').astype(np.int64)
+
+
+def _build(first_day: int, last_day: int) -> pd.DataFrame:
+    """Calendar attributes for every day in [first_day, last_day]"""
+    days = np.arange(first_day, last_day + 1, dtype=np.int64)
+    dates = pd.DatetimeIndex(days.astype('datetime64[D]'))
+    iso = dates.isocalendar()
+    fiscal_start = config.FISCAL_YEAR_START_MONTH
+    fiscal_offset = (dates.month.to_numpy() - fiscal_start) % 12
+    fiscal_year = dates.year.to_numpy() + (dates.month.to_numpy() >= fiscal_start) - (fiscal_start > 1)
+    return pd.DataFrame({
+        'day': days,
+        'year': dates.year.to_numpy(),
+        'month': dates.month.to_numpy(),
+        'month_index': dates.year.to_numpy() * 12 + dates.month.to_numpy() - 1,
+        'month_key': dates.strftime('%Y-%m'),
+        'iso_year': iso['year'].to_numpy(),
+        'iso_week': iso['week'].to_numpy(),
+        'week_key': dates.to_period('W').astype(str),
+        'day_of_week': dates.dayofweek.to_numpy(),
+        'fiscal_year': fiscal_year,
+        'fiscal_quarter': fiscal_offset // 3 + 1,
+        'fiscal_period': fiscal_offset + 1,
+    })
+
+
+def get_calendar(first_day: int, last_day: int) -> pd.DataFrame:
+    """Calendar dimension covering at least [first_day, last_day], one row per day"""
+    global _calendar
+    current = _calendar
+    if current is not None and current['day'].iat[0] <= first_day and current['day'].iat[-1] >= last_day:
+        return current
+    with _calendar_lock:
+        current = _calendar
+        if current is not None:
+            first_day = min(first_day, int(current['day'].iat[0]))
+            last_day = max(last_day, int(current['day'].iat[-1]))
+        _calendar = _build(first_day - _PAD_DAYS, last_day + _PAD_DAYS)
+        return _calendar
+
+
+def attach_calendar(df: pd.DataFrame, columns=('month_key', 'week_key', 'month_index'),
+                    date_column: str = 'date') -> pd.DataFrame:
+    """Add an integer `day` column plus calendar attributes, joined by day number.
+
+    The join is a positional take into the calendar arrays, so no per-row
+    date objects are created.
+    """
+    df = df.copy()
+    days = day_numbers(df[date_column]) if len(df) else np.empty(0, dtype=np.int64)
+    df['day'] = days
+    if len(df):
+        calendar = get_calendar(int(days.min()), int(days.max()))
+        positions = days - calendar['day'].iat[0]
+        for column in columns:
+            df[column] = calendar[column].to_numpy()[positions]
+    else:
+        for column in columns:
+            df[column] = pd.Series(dtype='int64' if column.endswith('index') else object)
+    return df
+
+
+def filter_day_range(df: pd.DataFrame, start: Union[str, date], end: Union[str, date]) -> pd.DataFrame:
+    """Rows whose `day` falls in [start, end], using searchsorted when already sorted by day"""
+    start_day, end_day = to_day(start), to_day(end)
+    days = df['day'].to_numpy()
+    if len(days) and np.all(days[:-1] <= days[1:]):
+        lo = np.searchsorted(days, start_day, side='left')
+        hi = np.searchsorted(days, end_day, side='right')
+        return df.iloc[lo:hi]
+    if len(days) and np.all(days[:-1] >= days[1:]):
+        # Newest-first frames, as returned by get_expenses
+        reversed_days = days[::-1]
+        lo = len(days) - np.searchsorted(reversed_days, end_day, side='right')
+        hi = len(days) - np.searchsorted(reversed_days, start_day, side='left')
+        return df.iloc[lo:hi]
+    return df[(days >= start_day) & (days <= end_day)]
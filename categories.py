@@ -0,0 +1,27 @@
+# categories.py
+# Built-in categories as (name, icon, description); a category's id is its
+# position here plus one, so the order must never change (append only)
+DEFAULT_CATEGORIES = [
+    ("Food & Dining", "fas fa-utensils", "Restaurants, groceries, beverages"),
+    ("Transportation", "fas fa-car", "Gas, public transport, parking"),
+    ("Housing", "fas fa-home", "Rent, utilities, maintenance"),
+    ("Shopping", "fas fa-shopping-bag", "Clothing, electronics, general purchases"),
+    ("Healthcare", "fas fa-heartbeat", "Medical bills, pharmacy, insurance"),
+    ("Entertainment", "fas fa-film", "Movies, games, subscriptions"),
+    ("Education", "fas fa-graduation-cap", "Books, courses, tuition"),
+    ("Business", "fas fa-briefcase", "Office supplies, professional services"),
+    ("Travel", "fas fa-plane", "Flights, hotels, vacation expenses"),
+    ("Utilities", "fas fa-bolt", "Electricity, water, internet, phone"),
+    ("Clothing", "fas fa-tshirt", "Apparel, shoes, accessories"),
+    ("Gifts", "fas fa-gift", "Presents, donations, charity"),
+    ("Other", "fas fa-ellipsis-h", "Miscellaneous expenses"),
+]
+DEFAULT_CATEGORY_NAMES = [name for name, _, _ in DEFAULT_CATEGORIES]
+
+# Icon for user-defined categories, and for names first seen on an imported
+# or API-submitted expense
+CUSTOM_CATEGORY_ICON = "fas fa-tag"
+MAX_CATEGORY_NAME_LENGTH = 40
+
+# Columns returned by get_categories
+CATEGORY_COLUMNS = ['id', 'name', 'icon', 'description', 'custom']
@@ -0,0 +1,110 @@
+# categorizer.py
+import re
+import zlib
+import numpy as np
+import pandas as pd
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from backend import StorageBackend
+from lru import LRUCache
+
+# Hashed feature space; the stored counts are sparse, only the cached
+# inference matrix is dense (categories x N_FEATURES float32)
+N_FEATURES = 1 << 12
+# Additive (Laplace) smoothing
+ALPHA = 0.5
+# Minimum probability before the Add Expense page offers a category
+SUGGEST_MIN_CONFIDENCE = 0.4
+
+_WORD = re.compile(r"[a-z]+|\d+")
+
+
+@lru_cache(maxsize=65536)
+def feature_ids(description: str) -> Tuple[int, ...]:
+    """Hashed unigram and bigram features of a description.
+
+    CRC32 rather than hash() so ids are stable across processes, since the
+    counts are persisted.
+    """
+    words = [w for w in _WORD.findall(str(description or "").lower()) if len(w) > 1 or w.isdigit()]
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return tuple(zlib.crc32(token.encode()) & (N_FEATURES - 1) for token in tokens)
+
+
+def feature_counts(description: str) -> Counter:
+    return Counter(feature_ids(description))
+
+
+class CategoryModel:
+    """Multinomial naive Bayes over hashed description features"""
+
+    def __init__(self, categories: List[str], docs: np.ndarray, counts: np.ndarray):
+        self.categories = np.asarray(categories, dtype=object)
+        self.docs = docs
+        token_totals = counts.sum(axis=1, keepdims=True)
+        self.log_prior = np.log(docs / docs.sum()).astype(np.float32)
+        self.log_likelihood = np.log((counts + ALPHA) / (token_totals + ALPHA * N_FEATURES)).astype(np.float32)
+
+    @classmethod
+    def from_counts(cls, docs: Dict[str, int], features: pd.DataFrame) -> Optional["CategoryModel"]:
+        """Build from per-category document counts and (category, feature, count) rows"""
+        categories = sorted(category for category, n in docs.items() if n > 0)
+        if not categories:
+            return None
+        positions = {category: i for i, category in enumerate(categories)}
+        counts = np.zeros((len(categories), N_FEATURES), dtype=np.float64)
+        if not features.empty:
+            features = features[features['category'].isin(positions)]
+            rows = features['category'].map(positions).to_numpy(dtype=np.int64)
+            np.add.at(counts, (rows, features['feature'].to_numpy(dtype=np.int64)),
+                      features['count'].to_numpy(dtype=np.float64))
+        return cls(categories, np.array([docs[c] for c in categories], dtype=np.float64), counts)
+
+    def predict(self, descriptions) -> Tuple[np.ndarray, np.ndarray]:
+        """Most likely category and its probability for each description.
+
+        Repeated descriptions are factorized first, so each distinct text is
+        tokenized once; scoring is a single scatter-add over all features.
+        """
+        codes, uniques = pd.factorize(pd.Series(descriptions, dtype=object).fillna(""))
+        doc_ids, features = [], []
+        for i, text in enumerate(uniques):
+            ids = feature_ids(text)
+            doc_ids.extend([i] * len(ids))
+            features.extend(ids)
+        scores = np.tile(self.log_prior, (len(uniques), 1))
+        if features:
+            np.add.at(scores, np.asarray(doc_ids), self.log_likelihood[:, np.asarray(features)].T)
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(uniques)), best]
+        return self.categories[best][codes], confidence[codes]
+
+    def predict_one(self, description: str) -> Tuple[Optional[str], float]:
+        """Category and probability for one description; None when it has no known words"""
+        if not feature_ids(description):
+            return None, 0.0
+        categories, confidence = self.predict([description])
+        return categories[0], float(confidence[0])
+
+
+# Inference models keyed by (user, data version); any expense write bumps the
+# version, so a cached model never outlives the counts it was built from
+_models = LRUCache(64)
+# Cached None (no categorized expenses yet) differs from a missing entry
+_MISSING = object()
+
+
+def get_model(db: StorageBackend, user_id: int) -> Optional[CategoryModel]:
+    """A user's categorizer, or None before they have any categorized expenses"""
+    key = (user_id, db.get_user_stats(user_id)['version'])
+    model = _models.get(key, _MISSING)
+    if model is not _MISSING:
+        return model
+    docs, features = db.get_category_model(user_id)
+    model = CategoryModel.from_counts(docs, features)
+    _models.put(key, model)
+    return model
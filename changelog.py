@@ -0,0 +1,40 @@
+# changelog.py
+"""Change-log compaction for delta sync.
+
+Every expense insert, update and delete is logged with a per-user sequence
+number, and clients mirror a user's data with `get_changes_since`. Only the
+latest entry per expense is needed, and entries older than the retention
+window are dropped; clients that fall further behind are told to reload.
+
+Usage: python changelog.py [--retention DAYS]
+"""
+import argparse
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+import config
+from backend import StorageBackend
+from daily import once_a_day
+
+
+def compaction_cutoff(retention_days: Optional[int] = None, now: Optional[datetime] = None) -> str:
+    """UTC timestamp before which change entries are dropped"""
+    retention_days = config.CHANGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=retention_days)
+    return cutoff.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@once_a_day()
+def run_compaction_if_due(db: StorageBackend, today: date) -> int:
+    """Compact the change log"""
+    return db.compact_change_log(compaction_cutoff())
+
+
+if __name__ == "__main__":
+    from backend import get_backend
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--retention", type=int, default=None,
+                        help="Days of change history to keep (default from config)")
+    args = parser.parse_args()
+    cutoff = compaction_cutoff(args.retention)
+    print(f"Removed {get_backend().compact_change_log(cutoff)} change-log entries (cutoff {cutoff} UTC)")
@@ -0,0 +1,91 @@
+# config.py
+import os
+
+# Storage backend: "sqlite" (default) or "memory" for disk-free runs and benchmarks
+BACKEND = os.environ.get("DAILY_BUDGET_BACKEND", "sqlite")
+
+# Catalog database (users, and all data when sharding is off). Relative paths
+# resolve against the project directory rather than the working directory.
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(_PROJECT_DIR, os.environ.get("DAILY_BUDGET_DB_PATH", "expense_tracker.db"))
+
+# Per-user storage: "none" keeps everything in DB_PATH, "hash" spreads users
+# over SHARD_COUNT files by user-id hash, "tenant" gives each user a file
+SHARD_MODE = os.environ.get("DAILY_BUDGET_SHARD_MODE", "none")
+SHARD_COUNT = int(os.environ.get("DAILY_BUDGET_SHARD_COUNT", "4"))
+SHARD_DIR = os.environ.get("DAILY_BUDGET_SHARD_DIR")
+
+# How analytics reads reach the database: "primary" shares the read/write
+# connection path, "ro" opens the same file read-only, and "snapshot" reads
+# from a periodically rebuilt copy of the database
+READ_MODE = os.environ.get("DAILY_BUDGET_READ_MODE", "ro")
+
+# Maximum age in seconds of the read snapshot before it is rebuilt
+SNAPSHOT_MAX_STALENESS = float(os.environ.get("DAILY_BUDGET_SNAPSHOT_MAX_STALENESS", "30"))
+
+# First month of the fiscal year used by the calendar dimension (April for
+# the Indian financial year)
+FISCAL_YEAR_START_MONTH = int(os.environ.get("DAILY_BUDGET_FISCAL_YEAR_START_MONTH", "4"))
+
+# Default currency for new expenses and budgets, and the initial display currency
+BASE_CURRENCY = os.environ.get("DAILY_BUDGET_BASE_CURRENCY", "INR")
+
+# CSV of exchange rates (currency,rate: value of one unit in the reference
+# currency). Edits to the file are picked up without a restart.
+FX_RATES_PATH = os.path.join(_PROJECT_DIR, os.environ.get("DAILY_BUDGET_FX_RATES_PATH", "exchange_rates.csv"))
+
+# Expenses older than this many days move to the compressed archive (whole
+# months at a time); 0 disables archiving. Archive blocks default to an
+# archive/ directory next to the catalog.
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("DAILY_BUDGET_ARCHIVE_HORIZON_DAYS", "730"))
+ARCHIVE_DIR = os.environ.get("DAILY_BUDGET_ARCHIVE_DIR")
+
+# Large per-session objects (e.g. anomaly detectors) share this budget across
+# all sessions; least recently used ones are spilled to SESSION_SPILL_DIR
+# (default: the system temp directory; each process spills into a private
+# subdirectory; set it to an empty string to drop instead) and
+# sessions idle for SESSION_IDLE_SECONDS are released
+SESSION_MEMORY_BUDGET_MB = float(os.environ.get("DAILY_BUDGET_SESSION_MEMORY_BUDGET_MB", "256"))
+SESSION_SPILL_DIR = os.environ.get("DAILY_BUDGET_SESSION_SPILL_DIR")
+SESSION_IDLE_SECONDS = float(os.environ.get("DAILY_BUDGET_SESSION_IDLE_SECONDS", "1800"))
+
+# Local REST API (python api.py). Tokens issued at POST /api/token expire
+# after API_TOKEN_TTL_HOURS; expense listings are paginated.
+API_HOST = os.environ.get("DAILY_BUDGET_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("DAILY_BUDGET_API_PORT", "8502"))
+API_TOKEN_TTL_HOURS = int(os.environ.get("DAILY_BUDGET_API_TOKEN_TTL_HOURS", "720"))
+API_PAGE_SIZE = int(os.environ.get("DAILY_BUDGET_API_PAGE_SIZE", "100"))
+API_MAX_PAGE_SIZE = int(os.environ.get("DAILY_BUDGET_API_MAX_PAGE_SIZE", "1000"))
+
+# Change-log entries used for delta sync are kept this long; clients that have
+# not synced within the window are told to reload everything
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get("DAILY_BUDGET_CHANGE_LOG_RETENTION_DAYS", "90"))
+
+# Online backups (python backup.py, and once a day from the app). BACKUP_DIR
+# defaults to backups/ next to the catalog; BACKUP_KEEP of 0 disables the
+# daily backup. BACKUP_PAGES is how many pages each backup step copies.
+BACKUP_DIR = os.environ.get("DAILY_BUDGET_BACKUP_DIR")
+BACKUP_KEEP = int(os.environ.get("DAILY_BUDGET_BACKUP_KEEP", "7"))
+BACKUP_PAGES = int(os.environ.get("DAILY_BUDGET_BACKUP_PAGES", "256"))
+
+# Budget usage percentages that raise a sidebar alert when an expense write
+# (or a budget change) pushes a category's monthly spend across them
+BUDGET_ALERT_THRESHOLDS = tuple(sorted(
+    int(value) for value in os.environ.get("DAILY_BUDGET_BUDGET_ALERT_THRESHOLDS", "80,100").split(",") if value.strip()))
+
+# SQLite statements slower than SLOW_QUERY_MS are written to SLOW_QUERY_LOG
+# (default: slow_queries.log next to the catalog; an empty string keeps only
+# the in-process counts), rotated at SLOW_QUERY_LOG_BYTES with
+# SLOW_QUERY_LOG_KEEP old files kept. Read calls are interrupted once they run
+# longer than QUERY_TIME_BUDGET_MS (0 disables).
+SLOW_QUERY_MS = float(os.environ.get("DAILY_BUDGET_SLOW_QUERY_MS", "250"))
+SLOW_QUERY_LOG = os.environ.get("DAILY_BUDGET_SLOW_QUERY_LOG")
+SLOW_QUERY_LOG_BYTES = int(os.environ.get("DAILY_BUDGET_SLOW_QUERY_LOG_BYTES", str(1024 * 1024)))
+SLOW_QUERY_LOG_KEEP = int(os.environ.get("DAILY_BUDGET_SLOW_QUERY_LOG_KEEP", "3"))
+QUERY_TIME_BUDGET_MS = float(os.environ.get("DAILY_BUDGET_QUERY_TIME_BUDGET_MS", "15000"))
+
+# Background prefetch of page data after login and ahead of likely navigation:
+# at most PREFETCH_WORKERS run at once (0 disables) and PREFETCH_MAX_PENDING
+# may be queued or running across all sessions; more are skipped
+PREFETCH_WORKERS = int(os.environ.get("DAILY_BUDGET_PREFETCH_WORKERS", "2"))
+PREFETCH_MAX_PENDING = int(os.environ.get("DAILY_BUDGET_PREFETCH_MAX_PENDING", "16"))
@@ -0,0 +1,157 @@
+# currency.py
+import hashlib
+import io
+import os
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+import config
+from lru import LRUCache
+
+SYMBOLS = {
+    "INR": "₹", "USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥",
+    "AUD": "A$", "CAD": "C$", "SGD": "S$", "AED": "AED ",
+}
+
+
+def symbol(currency: str) -> str:
+    """Display prefix for a currency code"""
+    return SYMBOLS.get(currency, f"{currency} ")
+
+
+def format_amount(amount: float, currency: str, decimals: int = 2, grouped: bool = True) -> str:
+    """Format a single amount with its currency symbol"""
+    return f"{symbol(currency)}{amount:{',' if grouped else ''}.{decimals}f}"
+
+
+class RateTable:
+    """Exchange rates as sorted arrays, so a column converts with one lookup.
+
+    Each rate is the value of one unit in the file's reference currency; the
+    version is a hash of the file content and keys every cached conversion.
+    """
+
+    def __init__(self, currencies: List[str], rates: List[float], version: str):
+        order = np.argsort(currencies)
+        self.codes = np.asarray(currencies, dtype=str)[order]
+        self.rates = np.asarray(rates, dtype=np.float64)[order]
+        self.version = version
+
+    @classmethod
+    def load(cls, path: str) -> "RateTable":
+        """Read a currency,rate CSV"""
+        with open(path, 'rb') as f:
+            content = f.read()
+        df = pd.read_csv(io.BytesIO(content))
+        return cls(df['currency'].str.strip().str.upper().tolist(),
+                   df['rate'].astype(float).tolist(),
+                   hashlib.sha1(content).hexdigest()[:12])
+
+    def currencies(self) -> List[str]:
+        return self.codes.tolist()
+
+    def _lookup(self, currencies: np.ndarray) -> np.ndarray:
+        """Rate for each code, NaN for codes missing from the table"""
+        positions = np.minimum(np.searchsorted(self.codes, currencies), len(self.codes) - 1)
+        return np.where(self.codes[positions] == currencies, self.rates[positions], np.nan)
+
+    def factors(self, currencies, base: str) -> np.ndarray:
+        """Multiplier taking each entry of `currencies` into `base`.
+
+        Codes are factorized first, so the table is searched once per distinct
+        currency rather than once per row. Unknown currencies get a factor of
+        1.0 (left unconverted) and are reported by `missing`.
+        """
+        codes, uniques = pd.factorize(np.asarray(currencies, dtype=object))
+        unique_factors = self._lookup(np.asarray(uniques, dtype=str)) / self.rate(base)
+        unique_factors = np.where(np.isnan(unique_factors), 1.0, unique_factors)
+        return unique_factors[codes] if len(codes) else np.empty(0)
+
+    def rate(self, currency: str) -> float:
+        rate = self._lookup(np.asarray([currency], dtype=str))[0]
+        return 1.0 if np.isnan(rate) else float(rate)
+
+    def missing(self, currencies) -> List[str]:
+        """Currencies with no rate in the table"""
+        uniques = pd.unique(np.asarray(currencies, dtype=object)).astype(str)
+        return sorted(uniques[np.isnan(self._lookup(uniques))].tolist())
+
+
+_rates_lock = threading.Lock()
+_rates: Optional[RateTable] = None
+_rates_mtime: Optional[float] = None
+
+
+def get_rates(path: Optional[str] = None) -> RateTable:
+    """Current rate table, reloaded when the rate file changes on disk"""
+    global _rates, _rates_mtime
+    path = path or config.FX_RATES_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _rates_lock:
+        if _rates is None or mtime != _rates_mtime:
+            if mtime is None:
+                _rates = RateTable([config.BASE_CURRENCY], [1.0], "builtin")
+            else:
+                _rates = RateTable.load(path)
+            _rates_mtime = mtime
+        return _rates
+
+
+def available_currencies() -> List[str]:
+    """Currencies that can be chosen in forms, base currency first"""
+    currencies = get_rates().currencies()
+    return [config.BASE_CURRENCY] + [c for c in currencies if c != config.BASE_CURRENCY]
+
+
+def session_currency(session_state) -> str:
+    """Display currency chosen for this session"""
+    return session_state.get('base_currency', config.BASE_CURRENCY)
+
+
+def convert_frame(df: pd.DataFrame, base: str, column: str = 'amount') -> pd.DataFrame:
+    """Copy of `df` with `column` converted into `base`.
+
+    The original values are kept in `original_<column>`; rows without a
+    currency column are treated as the configured base currency.
+    """
+    df = df.copy()
+    if df.empty:
+        df[f'original_{column}'] = df.get(column, pd.Series(dtype=float))
+        return df
+    if 'currency' not in df.columns:
+        df['currency'] = config.BASE_CURRENCY
+    df[f'original_{column}'] = df[column]
+    df[column] = df[column].to_numpy(dtype=np.float64) * get_rates().factors(df['currency'], base)
+    return df
+
+
+# Converted aggregates keyed by (user, base currency, rate version, data version)
+_stats_cache = LRUCache(4096)
+
+
+def converted_stats(stats: Dict, user_id: int, base: str) -> Dict:
+    """Total and per-category spend from `get_user_stats` in `base` currency.
+
+    The stats carry a (category, currency, total) breakdown, so conversion
+    touches a handful of rows and the result is cached until either the
+    user's data or the rate file changes.
+    """
+    rates = get_rates()
+    key = (user_id, base, rates.version, stats['version'])
+    cached = _stats_cache.get(key)
+    if cached is not None:
+        return cached
+
+    breakdown = pd.DataFrame(stats['breakdown'], columns=['category', 'currency', 'amount'])
+    breakdown['amount'] = breakdown['amount'].astype(float) * rates.factors(breakdown['currency'], base)
+    result = dict(stats)
+    result['total'] = float(breakdown['amount'].sum())
+    result['categories'] = breakdown.groupby('category')['amount'].sum().to_dict()
+    result['currency'] = base
+
+    _stats_cache.put(key, result)
+    return result
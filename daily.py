@@ -0,0 +1,32 @@
+# daily.py
+import functools
+import threading
+from datetime import date
+from typing import Any, Callable, Optional
+
+
+def once_a_day(skipped: Any = 0):
+    """Run the decorated job(db, today) at most once per day per process.
+
+    Calls on a day the job already ran return `skipped` at once; concurrent
+    first calls wait for the one running it. A job that raises is retried
+    on the next call.
+    """
+    def decorator(job: Callable[[Any, date], Any]):
+        lock = threading.Lock()
+        last_run: Optional[date] = None
+
+        @functools.wraps(job)
+        def run(db):
+            nonlocal last_run
+            today = date.today()
+            if last_run == today:
+                return skipped
+            with lock:
+                if last_run == today:
+                    return skipped
+                result = job(db, today)
+                last_run = today
+                return result
+        return run
+    return decorator
@@ -1,20 +1,185 @@
 # database.py
+import os
+import secrets
 import sqlite3
+import threading
+import time
+import numpy as np
 import pandas as pd
-import hashlib
-from typing import Dict, Optional
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import config
+import querylog
+from archive import ExpenseArchive, monthly_rollup
+from backend import CHANGE_COLUMNS, StorageBackend
+from calendar_dim import to_day
+from alerts import ALERT_COLUMNS, crossed_thresholds, month_of, usage
+from categories import CATEGORY_COLUMNS, CUSTOM_CATEGORY_ICON, DEFAULT_CATEGORIES
+from categorizer import feature_counts, feature_ids
+from currency import get_rates
+from sketches import SKETCH_COLUMNS, bucket_ids, bucket_of
+from storage import StorageRouter
 
-class ExpenseTrackerDB:
+READ_MODES = ("primary", "ro", "snapshot")
+
+# Snapshot and schema bookkeeping is shared by every ExpenseTrackerDB instance
+# in the process, since the app creates a new instance on each rerun
+_snapshot_lock = threading.Lock()
+_snapshot_built_at: Dict[str, float] = {}
+_schema_ready = set()
+
+
+# Row layouts of the tables keyed by category id; also used to rebuild older
+# text-keyed tables during migration
+EXPENSES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        category_id INTEGER NOT NULL,
+        description TEXT,
+        day INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        currency TEXT NOT NULL DEFAULT '{currency}',
+        recurring_id INTEGER,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+'''.replace('{currency}', config.BASE_CURRENCY)
+BUDGETS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        month INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        currency TEXT NOT NULL DEFAULT '{currency}',
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id),
+        UNIQUE(user_id, category_id, month, year)
+    )
+'''.replace('{currency}', config.BASE_CURRENCY)
+
+
+def snapshot_path_for(path: str) -> str:
+    """Location of the read snapshot for a database file"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.snapshot{ext or '.db'}"
+
+
+class ExpenseTrackerDB(StorageBackend):
     """Database management class for expense tracker"""
 
-    def __init__(self):
+    name = "sqlite"
+
+    def __init__(self, read_mode: Optional[str] = None, snapshot_max_staleness: Optional[float] = None,
+                 router: Optional[StorageRouter] = None):
+        self.router = router or StorageRouter()
+        self.read_mode = read_mode or config.READ_MODE
+        if self.read_mode not in READ_MODES:
+            raise ValueError(f"Unknown read mode: {self.read_mode}")
+        self.snapshot_max_staleness = (config.SNAPSHOT_MAX_STALENESS if snapshot_max_staleness is None
+                                       else snapshot_max_staleness)
+        self.archive = ExpenseArchive(config.ARCHIVE_DIR or os.path.join(
+            os.path.dirname(self.db_path), "archive"))
         self.init_database()
 
+    @property
+    def db_path(self) -> str:
+        """Path of the catalog database"""
+        return self.router.db_path
+
+    def _path(self, user_id: Optional[int]) -> str:
+        return self.db_path if user_id is None else self.router.path_for_user(user_id)
+
+    def _connect(self, user_id: Optional[int] = None, budget_ms: Optional[float] = None) -> sqlite3.Connection:
+        """Open a read/write connection to the catalog, or to a user's shard.
+
+        Statements are timed into the slow-query log; with `budget_ms` the
+        running statement is interrupted (QueryTimeout) once the connection
+        has been open that long.
+        """
+        path = self._path(user_id)
+        self.ensure_schema(path)
+        return querylog.connect(path, budget_ms)
+
+    def _connect_read(self, user_id: Optional[int] = None) -> sqlite3.Connection:
+        """Open a connection for analytics reads, honouring the configured read mode.
+
+        "ro" opens the primary file read-only, so with WAL journaling readers
+        never wait on writers. "snapshot" reads from a copy built with the
+        backup API and rebuilt once it is older than the staleness limit.
+        Reads get the QUERY_TIME_BUDGET_MS time budget.
+        """
+        if self.read_mode == "primary":
+            return self._connect(user_id, config.QUERY_TIME_BUDGET_MS)
+        path = self._path(user_id)
+        self.ensure_schema(path)
+        if self.read_mode == "snapshot":
+            path = self._refresh_snapshot(path)
+        return querylog.connect(f"file:{path}?mode=ro", config.QUERY_TIME_BUDGET_MS, uri=True)
+
+    def _refresh_snapshot(self, path: str, force: bool = False) -> str:
+        """Rebuild a file's read snapshot if it is missing or stale; returns its path"""
+        snapshot = snapshot_path_for(path)
+        with _snapshot_lock:
+            built_at = _snapshot_built_at.get(snapshot)
+            if built_at is None and os.path.exists(snapshot):
+                built_at = os.path.getmtime(snapshot)
+            if force or built_at is None or time.time() - built_at > self.snapshot_max_staleness:
+                # Copy into a temporary file and swap it in, so open readers keep a consistent view
+                building = f"{snapshot}.building"
+                source = sqlite3.connect(path)
+                target = sqlite3.connect(building)
+                try:
+                    started = time.time()
+                    source.backup(target, pages=1024)
+                    target.execute("PRAGMA journal_mode=DELETE")
+                finally:
+                    target.close()
+                    source.close()
+                os.replace(building, snapshot)
+                _snapshot_built_at[snapshot] = started
+        return snapshot
+
+    def get_snapshot_lag(self, user_id: Optional[int] = None) -> float:
+        """Seconds between now and the state analytics reads currently see"""
+        if self.read_mode != "snapshot":
+            return 0.0
+        snapshot = snapshot_path_for(self._path(user_id))
+        built_at = _snapshot_built_at.get(snapshot)
+        if built_at is None and os.path.exists(snapshot):
+            built_at = os.path.getmtime(snapshot)
+        return time.time() - built_at if built_at is not None else float('inf')
+
+    def get_diagnostics(self, user_id: Optional[int] = None) -> Dict[str, str]:
+        """Backend details for the diagnostics panel"""
+        details = {
+            "Backend": self.name,
+            "Read mode": self.read_mode,
+            "Storage": self.router.shard_mode,
+        }
+        if self.router.sharded and user_id is not None:
+            details["Shard"] = os.path.basename(self.router.path_for_user(user_id))
+        if self.read_mode == "snapshot":
+            lag = self.get_snapshot_lag(user_id)
+            details["Snapshot lag"] = f"{lag:.1f}s" if lag != float('inf') else "not built"
+        if user_id is not None:
+            horizon = self.get_archive_horizon(user_id)
+            details["Archived before"] = horizon or "nothing archived"
+        details.update(querylog.query_diagnostics())
+        return details
+
     def init_database(self):
         """Initialize SQLite database with required tables"""
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = querylog.connect(self.db_path)
         cursor = conn.cursor()
 
+        # WAL lets readers proceed while a writer holds the lock
+        cursor.execute("PRAGMA journal_mode=WAL")
+
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -26,46 +191,396 @@ class ExpenseTrackerDB:
             )
         ''')
 
-        # Expenses table
+        # Shard file holding the user's data; NULL means this catalog file
+        self._ensure_column(cursor, 'users', 'shard', 'TEXT')
+
+        # API tokens, stored hashed; the plain token is only shown once
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS api_tokens (
+                token_hash TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+
+        conn.commit()
+        conn.close()
+        self.ensure_schema(self.db_path)
+
+    def ensure_schema(self, path: str):
+        """Create the per-user tables in a database file (once per file per process)"""
+        if path in _schema_ready:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = querylog.connect(path)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+        # Category dimension: built-in rows (user_id NULL) have fixed ids, users'
+        # own categories are numbered after them
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                name TEXT NOT NULL,
+                icon TEXT NOT NULL,
+                description TEXT NOT NULL DEFAULT '',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_user_name ON categories (user_id, name)
+        ''')
+        cursor.executemany(
+            "INSERT OR IGNORE INTO categories (id, user_id, name, icon, description) VALUES (?, NULL, ?, ?, ?)",
+            [(i, *category) for i, category in enumerate(DEFAULT_CATEGORIES, 1)]
+        )
+
+        # Expenses reference their category by id and store the date as a day
+        # number (days since 1970-01-01, see calendar_dim), so rows, indexes,
+        # range scans and GROUP BY category all work on integers
+        cursor.execute("PRAGMA table_info(expenses)")
+        if 'category' in [row[1] for row in cursor.fetchall()]:
+            self._migrate_to_category_ids(cursor)
+        cursor.execute(EXPENSES_TABLE.format(name="expenses"))
+        cursor.execute(BUDGETS_TABLE.format(name="budgets"))
+        # Expense rows as the rest of the app sees them: category name and ISO date
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS expense_rows AS
+            SELECT e.id, e.user_id, e.amount, c.name AS category, e.description,
+                   date(e.day * 86400, 'unixepoch') AS date, e.created_at, e.currency, e.recurring_id,
+                   e.day, e.category_id
+            FROM expenses e JOIN categories c ON c.id = e.category_id
+        ''')
+
+        # Recurring expense rules; materialized_through is the scheduler's high-water mark
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
+            CREATE TABLE IF NOT EXISTS recurring_expenses (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 amount REAL NOT NULL,
                 category TEXT NOT NULL,
                 description TEXT,
-                date DATE NOT NULL,
+                frequency TEXT NOT NULL,
+                interval INTEGER NOT NULL DEFAULT 1,
+                cron TEXT,
+                start_date DATE NOT NULL,
+                end_date DATE,
+                materialized_through DATE,
+                active INTEGER NOT NULL DEFAULT 1,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
 
-        # Budgets table
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS budgets (
+            CREATE INDEX IF NOT EXISTS idx_expenses_user_day ON expenses (user_id, day)
+        ''')
+
+        # ISO currency codes; rows from before multi-currency support are in the base currency
+        currency_column = f"TEXT NOT NULL DEFAULT '{config.BASE_CURRENCY}'"
+        for table in ('expenses', 'budgets', 'recurring_expenses'):
+            self._ensure_column(cursor, table, 'currency', currency_column)
+
+        # Per-user running aggregates kept by the write methods, so summary
+        # widgets read one row instead of the whole history
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'")
+        backfill_stats = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY,
+                expense_count INTEGER NOT NULL DEFAULT 0,
+                total_amount REAL NOT NULL DEFAULT 0,
+                min_date DATE,
+                max_date DATE,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # Category totals are kept per currency so they can be converted to any
+        # display currency; older per-category tables are derived data and rebuilt
+        cursor.execute("PRAGMA table_info(user_category_stats)")
+        category_columns = [row[1] for row in cursor.fetchall()]
+        if category_columns and 'currency' not in category_columns:
+            cursor.execute("DROP TABLE user_category_stats")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_category_stats (
+                user_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                expense_count INTEGER NOT NULL DEFAULT 0,
+                total_amount REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, category, currency)
+            )
+        ''')
+        if backfill_stats or (category_columns and 'currency' not in category_columns):
+            cursor.execute("DELETE FROM user_category_stats")
+            cursor.execute('''
+                INSERT INTO user_category_stats (user_id, category, currency, expense_count, total_amount)
+                SELECT user_id, category, currency, COUNT(*), SUM(amount)
+                FROM expense_rows GROUP BY user_id, category, currency
+            ''')
+        if backfill_stats:
+            cursor.execute('''
+                INSERT INTO user_stats (user_id, expense_count, total_amount, min_date, max_date, version)
+                SELECT user_id, COUNT(*), SUM(amount),
+                       date(MIN(day) * 86400, 'unixepoch'), date(MAX(day) * 86400, 'unixepoch'), 1
+                FROM expenses GROUP BY user_id
+            ''')
+
+        # Archive watermark per user: expenses dated before archived_before live in
+        # compressed blocks on disk, with monthly rollups kept here
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expense_archive (
+                user_id INTEGER PRIMARY KEY,
+                archived_before DATE NOT NULL,
+                min_date DATE,
+                max_date DATE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archived_rollups (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                category TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                expense_count INTEGER NOT NULL,
+                total_amount REAL NOT NULL,
+                PRIMARY KEY (user_id, month, category, currency)
+            )
+        ''')
+
+        # Change log for delta sync: one row per insert/update/delete, numbered by a
+        # per-user sequence (kept in change_log_state) so numbers survive a move
+        # between shards. Clients whose position is below floor_seq must resync.
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'change_log_state'")
+        new_change_log = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log_state (
+                user_id INTEGER PRIMARY KEY,
+                last_seq INTEGER NOT NULL DEFAULT 0,
+                floor_seq INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expense_changes (
+                user_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                expense_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                amount REAL,
+                category TEXT,
+                description TEXT,
+                date DATE,
+                currency TEXT,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, seq)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_expense_changes_expense
+            ON expense_changes (user_id, expense_id, seq)
+        ''')
+        if new_change_log:
+            # History from before the log existed is not in it, so existing
+            # users start with a floor that sends new clients to a full sync
+            cursor.execute('''
+                INSERT INTO change_log_state (user_id, last_seq, floor_seq)
+                SELECT DISTINCT user_id, 1, 1 FROM expenses
+            ''')
+
+        # Append-only audit trail: the full expense row after every insert and
+        # update and before every delete, with millisecond timestamps, so a
+        # user's expenses can be rebuilt at any point from a backup plus replay
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expense_audit (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                expense_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                amount REAL,
+                category TEXT,
+                description TEXT,
+                date DATE,
+                currency TEXT,
+                recurring_id INTEGER,
+                created_at TIMESTAMP,
+                logged_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_expense_audit_user ON expense_audit (user_id, logged_at)
+        ''')
+        for action in ('UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS expense_audit_no_{action.lower()}
+                BEFORE {action} ON expense_audit
+                BEGIN SELECT RAISE(ABORT, 'expense_audit is append-only'); END
+            ''')
+
+        # Categorizer training counts (see categorizer.py), kept sparse and updated
+        # by every write so the model never needs a full retrain
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'category_model_docs'")
+        new_category_model = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_model_docs (
+                user_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                docs INTEGER NOT NULL,
+                PRIMARY KEY (user_id, category)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_model_features (
+                user_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                feature INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, category, feature)
+            ) WITHOUT ROWID
+        ''')
+        if new_category_model:
+            self._retrain_category_model(cursor)
+
+        # Running spend per month, category and currency (hot and archived), kept by
+        # the write methods so budget usage for one category is a small lookup
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'monthly_category_totals'")
+        new_monthly_totals = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monthly_category_totals (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                category TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                expense_count INTEGER NOT NULL DEFAULT 0,
+                total_amount REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, category, currency)
+            )
+        ''')
+        if new_monthly_totals:
+            self._rebuild_monthly_totals(cursor)
+
+        # Amount sketches per month, category and currency (hot and archived): expense
+        # counts per log-scale amount bucket, kept by the same writes, so medians and
+        # percentiles for any span merge a few small rows (see sketches.py)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'amount_sketches'")
+        new_sketches = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS amount_sketches (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                category TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, month, category, currency, bucket)
+            ) WITHOUT ROWID
+        ''')
+        if new_sketches:
+            self._rebuild_amount_sketches(cursor)
+
+        # Budget threshold crossings raised at write time, read by the sidebar;
+        # one row per threshold per budget, re-armed if usage drops and rises again
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS budget_alerts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 category TEXT NOT NULL,
-                amount REAL NOT NULL,
                 month INTEGER NOT NULL,
                 year INTEGER NOT NULL,
+                threshold INTEGER NOT NULL,
+                spent REAL NOT NULL,
+                budget REAL NOT NULL,
+                currency TEXT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                UNIQUE(user_id, category, month, year)
+                dismissed INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (user_id, category, month, year, threshold)
             )
         ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_budget_alerts_user ON budget_alerts (user_id, dismissed)
+        ''')
+
+        # Link materialized occurrences back to their rule so re-runs never double-insert
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_recurring_day
+            ON expenses (recurring_id, day) WHERE recurring_id IS NOT NULL
+        ''')
 
         conn.commit()
         conn.close()
+        _schema_ready.add(path)
 
-    def hash_password(self, password: str) -> str:
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def _migrate_to_category_ids(self, cursor):
+        """Convert expenses and budgets from category names and ISO dates to ids and day numbers.
+
+        Names that are not built in become categories of the users who used
+        them. Each table is rebuilt under its own name with its rows' ids and
+        AUTOINCREMENT counter kept, so the audit log and change log still
+        refer to the same expenses.
+        """
+        # Databases from before multi-currency and recurring rules lack these columns
+        currency_column = f"TEXT NOT NULL DEFAULT '{config.BASE_CURRENCY}'"
+        self._ensure_column(cursor, 'expenses', 'currency', currency_column)
+        self._ensure_column(cursor, 'expenses', 'recurring_id', 'INTEGER')
+        self._ensure_column(cursor, 'budgets', 'currency', currency_column)
+        cursor.execute(
+            """INSERT OR IGNORE INTO categories (user_id, name, icon)
+               SELECT DISTINCT user_id, category, ? FROM (
+                   SELECT user_id, category FROM expenses UNION SELECT user_id, category FROM budgets)
+               WHERE category NOT IN (SELECT name FROM categories WHERE user_id IS NULL)""",
+            (CUSTOM_CATEGORY_ICON,)
+        )
+        category_id = """(SELECT c.id FROM categories c WHERE c.name = old.category
+                          AND (c.user_id IS NULL OR c.user_id = old.user_id))"""
+        for table, template, columns, values in (
+                ("expenses", EXPENSES_TABLE,
+                 "id, user_id, amount, category_id, description, day, created_at, currency, recurring_id",
+                 f"id, user_id, amount, {category_id}, description, "
+                 "CAST(julianday(date) - 2440587.5 AS INTEGER), created_at, currency, recurring_id"),
+                ("budgets", BUDGETS_TABLE,
+                 "id, user_id, category_id, amount, month, year, created_at, currency",
+                 f"id, user_id, {category_id}, amount, month, year, created_at, currency")):
+            cursor.execute(template.format(name=f"{table}_migrated"))
+            cursor.execute(f"INSERT INTO {table}_migrated ({columns}) SELECT {values} FROM {table} old")
+            cursor.execute(f"DELETE FROM sqlite_sequence WHERE name = '{table}_migrated'")
+            cursor.execute(f"UPDATE sqlite_sequence SET name = '{table}_migrated' WHERE name = '{table}'")
+            cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(f"ALTER TABLE {table}_migrated RENAME TO {table}")
+
+    @staticmethod
+    def _find_category(cursor, user_id: int, name: str) -> Optional[int]:
+        """Id of a built-in category or one of the user's own, by name"""
+        cursor.execute(
+            "SELECT id FROM categories WHERE name = ? AND (user_id IS NULL OR user_id = ?) ORDER BY user_id LIMIT 1",
+            (name, user_id)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _category_id(self, cursor, user_id: int, name: str) -> int:
+        """Id for a category name, creating a user category the first time a name is used"""
+        category_id = self._find_category(cursor, user_id, name)
+        if category_id is None:
+            cursor.execute("INSERT INTO categories (user_id, name, icon) VALUES (?, ?, ?)",
+                           (user_id, name, CUSTOM_CATEGORY_ICON))
+            category_id = cursor.lastrowid
+        return category_id
+
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, definition: str):
+        """Add a column to an existing table if an older database lacks it"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
     def create_user(self, username: str, email: str, password: str) -> bool:
         """Create new user account"""
         try:
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self._connect()
             cursor = conn.cursor()
 
             password_hash = self.hash_password(password)
@@ -73,6 +588,9 @@ class ExpenseTrackerDB:
                 "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
                 (username, email, password_hash)
             )
+            shard = self.router.shard_name_for_new_user(cursor.lastrowid)
+            if shard:
+                cursor.execute("UPDATE users SET shard = ? WHERE id = ?", (shard, cursor.lastrowid))
             conn.commit()
             conn.close()
             return True
@@ -81,7 +599,7 @@ class ExpenseTrackerDB:
 
     def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
         """Authenticate user login"""
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self._connect()
         cursor = conn.cursor()
 
         password_hash = self.hash_password(password)
@@ -96,91 +614,1064 @@ class ExpenseTrackerDB:
             return {"id": user[0], "username": user[1], "email": user[2]}
         return None
 
-    def add_expense(self, user_id: int, amount: float, category: str, description: str, date: str) -> bool:
+    def create_api_token(self, user_id: int) -> Optional[str]:
+        """Issue an API token for a user"""
+        token = secrets.token_urlsafe(32)
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO api_tokens (token_hash, user_id, expires_at) VALUES (?, ?, datetime('now', ?))",
+                (self.hash_token(token), user_id, f"+{config.API_TOKEN_TTL_HOURS} hours")
+            )
+            # Expired tokens are cleaned up whenever a new one is issued
+            cursor.execute("DELETE FROM api_tokens WHERE expires_at <= datetime('now')")
+            conn.commit()
+            conn.close()
+            return token
+        except Exception:
+            return None
+
+    def get_api_token_user(self, token: str) -> Optional[Dict]:
+        """User an unexpired API token belongs to"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT u.id, u.username, u.email FROM api_tokens t JOIN users u ON u.id = t.user_id
+               WHERE t.token_hash = ? AND t.expires_at > datetime('now')""",
+            (self.hash_token(token),)
+        )
+        user = cursor.fetchone()
+        conn.close()
+
+        if user:
+            return {"id": user[0], "username": user[1], "email": user[2]}
+        return None
+
+    def revoke_api_token(self, token: str) -> bool:
+        """Invalidate an API token"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM api_tokens WHERE token_hash = ?", (self.hash_token(token),))
+            revoked = cursor.rowcount > 0
+            conn.commit()
+            conn.close()
+            return revoked
+        except Exception:
+            return False
+
+    @staticmethod
+    def _apply_stats(cursor, user_id: int, category: str, currency: str, count: int, amount: float,
+                     date: Optional[str] = None):
+        """Add a delta to a user's running stats; call inside the write's transaction.
+
+        `date` widens the min/max bounds for inserts; deletes and edits call
+        _refresh_date_bounds instead since a bound may have moved inward.
+        """
+        cursor.execute(
+            """INSERT INTO user_stats (user_id, expense_count, total_amount, min_date, max_date, version)
+               VALUES (?, ?, ?, ?, ?, 1)
+               ON CONFLICT(user_id) DO UPDATE SET
+                   expense_count = expense_count + excluded.expense_count,
+                   total_amount = total_amount + excluded.total_amount,
+                   min_date = COALESCE(MIN(min_date, excluded.min_date), min_date, excluded.min_date),
+                   max_date = COALESCE(MAX(max_date, excluded.max_date), max_date, excluded.max_date),
+                   version = version + 1""",
+            (user_id, count, amount, date, date)
+        )
+        cursor.execute(
+            """INSERT INTO user_category_stats (user_id, category, currency, expense_count, total_amount)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, category, currency) DO UPDATE SET
+                   expense_count = expense_count + excluded.expense_count,
+                   total_amount = total_amount + excluded.total_amount""",
+            (user_id, category, currency, count, amount)
+        )
+
+    @staticmethod
+    def _log_change(cursor, user_id: int, expense_id: int, op: str, row: Optional[Tuple] = None):
+        """Append to the user's change log; call inside the write's transaction.
+
+        `row` is (amount, category, description, date, currency) for
+        "upsert" and None for "delete".
+        """
+        cursor.execute(
+            """INSERT INTO change_log_state (user_id, last_seq) VALUES (?, 1)
+               ON CONFLICT(user_id) DO UPDATE SET last_seq = last_seq + 1""",
+            (user_id,)
+        )
+        cursor.execute(
+            """INSERT INTO expense_changes
+               (user_id, seq, expense_id, op, amount, category, description, date, currency)
+               SELECT ?, last_seq, ?, ?, ?, ?, ?, ?, ? FROM change_log_state WHERE user_id = ?""",
+            (user_id, expense_id, op, *(row or (None,) * 5), user_id)
+        )
+
+    @staticmethod
+    def _audit(cursor, user_id: int, expense_id: int, op: str):
+        """Append an expense's current row to the audit log; call before a delete, after other writes"""
+        cursor.execute(
+            """INSERT INTO expense_audit
+               (user_id, expense_id, op, amount, category, description, date, currency, recurring_id, created_at)
+               SELECT user_id, id, ?, amount, category, description, date, currency, recurring_id, created_at
+               FROM expense_rows WHERE id = ? AND user_id = ?""",
+            (op, expense_id, user_id)
+        )
+
+    @staticmethod
+    def _apply_monthly_total(cursor, user_id: int, category: str, currency: str, date: str, count: int,
+                             amount: float):
+        """Add a delta to a user's running spend and amount sketch for `date`'s month.
+
+        Call inside the write's transaction; `count` is 1 for an added
+        expense and -1 for a removed one.
+        """
+        month = month_of(date)[0]
+        cursor.execute(
+            """INSERT INTO monthly_category_totals (user_id, month, category, currency, expense_count, total_amount)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, month, category, currency) DO UPDATE SET
+                   expense_count = expense_count + excluded.expense_count,
+                   total_amount = total_amount + excluded.total_amount""",
+            (user_id, month, category, currency, count, amount)
+        )
+        key = (user_id, month, category, currency, bucket_of(amount))
+        cursor.execute(
+            """INSERT INTO amount_sketches (user_id, month, category, currency, bucket, count)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, month, category, currency, bucket) DO UPDATE SET
+                   count = count + excluded.count""",
+            (*key, count)
+        )
+        if count < 0:
+            cursor.execute(
+                """DELETE FROM amount_sketches WHERE user_id = ? AND month = ? AND category = ?
+                   AND currency = ? AND bucket = ? AND count <= 0""",
+                key
+            )
+
+    @staticmethod
+    def _rebuild_monthly_totals(cursor, user_id: Optional[int] = None):
+        """Recompute running monthly spend from the hot table and archived rollups, for one user or all"""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+        cursor.execute(f"DELETE FROM monthly_category_totals {where}", params)
+        cursor.execute(
+            f"""INSERT INTO monthly_category_totals (user_id, month, category, currency, expense_count, total_amount)
+                SELECT user_id, month, category, currency, SUM(n), SUM(total) FROM (
+                    SELECT user_id, substr(date, 1, 7) AS month, category, currency,
+                           COUNT(*) AS n, SUM(amount) AS total
+                    FROM expense_rows {where} GROUP BY user_id, month, category, currency
+                    UNION ALL
+                    SELECT user_id, month, category, currency, expense_count, total_amount
+                    FROM archived_rollups {where})
+                GROUP BY user_id, month, category, currency""",
+            params * 2
+        )
+
+    def _rebuild_amount_sketches(self, cursor, user_id: Optional[int] = None):
+        """Recompute amount sketches from the hot table and archived blocks, for one user or all"""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+        cursor.execute(f"DELETE FROM amount_sketches {where}", params)
+        columns = ['user_id', 'id', 'created_at', 'month', 'category', 'currency', 'amount']
+        frames = [pd.DataFrame(cursor.execute(
+            f"""SELECT user_id, id, created_at, substr(date, 1, 7), category, currency, amount
+                FROM expense_rows {where}""", params).fetchall(), columns=columns)]
+        hot_keys = pd.MultiIndex.from_frame(frames[0][['id', 'created_at']])
+        for (archived_user,) in cursor.execute(f"SELECT user_id FROM expense_archive {where}", params).fetchall():
+            archived = self.archive.read(archived_user)
+            # Rows of an interrupted archive pass are still counted from the hot table
+            archived = archived[~pd.MultiIndex.from_frame(archived[['id', 'created_at']]).isin(hot_keys)]
+            frames.append(archived.assign(
+                user_id=archived_user,
+                month=np.datetime_as_string(archived['day'].to_numpy().astype('datetime64[D]'), unit='M'),
+            )[columns])
+        rows = pd.concat(frames, ignore_index=True)
+        if rows.empty:
+            return
+        rows['bucket'] = bucket_ids(rows['amount'])
+        counts = rows.groupby(['user_id', 'month', 'category', 'currency', 'bucket']).size()
+        cursor.executemany(
+            """INSERT INTO amount_sketches (user_id, month, category, currency, bucket, count)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            [(int(u), month, category, currency, int(bucket), int(n))
+             for (u, month, category, currency, bucket), n in counts.items()]
+        )
+
+    @staticmethod
+    def _budget_usage(cursor, user_id: int, category: str, date: str) -> Optional[Tuple[float, float, str]]:
+        """(spent, budget, budget currency) for the category in `date`'s month, or None without a budget.
+
+        Spend comes from the running monthly totals (one row per currency
+        used), converted into the budget's currency.
+        """
+        month_key, month, year = month_of(date)
+        cursor.execute(
+            """SELECT b.amount, b.currency FROM budgets b JOIN categories c ON c.id = b.category_id
+               WHERE b.user_id = ? AND c.name = ? AND b.month = ? AND b.year = ?""",
+            (user_id, category, month, year)
+        )
+        budget = cursor.fetchone()
+        if budget is None:
+            return None
+        cursor.execute(
+            """SELECT currency, total_amount FROM monthly_category_totals
+               WHERE user_id = ? AND month = ? AND category = ?""",
+            (user_id, month_key, category)
+        )
+        totals = cursor.fetchall()
+        spent = float(np.dot([total for _, total in totals],
+                             get_rates().factors([currency for currency, _ in totals], budget[1]))) if totals else 0.0
+        return spent, budget[0], budget[1]
+
+    def _raise_budget_alerts(self, cursor, user_id: int, category: str, date: str,
+                             before: Optional[Tuple[float, float, str]]):
+        """Record alert thresholds crossed since `before`, a _budget_usage result taken earlier in the transaction"""
+        after = self._budget_usage(cursor, user_id, category, date)
+        if after is None:
+            return
+        spent, budget, currency = after
+        crossed = crossed_thresholds(usage(*before[:2]) if before else 0.0, usage(spent, budget))
+        if not crossed:
+            return
+        # Only the highest threshold is worth showing; it supersedes lower unread ones
+        _, month, year = month_of(date)
+        cursor.execute(
+            """INSERT INTO budget_alerts (user_id, category, month, year, threshold, spent, budget, currency)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, category, month, year, threshold) DO UPDATE SET
+                   spent = excluded.spent, budget = excluded.budget, currency = excluded.currency,
+                   created_at = CURRENT_TIMESTAMP, dismissed = 0""",
+            (user_id, category, month, year, crossed[-1], spent, budget, currency)
+        )
+        cursor.execute(
+            """UPDATE budget_alerts SET dismissed = 1
+               WHERE user_id = ? AND category = ? AND month = ? AND year = ? AND threshold < ?""",
+            (user_id, category, month, year, crossed[-1])
+        )
+
+    @staticmethod
+    def _train_category_model(cursor, user_id: int, category: str, description: str, sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) one expense from a user's categorizer counts"""
+        cursor.execute(
+            """INSERT INTO category_model_docs (user_id, category, docs) VALUES (?, ?, ?)
+               ON CONFLICT(user_id, category) DO UPDATE SET docs = docs + excluded.docs""",
+            (user_id, category, sign)
+        )
+        cursor.executemany(
+            """INSERT INTO category_model_features (user_id, category, feature, count) VALUES (?, ?, ?, ?)
+               ON CONFLICT(user_id, category, feature) DO UPDATE SET count = count + excluded.count""",
+            [(user_id, category, feature, sign * n) for feature, n in feature_counts(description).items()]
+        )
+        if sign < 0:
+            cursor.execute("DELETE FROM category_model_docs WHERE user_id = ? AND category = ? AND docs <= 0",
+                           (user_id, category))
+            cursor.execute("DELETE FROM category_model_features WHERE user_id = ? AND category = ? AND count <= 0",
+                           (user_id, category))
+
+    @staticmethod
+    def _retrain_category_model(cursor, user_id: Optional[int] = None):
+        """Rebuild categorizer counts from the hot table, for one user or all of them"""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+        cursor.execute(f"DELETE FROM category_model_docs {where}", params)
+        cursor.execute(f"DELETE FROM category_model_features {where}", params)
+        docs, features = Counter(), Counter()
+        for uid, category, description in cursor.execute(
+                f"SELECT user_id, category, description FROM expense_rows {where}", params).fetchall():
+            docs[(uid, category)] += 1
+            for feature in feature_ids(description):
+                features[(uid, category, feature)] += 1
+        cursor.executemany("INSERT INTO category_model_docs (user_id, category, docs) VALUES (?, ?, ?)",
+                           [(*key, n) for key, n in docs.items()])
+        cursor.executemany(
+            "INSERT INTO category_model_features (user_id, category, feature, count) VALUES (?, ?, ?, ?)",
+            [(*key, n) for key, n in features.items()])
+
+    @staticmethod
+    def _rebuild_stats(cursor, user_id: int):
+        """Recompute a user's running stats from the hot table and archived rollups"""
+        cursor.execute("DELETE FROM user_category_stats WHERE user_id = ?", (user_id,))
+        cursor.execute(
+            """INSERT INTO user_category_stats (user_id, category, currency, expense_count, total_amount)
+               SELECT ?, category, currency, SUM(n), SUM(total) FROM (
+                   SELECT category, currency, COUNT(*) AS n, SUM(amount) AS total
+                   FROM expense_rows WHERE user_id = ? GROUP BY category, currency
+                   UNION ALL
+                   SELECT category, currency, expense_count, total_amount
+                   FROM archived_rollups WHERE user_id = ?)
+               GROUP BY category, currency""",
+            (user_id, user_id, user_id)
+        )
+        cursor.execute(
+            """INSERT INTO user_stats (user_id, expense_count, total_amount, version)
+               SELECT ?, COALESCE(SUM(expense_count), 0), COALESCE(SUM(total_amount), 0), 1
+               FROM user_category_stats WHERE user_id = ?
+               ON CONFLICT(user_id) DO UPDATE SET
+                   expense_count = excluded.expense_count,
+                   total_amount = excluded.total_amount,
+                   version = version + 1""",
+            (user_id, user_id)
+        )
+
+    @staticmethod
+    def _refresh_date_bounds(cursor, user_id: int):
+        """Recompute a user's min/max expense date across the hot table and the archive"""
+        cursor.execute(
+            """UPDATE user_stats SET
+                   min_date = (SELECT MIN(d) FROM (
+                       SELECT date(MIN(day) * 86400, 'unixepoch') AS d FROM expenses WHERE user_id = ?
+                       UNION ALL SELECT min_date FROM expense_archive WHERE user_id = ?)),
+                   max_date = (SELECT MAX(d) FROM (
+                       SELECT date(MAX(day) * 86400, 'unixepoch') AS d FROM expenses WHERE user_id = ?
+                       UNION ALL SELECT max_date FROM expense_archive WHERE user_id = ?))
+               WHERE user_id = ?""",
+            (user_id, user_id, user_id, user_id, user_id)
+        )
+        cursor.execute(
+            "DELETE FROM user_category_stats WHERE user_id = ? AND expense_count <= 0",
+            (user_id,)
+        )
+
+    def _fetch_expense(self, cursor, expense_id: int, user_id: int) -> Optional[Tuple]:
+        cursor.execute(
+            "SELECT amount, category, description, date, currency FROM expense_rows WHERE id = ? AND user_id = ?",
+            (expense_id, user_id)
+        )
+        return cursor.fetchone()
+
+    def add_expense(self, user_id: int, amount: float, category: str, description: str, date: str,
+                    currency: Optional[str] = None) -> bool:
         """Add new expense"""
+        currency = currency or config.BASE_CURRENCY
         try:
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self._connect(user_id)
             cursor = conn.cursor()
 
+            before = self._budget_usage(cursor, user_id, category, date)
             cursor.execute(
-                "INSERT INTO expenses (user_id, amount, category, description, date) VALUES (?, ?, ?, ?, ?)",
-                (user_id, amount, category, description, date)
+                "INSERT INTO expenses (user_id, amount, category_id, description, day, currency) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, amount, self._category_id(cursor, user_id, category), description, to_day(date), currency)
             )
+            # Helpers insert rows of their own, so the expense id is read before they run
+            expense_id = cursor.lastrowid
+            self._audit(cursor, user_id, expense_id, "insert")
+            self._log_change(cursor, user_id, expense_id, "upsert",
+                             (amount, category, description, date, currency))
+            self._apply_stats(cursor, user_id, category, currency, 1, amount, date)
+            self._apply_monthly_total(cursor, user_id, category, currency, date, 1, amount)
+            self._raise_budget_alerts(cursor, user_id, category, date, before)
+            self._train_category_model(cursor, user_id, category, description)
             conn.commit()
             conn.close()
             return True
         except Exception:
             return False
 
-    def get_expenses(self, user_id: int) -> pd.DataFrame:
-        """Get all expenses for a user"""
-        conn = sqlite3.connect('expense_tracker.db')
+    def add_expenses(self, user_id: int, rows: List[Tuple]) -> int:
+        """Add many expenses in one transaction; rows are (amount, category, description, date, currency)"""
+        conn = self._connect(user_id)
+        try:
+            with conn:
+                cursor = conn.cursor()
+                for amount, category, description, date, currency in rows:
+                    currency = currency or config.BASE_CURRENCY
+                    before = self._budget_usage(cursor, user_id, category, date)
+                    cursor.execute(
+                        """INSERT INTO expenses (user_id, amount, category_id, description, day, currency)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (user_id, amount, self._category_id(cursor, user_id, category), description, to_day(date),
+                         currency)
+                    )
+                    expense_id = cursor.lastrowid
+                    self._audit(cursor, user_id, expense_id, "insert")
+                    self._log_change(cursor, user_id, expense_id, "upsert",
+                                     (amount, category, description, date, currency))
+                    self._apply_stats(cursor, user_id, category, currency, 1, amount, date)
+                    self._apply_monthly_total(cursor, user_id, category, currency, date, 1, amount)
+                    self._raise_budget_alerts(cursor, user_id, category, date, before)
+                    self._train_category_model(cursor, user_id, category, description)
+            return len(rows)
+        finally:
+            conn.close()
+
+    def get_user_stats(self, user_id: int) -> Dict:
+        """Get a user's expense count, total, date range and per-category totals"""
+        conn = self._connect_read(user_id)
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT expense_count, total_amount, min_date, max_date, version FROM user_stats WHERE user_id = ?",
+            (user_id,)
+        )
+        row = cursor.fetchone() or (0, 0.0, None, None, 0)
+        cursor.execute(
+            """SELECT category, currency, total_amount FROM user_category_stats
+               WHERE user_id = ? AND expense_count > 0""",
+            (user_id,)
+        )
+        breakdown = cursor.fetchall()
+        conn.close()
+        categories: Dict[str, float] = {}
+        for category, _, amount in breakdown:
+            categories[category] = categories.get(category, 0.0) + amount
+        return {
+            "count": row[0], "total": row[1], "min_date": row[2], "max_date": row[3],
+            "version": row[4], "categories": categories, "breakdown": breakdown,
+        }
+
+    def get_expenses(self, user_id: int, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None) -> pd.DataFrame:
+        """Get a user's expenses, newest first, optionally limited to [start_date, end_date].
+
+        Archived blocks are only opened when the range starts before the
+        user's archive horizon.
+        """
+        conn = self._connect_read(user_id)
+        conditions, params = ["user_id = ?"], [user_id]
+        if start_date:
+            conditions.append("day >= ?")
+            params.append(to_day(start_date))
+        if end_date:
+            conditions.append("day <= ?")
+            params.append(to_day(end_date))
+        query = f"""
+            SELECT id, amount, category, description, day, created_at, currency
+            FROM expense_rows 
+            WHERE {' AND '.join(conditions)} 
+            ORDER BY day DESC
+        """
+        df = pd.read_sql_query(query, conn, params=params)
+        # Day numbers become ISO strings in one vectorized pass rather than per row in SQL
+        df.insert(4, 'date', np.datetime_as_string(df.pop('day').to_numpy().astype('datetime64[D]'), unit='D')
+                  .astype(object))
+        cursor = conn.cursor()
+        cursor.execute("SELECT archived_before FROM expense_archive WHERE user_id = ?", (user_id,))
+        archived_before = (cursor.fetchone() or (None,))[0]
+        conn.close()
+
+        if archived_before and (not start_date or start_date < archived_before):
+            end_day = to_day(archived_before) - 1
+            if end_date:
+                end_day = min(end_day, to_day(end_date))
+            archived = self.archive.read(user_id, to_day(start_date) if start_date else None, end_day)
+            if not archived.empty:
+                df = self._merge_archived(df, archived)
+        return df
+
+    @staticmethod
+    def _merge_archived(hot: pd.DataFrame, archived: pd.DataFrame) -> pd.DataFrame:
+        """Append archived rows in get_expenses form, keeping newest-first order.
+
+        Rows still present in the hot table (an archive pass interrupted
+        between writing blocks and deleting rows) are taken from the hot side.
+        """
+        archived = archived.assign(
+            date=np.datetime_as_string(archived['day'].to_numpy().astype('datetime64[D]'), unit='D'))
+        keys = ['id', 'created_at']
+        duplicate = pd.MultiIndex.from_frame(archived[keys]).isin(pd.MultiIndex.from_frame(hot[keys]))
+        archived = archived.loc[~duplicate, list(hot.columns)]
+        if archived.empty:
+            return hot
+        combined = pd.concat([hot, archived.iloc[::-1]], ignore_index=True)
+        return combined.sort_values('date', ascending=False, kind='stable').reset_index(drop=True)
+
+    def get_archive_horizon(self, user_id: int) -> Optional[str]:
+        """First date still in the hot table for a user, or None if nothing is archived"""
+        conn = self._connect_read(user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT archived_before FROM expense_archive WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def get_archived_rollups(self, user_id: int) -> pd.DataFrame:
+        """Monthly per-category, per-currency totals for a user's archived months"""
+        conn = self._connect_read(user_id)
         query = """
-            SELECT id, amount, category, description, date, created_at
-            FROM expenses 
-            WHERE user_id = ? 
-            ORDER BY date DESC
+            SELECT month, category, currency, expense_count, total_amount
+            FROM archived_rollups
+            WHERE user_id = ?
+            ORDER BY month
         """
         df = pd.read_sql_query(query, conn, params=(user_id,))
         conn.close()
         return df
 
+    def get_amount_sketches(self, user_id: int, start_month: Optional[str] = None,
+                            end_month: Optional[str] = None) -> pd.DataFrame:
+        """Stored amount sketch rows for months in [start_month, end_month] ('YYYY-MM')"""
+        conn = self._connect_read(user_id)
+        conditions, params = ["user_id = ?"], [user_id]
+        if start_month:
+            conditions.append("month >= ?")
+            params.append(start_month)
+        if end_month:
+            conditions.append("month <= ?")
+            params.append(end_month)
+        query = f"""
+            SELECT {', '.join(SKETCH_COLUMNS)}
+            FROM amount_sketches
+            WHERE {' AND '.join(conditions)}
+        """
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        return df
+
+    def archive_expenses(self, before: str, user_id: Optional[int] = None) -> int:
+        """Move expenses dated before `before` into the compressed archive; returns rows moved.
+
+        Month blocks are written first; the hot-row delete, the rollups and
+        the watermark then commit in one transaction per user. A crash in
+        between leaves rows in both tiers, which reads and the next pass
+        resolve by id.
+        """
+        paths = self.router.shard_paths() if user_id is None else [self._path(user_id)]
+        query = """
+            SELECT id, user_id, amount, category, description, date, created_at, currency, recurring_id, day
+            FROM expense_rows WHERE day < ?
+        """ + (" AND user_id = ?" if user_id is not None else "")
+        params = (to_day(before),) if user_id is None else (to_day(before), user_id)
+
+        moved = 0
+        for path in paths:
+            self.ensure_schema(path)
+            conn = querylog.connect(path)
+            try:
+                old = pd.read_sql_query(query, conn, params=params)
+                if old.empty:
+                    continue
+                old['month'] = old['date'].str[:7]
+                for archived_user, user_rows in old.groupby('user_id'):
+                    archived_user = int(archived_user)
+                    rollups = [monthly_rollup(self.archive.write_month(archived_user, month_key, month_rows), month_key)
+                               for month_key, month_rows in user_rows.groupby('month')]
+                    rollups = pd.concat(rollups, ignore_index=True)
+                    with conn:
+                        conn.executemany(
+                            "DELETE FROM archived_rollups WHERE user_id = ? AND month = ?",
+                            [(archived_user, month_key) for month_key in rollups['month'].unique()]
+                        )
+                        conn.executemany(
+                            """INSERT INTO archived_rollups
+                               (user_id, month, category, currency, expense_count, total_amount)
+                               VALUES (?, ?, ?, ?, ?, ?)""",
+                            [(archived_user, r.month, r.category, r.currency, int(r.expense_count), float(r.total_amount))
+                             for r in rollups.itertuples()]
+                        )
+                        conn.executemany(
+                            "DELETE FROM expenses WHERE id = ?",
+                            [(int(expense_id),) for expense_id in user_rows['id']]
+                        )
+                        conn.execute(
+                            """INSERT INTO expense_archive (user_id, archived_before, min_date, max_date)
+                               VALUES (?, ?, ?, ?)
+                               ON CONFLICT(user_id) DO UPDATE SET
+                                   archived_before = MAX(archived_before, excluded.archived_before),
+                                   min_date = MIN(COALESCE(min_date, excluded.min_date), excluded.min_date),
+                                   max_date = MAX(COALESCE(max_date, excluded.max_date), excluded.max_date)""",
+                            (archived_user, before, user_rows['date'].min(), user_rows['date'].max())
+                        )
+                    moved += len(user_rows)
+            finally:
+                conn.close()
+        return moved
+
+    def get_changes_since(self, user_id: int, seq: int, limit: int = 1000) -> Dict:
+        """Net expense changes after `seq`, oldest first, at most `limit` per batch.
+
+        Only the latest entry per expense is returned, so an expense edited
+        many times costs one row. `last_seq` is the position to ask from
+        next; `reset` means `seq` is older than the retained log (or from a
+        different history) and the client must reload via `get_expenses`
+        before continuing from `last_seq`.
+        """
+        conn = self._connect_read(user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT last_seq, floor_seq FROM change_log_state WHERE user_id = ?", (user_id,))
+        last_seq, floor_seq = cursor.fetchone() or (0, 0)
+        if seq < floor_seq or seq > last_seq:
+            conn.close()
+            return {"changes": pd.DataFrame(columns=CHANGE_COLUMNS), "last_seq": last_seq,
+                    "has_more": False, "reset": True}
+        changes = pd.read_sql_query(
+            """SELECT c.seq, c.op, c.expense_id AS id, c.amount, c.category, c.description, c.date, c.currency
+               FROM expense_changes c
+               WHERE c.user_id = ? AND c.seq > ? AND NOT EXISTS (
+                   SELECT 1 FROM expense_changes n
+                   WHERE n.user_id = c.user_id AND n.expense_id = c.expense_id AND n.seq > c.seq)
+               ORDER BY c.seq LIMIT ?""",
+            conn,
+            params=(user_id, seq, limit + 1)
+        )
+        conn.close()
+        has_more = len(changes) > limit
+        if has_more:
+            changes = changes.iloc[:limit]
+            last_seq = int(changes['seq'].iloc[-1])
+        return {"changes": changes, "last_seq": last_seq, "has_more": has_more, "reset": False}
+
+    def compact_change_log(self, before: str) -> int:
+        """Drop superseded change entries, and all entries logged before `before`; returns rows removed.
+
+        Dropping old entries raises each affected user's floor, so clients
+        that have not synced since then are told to reload.
+        """
+        removed = 0
+        for path in self.router.shard_paths():
+            self.ensure_schema(path)
+            conn = querylog.connect(path)
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        """DELETE FROM expense_changes WHERE EXISTS (
+                               SELECT 1 FROM expense_changes n
+                               WHERE n.user_id = expense_changes.user_id
+                                 AND n.expense_id = expense_changes.expense_id
+                                 AND n.seq > expense_changes.seq)"""
+                    )
+                    removed += cursor.rowcount
+                    conn.execute(
+                        """UPDATE change_log_state SET floor_seq = MAX(floor_seq, (
+                               SELECT MAX(seq) FROM expense_changes c
+                               WHERE c.user_id = change_log_state.user_id AND c.changed_at < ?))
+                           WHERE user_id IN (SELECT user_id FROM expense_changes WHERE changed_at < ?)""",
+                        (before, before)
+                    )
+                    cursor = conn.execute("DELETE FROM expense_changes WHERE changed_at < ?", (before,))
+                    removed += cursor.rowcount
+            finally:
+                conn.close()
+        return removed
+
+    def get_category_model(self, user_id: int) -> Tuple[Dict[str, int], pd.DataFrame]:
+        """Training counts of a user's categorizer"""
+        conn = self._connect_read(user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT category, docs FROM category_model_docs WHERE user_id = ?", (user_id,))
+        docs = dict(cursor.fetchall())
+        features = pd.read_sql_query(
+            "SELECT category, feature, count FROM category_model_features WHERE user_id = ?",
+            conn, params=(user_id,)
+        )
+        conn.close()
+        return docs, features
+
+    def get_categories(self, user_id: int) -> pd.DataFrame:
+        """Built-in categories followed by the user's own"""
+        conn = self._connect_read(user_id)
+        query = """
+            SELECT id, name, icon, description, user_id IS NOT NULL AS custom
+            FROM categories
+            WHERE user_id IS NULL OR user_id = ?
+            ORDER BY custom, id
+        """
+        df = pd.read_sql_query(query, conn, params=(user_id,))
+        conn.close()
+        df['custom'] = df['custom'].astype(bool)
+        return df[CATEGORY_COLUMNS]
+
+    def add_category(self, user_id: int, name: str, icon: Optional[str] = None, description: str = "") -> bool:
+        """Create a user-defined category"""
+        name = name.strip()
+        if not name:
+            return False
+        try:
+            conn = self._connect(user_id)
+            cursor = conn.cursor()
+
+            if self._find_category(cursor, user_id, name) is not None:
+                conn.close()
+                return False
+            cursor.execute(
+                "INSERT INTO categories (user_id, name, icon, description) VALUES (?, ?, ?, ?)",
+                (user_id, name, icon or CUSTOM_CATEGORY_ICON, description)
+            )
+            conn.commit()
+            conn.close()
+            return True
+        except Exception:
+            return False
+
+    def restore_user(self, user_id: int, snapshot_path: str, replay_from: str, at: str) -> Dict[str, int]:
+        """Rebuild a user's hot expenses as they were at `at` (UTC) without taking the app down.
+
+        The user's rows are read from `snapshot_path` (a backup of the file
+        the user lives in, started at `replay_from`) and rolled forward with
+        audit entries logged from `replay_from` up to `at`; replay sets rows
+        to their logged state, so entries the backup already contains are
+        harmless. The difference from the live rows is then applied in one
+        short write transaction, itself audited and change-logged. Archived
+        months are immutable and left as they are. Returns the number of rows
+        inserted, updated and deleted.
+        """
+        path = self._path(user_id)
+        self.ensure_schema(path)
+        columns = ['id', 'amount', 'category', 'description', 'date', 'currency', 'recurring_id', 'created_at']
+
+        snapshot = querylog.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+        try:
+            # Backups taken before the category migration hold names and ISO dates in `expenses` itself
+            layout = "expense_rows" if snapshot.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'expense_rows'").fetchone() else "expenses"
+            rows = {row[0]: row[1:] for row in snapshot.execute(
+                f"SELECT {', '.join(columns)} FROM {layout} WHERE user_id = ?", (user_id,))}
+        finally:
+            snapshot.close()
+
+        conn = querylog.connect(path)
+        try:
+            moved_at = conn.execute(
+                "SELECT MAX(logged_at) FROM expense_audit WHERE user_id = ? AND op = 'moved'", (user_id,)
+            ).fetchone()[0]
+            if moved_at and moved_at > replay_from:
+                raise ValueError(f"User {user_id} moved to this shard at {moved_at}; "
+                                 "choose a later point in time")
+            for op, *entry in conn.execute(
+                    f"""SELECT op, expense_id, {', '.join(columns[1:])} FROM expense_audit
+                        WHERE user_id = ? AND logged_at >= ? AND logged_at <= ? AND op != 'moved'
+                        ORDER BY id""",
+                    (user_id, replay_from, at)):
+                if op == "delete":
+                    rows.pop(entry[0], None)
+                else:
+                    rows[entry[0]] = tuple(entry[1:])
+        finally:
+            conn.close()
+
+        horizon = self.get_archive_horizon(user_id)
+        if horizon:
+            rows = {expense_id: row for expense_id, row in rows.items() if row[3] >= horizon}
+
+        counts = {"inserted": 0, "updated": 0, "deleted": 0}
+        conn = querylog.connect(path, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            current = {row[0]: row[1:] for row in cursor.execute(
+                f"SELECT {', '.join(columns)} FROM expense_rows WHERE user_id = ?", (user_id,)).fetchall()}
+            for expense_id in current.keys() - rows.keys():
+                self._audit(cursor, user_id, expense_id, "delete")
+                cursor.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
+                self._log_change(cursor, user_id, expense_id, "delete")
+                counts["deleted"] += 1
+            for expense_id, row in rows.items():
+                if current.get(expense_id) == row:
+                    continue
+                amount, category, description, date, currency, recurring_id, created_at = row
+                stored = (amount, self._category_id(cursor, user_id, category), description, to_day(date),
+                          currency, recurring_id, created_at)
+                if expense_id in current:
+                    cursor.execute(
+                        """UPDATE expenses SET amount = ?, category_id = ?, description = ?, day = ?,
+                           currency = ?, recurring_id = ?, created_at = ? WHERE id = ?""",
+                        (*stored, expense_id)
+                    )
+                    self._audit(cursor, user_id, expense_id, "update")
+                    counts["updated"] += 1
+                else:
+                    cursor.execute(
+                        """INSERT INTO expenses (user_id, id, amount, category_id, description, day, currency,
+                                                 recurring_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (user_id, expense_id, *stored)
+                    )
+                    self._audit(cursor, user_id, expense_id, "insert")
+                    counts["inserted"] += 1
+                self._log_change(cursor, user_id, expense_id, "upsert",
+                                 (amount, category, description, date, currency))
+            self._rebuild_stats(cursor, user_id)
+            self._refresh_date_bounds(cursor, user_id)
+            self._retrain_category_model(cursor, user_id)
+            self._rebuild_monthly_totals(cursor, user_id)
+            self._rebuild_amount_sketches(cursor, user_id)
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return counts
+
     def delete_expense(self, expense_id: int, user_id: int) -> bool:
-        """Delete an expense"""
+        """Delete an expense; False if the user has no such (unarchived) expense"""
         try:
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self._connect(user_id)
             cursor = conn.cursor()
 
+            old = self._fetch_expense(cursor, expense_id, user_id)
+            self._audit(cursor, user_id, expense_id, "delete")
             cursor.execute(
                 "DELETE FROM expenses WHERE id = ? AND user_id = ?",
                 (expense_id, user_id)
             )
+            deleted = cursor.rowcount > 0
+            if old:
+                self._log_change(cursor, user_id, expense_id, "delete")
+                self._apply_stats(cursor, user_id, old[1], old[4], -1, -old[0])
+                self._apply_monthly_total(cursor, user_id, old[1], old[4], old[3], -1, -old[0])
+                self._train_category_model(cursor, user_id, old[1], old[2], -1)
+                self._refresh_date_bounds(cursor, user_id)
             conn.commit()
             conn.close()
-            return True
+            return deleted
         except Exception:
             return False
 
-    def update_expense(self, expense_id: int, user_id: int, amount: float, category: str, description: str, date: str) -> bool:
-        """Update an expense"""
+    def update_expense(self, expense_id: int, user_id: int, amount: float, category: str, description: str, date: str,
+                       currency: Optional[str] = None) -> bool:
+        """Update an expense; the currency is kept unless a new one is given.
+
+        False if the user has no such (unarchived) expense.
+        """
         try:
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self._connect(user_id)
             cursor = conn.cursor()
 
+            old = self._fetch_expense(cursor, expense_id, user_id)
+            if not old:
+                # Nothing to update; return before the category lookup can create a category
+                conn.close()
+                return False
+            currency = currency or old[4]
+            before = self._budget_usage(cursor, user_id, category, date)
             cursor.execute(
-                "UPDATE expenses SET amount = ?, category = ?, description = ?, date = ? WHERE id = ? AND user_id = ?",
-                (amount, category, description, date, expense_id, user_id)
+                """UPDATE expenses SET amount = ?, category_id = ?, description = ?, day = ?,
+                   currency = COALESCE(?, currency) WHERE id = ? AND user_id = ?""",
+                (amount, self._category_id(cursor, user_id, category), description, to_day(date), currency,
+                 expense_id, user_id)
             )
+            self._audit(cursor, user_id, expense_id, "update")
+            self._log_change(cursor, user_id, expense_id, "upsert",
+                             (amount, category, description, date, currency))
+            self._apply_stats(cursor, user_id, old[1], old[4], -1, -old[0])
+            self._apply_stats(cursor, user_id, category, currency, 1, amount)
+            self._apply_monthly_total(cursor, user_id, old[1], old[4], old[3], -1, -old[0])
+            self._apply_monthly_total(cursor, user_id, category, currency, date, 1, amount)
+            self._raise_budget_alerts(cursor, user_id, category, date, before)
+            if (old[1], old[2]) != (category, description):
+                self._train_category_model(cursor, user_id, old[1], old[2], -1)
+                self._train_category_model(cursor, user_id, category, description)
+            self._refresh_date_bounds(cursor, user_id)
             conn.commit()
             conn.close()
             return True
         except Exception:
             return False
 
-    def set_budget(self, user_id: int, category: str, amount: float, month: int, year: int) -> bool:
+    def set_budget(self, user_id: int, category: str, amount: float, month: int, year: int,
+                   currency: Optional[str] = None) -> bool:
         """Set budget for a category"""
         try:
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self._connect(user_id)
             cursor = conn.cursor()
 
+            month_start = f"{year:04d}-{month:02d}-01"
+            before = self._budget_usage(cursor, user_id, category, month_start)
             cursor.execute(
-                "INSERT OR REPLACE INTO budgets (user_id, category, amount, month, year) VALUES (?, ?, ?, ?, ?)",
-                (user_id, category, amount, month, year)
+                "INSERT OR REPLACE INTO budgets (user_id, category_id, amount, month, year, currency) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, self._category_id(cursor, user_id, category), amount, month, year,
+                 currency or config.BASE_CURRENCY)
             )
+            # A lower budget can put spend already recorded past a threshold
+            self._raise_budget_alerts(cursor, user_id, category, month_start, before)
             conn.commit()
             conn.close()
             return True
         except Exception:
             return False
 
-    def get_budgets(self, user_id: int, month: int, year: int) -> pd.DataFrame:
-        """Get budgets for a specific month/year"""
-        conn = sqlite3.connect('expense_tracker.db')
+    def set_budgets_bulk(self, user_id: int, rows: List[Tuple]) -> int:
+        """Upsert many budgets in one transaction; rows are (category, month, year, amount, currency)"""
+        conn = self._connect(user_id)
+        try:
+            with conn:
+                cursor = conn.cursor()
+                for category, month, year, amount, currency in rows:
+                    month_start = f"{year:04d}-{month:02d}-01"
+                    before = self._budget_usage(cursor, user_id, category, month_start)
+                    cursor.execute(
+                        """INSERT INTO budgets (user_id, category_id, amount, month, year, currency)
+                           VALUES (?, ?, ?, ?, ?, ?)
+                           ON CONFLICT(user_id, category_id, month, year) DO UPDATE SET
+                               amount = excluded.amount, currency = excluded.currency""",
+                        (user_id, self._category_id(cursor, user_id, category), amount, month, year,
+                         currency or config.BASE_CURRENCY)
+                    )
+                    self._raise_budget_alerts(cursor, user_id, category, month_start, before)
+            return len(rows)
+        finally:
+            conn.close()
+
+    def get_budgets(self, user_id: int, month: int, year: int, months: int = 1) -> pd.DataFrame:
+        """Get budgets for a specific month/year, or for `months` consecutive months starting there.
+
+        The range form adds month and year columns.
+        """
+        conn = self._connect_read(user_id)
+        if months == 1:
+            query = """
+                SELECT c.name AS category, b.amount, b.currency
+                FROM budgets b JOIN categories c ON c.id = b.category_id
+                WHERE b.user_id = ? AND b.month = ? AND b.year = ?
+            """
+            params = (user_id, month, year)
+        else:
+            first = year * 12 + month - 1
+            query = """
+                SELECT c.name AS category, b.month, b.year, b.amount, b.currency
+                FROM budgets b JOIN categories c ON c.id = b.category_id
+                WHERE b.user_id = ? AND b.year * 12 + b.month - 1 BETWEEN ? AND ?
+                ORDER BY b.year, b.month, c.name
+            """
+            params = (user_id, first, first + months - 1)
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        return df
+
+    def get_budget_alerts(self, user_id: int, include_dismissed: bool = False, limit: int = 20) -> pd.DataFrame:
+        """A user's budget threshold alerts, newest first"""
+        conn = self._connect_read(user_id)
+        query = f"""
+            SELECT {', '.join(ALERT_COLUMNS)}
+            FROM budget_alerts
+            WHERE user_id = ? {'' if include_dismissed else 'AND dismissed = 0'}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """
+        df = pd.read_sql_query(query, conn, params=(user_id, limit))
+        conn.close()
+        return df
+
+    def dismiss_budget_alerts(self, user_id: int, alert_ids: Optional[List[int]] = None) -> bool:
+        """Mark alerts (all of a user's when `alert_ids` is None) as seen"""
+        try:
+            conn = self._connect(user_id)
+            cursor = conn.cursor()
+            if alert_ids is None:
+                cursor.execute("UPDATE budget_alerts SET dismissed = 1 WHERE user_id = ?", (user_id,))
+            else:
+                cursor.executemany("UPDATE budget_alerts SET dismissed = 1 WHERE id = ? AND user_id = ?",
+                                   [(alert_id, user_id) for alert_id in alert_ids])
+            conn.commit()
+            conn.close()
+            return True
+        except Exception:
+            return False
+
+    def add_recurring_expense(self, user_id: int, amount: float, category: str, description: str,
+                              frequency: str, start_date: str, interval: int = 1,
+                              cron: Optional[str] = None, end_date: Optional[str] = None,
+                              currency: Optional[str] = None) -> bool:
+        """Create a recurring expense rule"""
+        try:
+            conn = self._connect(user_id)
+            cursor = conn.cursor()
+
+            cursor.execute(
+                """INSERT INTO recurring_expenses
+                   (user_id, amount, category, description, frequency, interval, cron, start_date, end_date, currency)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, amount, category, description, frequency, interval, cron, start_date, end_date,
+                 currency or config.BASE_CURRENCY)
+            )
+            conn.commit()
+            conn.close()
+            return True
+        except Exception:
+            return False
+
+    def get_recurring_expenses(self, user_id: int) -> pd.DataFrame:
+        """Get active recurring expense rules for a user"""
+        conn = self._connect_read(user_id)
         query = """
-            SELECT category, amount
-            FROM budgets 
-            WHERE user_id = ? AND month = ? AND year = ?
+            SELECT id, amount, category, description, frequency, interval, cron,
+                   start_date, end_date, materialized_through, currency
+            FROM recurring_expenses
+            WHERE user_id = ? AND active = 1
+            ORDER BY start_date
         """
-        df = pd.read_sql_query(query, conn, params=(user_id, month, year))
+        df = pd.read_sql_query(query, conn, params=(user_id,))
         conn.close()
         return df
+
+    def deactivate_recurring_expense(self, rule_id: int, user_id: int) -> bool:
+        """Stop a recurring rule; already materialized expenses are kept"""
+        try:
+            conn = self._connect(user_id)
+            cursor = conn.cursor()
+
+            cursor.execute(
+                "UPDATE recurring_expenses SET active = 0 WHERE id = ? AND user_id = ?",
+                (rule_id, user_id)
+            )
+            conn.commit()
+            conn.close()
+            return True
+        except Exception:
+            return False
+
+    def get_due_recurring_expenses(self, until: str) -> pd.DataFrame:
+        """Get active rules for all users whose high-water mark is behind `until`.
+
+        Scans every shard; the `shard` column holds the file each rule lives in.
+        """
+        query = """
+            SELECT id, user_id, amount, category, description, frequency, interval, cron,
+                   start_date, end_date, materialized_through, currency
+            FROM recurring_expenses
+            WHERE active = 1
+              AND start_date <= ?
+              AND (materialized_through IS NULL OR materialized_through < ?)
+              AND (end_date IS NULL OR materialized_through IS NULL OR materialized_through < end_date)
+        """
+        frames = []
+        for path in self.router.shard_paths():
+            self.ensure_schema(path)
+            conn = querylog.connect(path)
+            df = pd.read_sql_query(query, conn, params=(until, until))
+            conn.close()
+            df['shard'] = path
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True)
+
+    def materialize_recurring(self, shard: str, rows: List[Tuple], watermarks: List[Tuple[str, int]]) -> int:
+        """Insert occurrences and advance their rules' high-water marks in one transaction.
+
+        `rows` are (user_id, amount, category, description, date, recurring_id,
+        currency) tuples and `watermarks` are (materialized_through, rule_id) pairs, all
+        belonging to the shard file `shard`. Returns the number of expenses
+        actually inserted.
+        """
+        conn = querylog.connect(shard)
+        try:
+            with conn:
+                cursor = conn.cursor()
+                inserted = 0
+                for row in rows:
+                    # Row-by-row inside the one transaction so stats only count rows
+                    # that INSERT OR IGNORE actually added
+                    before = self._budget_usage(cursor, row[0], row[2], row[4])
+                    cursor.execute(
+                        """INSERT OR IGNORE INTO expenses
+                           (user_id, amount, category_id, description, day, recurring_id, currency)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (row[0], row[1], self._category_id(cursor, row[0], row[2]), row[3], to_day(row[4]),
+                         row[5], row[6])
+                    )
+                    if cursor.rowcount:
+                        # Helpers insert rows of their own, so the expense id is read before they run
+                        expense_id = cursor.lastrowid
+                        self._apply_monthly_total(cursor, row[0], row[2], row[6], row[4], 1, row[1])
+                        self._raise_budget_alerts(cursor, row[0], row[2], row[4], before)
+                        self._audit(cursor, row[0], expense_id, "insert")
+                        self._log_change(cursor, row[0], expense_id, "upsert",
+                                         (row[1], row[2], row[3], row[4], row[6]))
+                        self._apply_stats(cursor, row[0], row[2], row[6], 1, row[1], row[4])
+                        self._train_category_model(cursor, row[0], row[2], row[3])
+                        inserted += 1
+                cursor.executemany(
+                    "UPDATE recurring_expenses SET materialized_through = ? WHERE id = ?",
+                    watermarks
+                )
+            return inserted
+        finally:
+            conn.close()
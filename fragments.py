@@ -0,0 +1,105 @@
+# fragments.py
+"""Page sections that rerun on their own, and the data they depend on.
+
+A widget change inside a section (an st.fragment) reruns only that
+section: app.py, the sidebar and the rest of the page are left as drawn.
+Pages load their data through a PageData, which loads each named dataset
+at most once per full run. A section declares the datasets it uses and
+receives them from the PageData of the full run that drew it, so its own
+reruns issue no storage queries for them. Anything that writes reruns the
+whole app (st.rerun()), which builds a fresh PageData.
+"""
+import functools
+from typing import Any, Callable, Dict, Iterable
+import streamlit as st
+from streamlit.errors import StreamlitAPIException
+from backend import StorageBackend
+from currency import convert_frame
+from prefetch import get_prefetcher
+from rolling import get_rolling_stats
+
+# Dataset name -> loader; loaders get the PageData so datasets can build on each other
+DATASETS: Dict[str, Callable[["PageData"], Any]] = {}
+
+
+def dataset(name: str):
+    """Register a loader for the dataset `name`"""
+    def register(loader: Callable[["PageData"], Any]):
+        DATASETS[name] = loader
+        return loader
+    return register
+
+
+class PageData:
+    """Datasets of one user in one display currency, each loaded on first use"""
+
+    def __init__(self, db: StorageBackend, user_id: int, base: str):
+        self.db = db
+        self.user_id = user_id
+        self.base = base
+        self._loaded: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._loaded:
+            self._loaded[name] = DATASETS[name](self)
+        return self._loaded[name]
+
+    def load(self, names: Iterable[str]) -> Dict[str, Any]:
+        return {name: self[name] for name in names}
+
+
+@dataset("version")
+def _version(data: PageData) -> int:
+    return data.db.get_user_stats(data.user_id)['version']
+
+
+@dataset("expenses")
+def _expenses(data: PageData):
+    prefetched = get_prefetcher().take(st.session_state, ("expenses", data.base), lambda: data["version"])
+    if prefetched is not None:
+        return prefetched
+    return convert_frame(data.db.get_expenses(data.user_id), data.base)
+
+
+@dataset("archive_horizon")
+def _archive_horizon(data: PageData):
+    return data.db.get_archive_horizon(data.user_id)
+
+
+@dataset("editable_expenses")
+def _editable_expenses(data: PageData):
+    # Archived history is read-only, so only the hot range is loaded for editing
+    return convert_frame(data.db.get_expenses(data.user_id, start_date=data["archive_horizon"]), data.base)
+
+
+@dataset("rolling")
+def _rolling(data: PageData):
+    return get_rolling_stats(data["expenses"], data.user_id, data.base, data["version"])
+
+
+@dataset("categories")
+def _categories(data: PageData):
+    return data.db.get_categories(data.user_id)['name'].tolist()
+
+
+def section(*dependencies: str):
+    """Make a page function an independently rerunning section that uses `dependencies`.
+
+    The section is called with the page's PageData and gets each declared
+    dataset as a keyword argument.
+    """
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        def run(data: PageData, *args, **kwargs):
+            return func(data, *args, **data.load(dependencies), **kwargs)
+        return st.fragment(run)
+    return decorator
+
+
+def rerun_section():
+    """Rerun only the calling section; the whole app if a full run is drawing it"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # Fragment-scoped reruns are only allowed while the fragment itself is rerunning
+        st.rerun()
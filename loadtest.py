@@ -0,0 +1,292 @@
+# loadtest.py
+"""Load-test the views with concurrent simulated sessions.
+
+Each session is a thread holding one headless Streamlit session (AppTest)
+for a seeded user. It repeatedly picks an operation from a weighted mix:
+rendering a page, or writing through the backend the way the page forms do.
+SQLite connections are instrumented to time write statements (which include
+any wait for the write lock) and to count "database is locked" errors.
+
+Usage: python loadtest.py [--backend sqlite|memory] [--users N] [--expenses N]
+                          [--sessions N] [--processes N] [--duration SECONDS]
+                          [--mix dashboard=30,add=20,...] [--busy-timeout SECONDS]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import numpy as np
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from backend import StorageBackend
+from benchmark import CATEGORIES, seed
+from querylog import MonitoredConnection, MonitoredCursor
+
+# Page operations render a view; the others call the backend like the view forms do
+PAGES = {
+    "dashboard": ("views.dashboard", "show_dashboard"),
+    "add_page": ("views.add_expense", "show_add_expense"),
+    "manage": ("views.manage_expenses", "show_manage_expenses"),
+    "budget": ("views.budget", "show_budget_tracker"),
+    "export": ("views.export", "show_export_data"),
+}
+WRITES = ("add", "edit", "delete")
+DEFAULT_MIX = "dashboard=30,add_page=10,manage=15,budget=10,export=5,add=20,edit=7,delete=3"
+
+# Script run by each simulated session; the page and backend come from session state
+DRIVER = """
+import importlib
+import streamlit as st
+from loadtest import PAGES
+module, function = PAGES[st.session_state["loadtest_page"]]
+getattr(importlib.import_module(module), function)(st.session_state["loadtest_db"])
+"""
+
+LOCK_ERRORS = ("database is locked", "database table is locked", "database is busy")
+
+
+class SqliteCounters:
+    """Process-wide SQLite statement timings, filled in by the instrumented connections"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = 0
+        self.write_ms: List[float] = []
+        self.lock_errors = 0
+
+    def record(self, sql: str, elapsed_ms: float, error: Optional[Exception] = None):
+        is_write = sql.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE", "COMMIT", "BEGIN ")
+        with self._lock:
+            self.statements += 1
+            if is_write:
+                self.write_ms.append(elapsed_ms)
+            if error is not None and any(message in str(error) for message in LOCK_ERRORS):
+                self.lock_errors += 1
+
+
+counters = SqliteCounters()
+
+
+class _InstrumentedCursor(MonitoredCursor):
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            result = method(sql, *args)
+        except sqlite3.OperationalError as e:
+            counters.record(sql, (time.perf_counter() - start) * 1000, e)
+            raise
+        counters.record(sql, (time.perf_counter() - start) * 1000)
+        return result
+
+    def execute(self, sql, *args):
+        return self._timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(super().executemany, sql, *args)
+
+
+class _InstrumentedConnection(MonitoredConnection):
+    def cursor(self, factory=_InstrumentedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        except sqlite3.OperationalError as e:
+            counters.record("COMMIT", (time.perf_counter() - start) * 1000, e)
+            raise
+        counters.record("COMMIT", (time.perf_counter() - start) * 1000)
+
+
+def instrument_sqlite(busy_timeout: float):
+    """Route every sqlite3.connect in this process through the instrumented connection"""
+    connect = sqlite3.connect
+
+    def instrumented_connect(*args, **kwargs):
+        # The backend asks for monitored connections; the instrumented ones extend them
+        if kwargs.get("factory", MonitoredConnection) is MonitoredConnection:
+            kwargs["factory"] = _InstrumentedConnection
+        kwargs.setdefault("timeout", busy_timeout)
+        return connect(*args, **kwargs)
+    sqlite3.connect = instrumented_connect
+
+
+def make_backend(name: str, db_path: Optional[str]) -> StorageBackend:
+    """Backend for a worker; SQLite workers share the seeded file"""
+    if name == "memory":
+        from memory_backend import InMemoryBackend
+        return InMemoryBackend()
+    from database import ExpenseTrackerDB
+    from storage import StorageRouter
+    return ExpenseTrackerDB(router=StorageRouter(db_path=db_path, shard_mode="none"))
+
+
+def parse_mix(spec: str) -> Tuple[List[str], List[float]]:
+    """'dashboard=30,add=20' -> (operations, weights)"""
+    operations, weights = [], []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PAGES and name not in WRITES:
+            raise ValueError(f"Unknown operation in mix: {name}")
+        operations.append(name)
+        weights.append(float(weight or 1))
+    return operations, weights
+
+
+def perform_write(db: StorageBackend, user_id: int, operation: str, rng: random.Random) -> bool:
+    """One write, as submitted by the Add/Manage Expenses forms"""
+    day = (date.today() - timedelta(days=rng.randint(0, 365))).isoformat()
+    amount = round(rng.uniform(10, 2000), 2)
+    if operation == "add":
+        return db.add_expense(user_id, amount, rng.choice(CATEGORIES), "load test", day)
+    # Edits and deletes target a recent expense; keep the history size stable by adding one back
+    recent = db.get_expenses(user_id, start_date=(date.today() - timedelta(days=30)).isoformat())
+    if recent.empty:
+        return db.add_expense(user_id, amount, rng.choice(CATEGORIES), "load test", day)
+    expense_id = int(recent['id'].iloc[rng.randrange(len(recent))])
+    if operation == "edit":
+        return db.update_expense(expense_id, user_id, amount, rng.choice(CATEGORIES), "load test edit", day)
+    return (db.delete_expense(expense_id, user_id)
+            and db.add_expense(user_id, amount, rng.choice(CATEGORIES), "load test", day))
+
+
+def run_session(db: StorageBackend, user: Dict, mix: Tuple[List[str], List[float]], deadline: float,
+                seed_value: int, results: Dict[str, List[Tuple[float, bool]]], results_lock: threading.Lock):
+    """One simulated user session until `deadline`"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed_value)
+    app = AppTest.from_string(DRIVER, default_timeout=120)
+    app.session_state["user"] = user
+    app.session_state["loadtest_db"] = db
+    operations, weights = mix
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        start = time.perf_counter()
+        if operation in PAGES:
+            app.session_state["loadtest_page"] = operation
+            try:
+                app.run()
+                ok = not app.exception
+            except Exception:
+                ok = False
+        else:
+            ok = perform_write(db, user["id"], operation, rng)
+        elapsed = (time.perf_counter() - start) * 1000
+        with results_lock:
+            results.setdefault(operation, []).append((elapsed, ok))
+
+
+def run_worker(backend: str, db_path: Optional[str], users: List[Dict], sessions: int, duration: float,
+               mix_spec: str, busy_timeout: float, worker: int, db: Optional[StorageBackend] = None) -> Dict:
+    """Run `sessions` threads in this process; returns raw samples and SQLite counters"""
+    import logging
+    import warnings
+    logging.disable(logging.WARNING)
+    warnings.simplefilter("ignore")
+    if backend == "sqlite":
+        instrument_sqlite(busy_timeout)
+    db = db or make_backend(backend, db_path)
+    mix = parse_mix(mix_spec)
+    results: Dict[str, List[Tuple[float, bool]]] = {}
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=run_session, daemon=True, args=(
+            db, users[(worker * sessions + i) % len(users)], mix, deadline,
+            worker * 1000 + i, results, results_lock))
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"results": results, "statements": counters.statements,
+            "write_ms": counters.write_ms, "lock_errors": counters.lock_errors}
+
+
+def _percentiles(values: List[float]) -> List[float]:
+    return np.percentile(values, [50, 95, 99]).tolist() if values else [0.0, 0.0, 0.0]
+
+
+def report(outcomes: List[Dict], elapsed: float):
+    merged: Dict[str, List[Tuple[float, bool]]] = {}
+    for outcome in outcomes:
+        for operation, samples in outcome["results"].items():
+            merged.setdefault(operation, []).extend(samples)
+
+    print(f"  {'operation':<10} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    everything = []
+    for operation in sorted(merged):
+        samples = merged[operation]
+        everything += samples
+        p50, p95, p99 = _percentiles([ms for ms, _ in samples])
+        errors = sum(1 for _, ok in samples if not ok)
+        print(f"  {operation:<10} {len(samples):>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {errors:>7}")
+    p50, p95, p99 = _percentiles([ms for ms, _ in everything])
+    errors = sum(1 for _, ok in everything if not ok)
+    print(f"  {'all':<10} {len(everything):>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {errors:>7}")
+    print(f"  throughput {len(everything) / elapsed:.1f} ops/s")
+
+    statements = sum(outcome["statements"] for outcome in outcomes)
+    if statements:
+        write_ms = [ms for outcome in outcomes for ms in outcome["write_ms"]]
+        w50, w95, w99 = _percentiles(write_ms)
+        print(f"  SQLite: {statements} statements; write statements p50/p95/p99 "
+              f"{w50:.2f}/{w95:.2f}/{w99:.2f} ms (includes lock waits), max {max(write_ms, default=0):.1f} ms; "
+              f"{sum(outcome['lock_errors'] for outcome in outcomes)} locked/busy errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--db", default=None, help="Existing SQLite catalog to load (default: seed a temporary one)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--expenses", type=int, default=500, help="Expenses seeded per user")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions (threads) per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted operations, e.g. dashboard=30,add=20")
+    parser.add_argument("--busy-timeout", type=float, default=5.0,
+                        help="Seconds a connection waits for a lock before 'database is locked'")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+    if args.backend == "memory" and args.processes > 1:
+        parser.error("the memory backend cannot be shared between processes")
+
+    db = make_backend(args.backend, args.db or os.path.join(
+        tempfile.mkdtemp(prefix="daily_budget_load_"), "load.db"))
+    if args.db:
+        conn = sqlite3.connect(args.db)
+        users = [{"id": row[0], "username": row[1], "email": row[2]}
+                 for row in conn.execute("SELECT id, username, email FROM users")]
+        conn.close()
+    else:
+        print(f"Seeding {args.users} users × {args.expenses} expenses...")
+        seed(db, args.users, args.expenses, random.Random(42))
+        users = [db.authenticate_user(f"bench{i}", "benchmark") for i in range(args.users)]
+    if not users:
+        parser.error("no users to simulate")
+    db_path = getattr(db, "db_path", None)
+
+    print(f"\n{args.backend} backend — {args.processes} process(es) × {args.sessions} sessions, "
+          f"{len(users)} users, {args.duration:.0f} s")
+    started = time.perf_counter()
+    worker_args = [(args.backend, db_path, users, args.sessions, args.duration, args.mix, args.busy_timeout, worker)
+                   for worker in range(args.processes)]
+    if args.processes == 1:
+        outcomes = [run_worker(*worker_args[0], db=db)]
+    else:
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            outcomes = pool.starmap(run_worker, worker_args)
+    report(outcomes, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
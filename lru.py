@@ -0,0 +1,44 @@
+# lru.py
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Tuple
+
+
+class LRUCache:
+    """Process-wide cache keeping the `max_size` most recently used entries; safe to share between threads"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """The value cached for `key`, marking it recently used; `default` if there is none"""
+        return self.get_many([key], default)[0]
+
+    def get_many(self, keys: Iterable[Hashable], default: Any = None) -> List[Any]:
+        """Like `get` for several keys under one lock acquisition"""
+        values = []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    values.append(self._entries[key])
+                else:
+                    values.append(default)
+        return values
+
+    def put(self, key: Hashable, value: Any):
+        """Cache a value, evicting the least recently used entries past `max_size`"""
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[Hashable, Any]]):
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,582 @@
+# memory_backend.py
+import secrets
+import threading
+import numpy as np
+import pandas as pd
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import config
+from backend import CHANGE_COLUMNS, StorageBackend
+from alerts import ALERT_COLUMNS, crossed_thresholds, month_of, usage
+from categories import CATEGORY_COLUMNS, CUSTOM_CATEGORY_ICON, DEFAULT_CATEGORIES
+from categorizer import feature_counts
+from currency import get_rates
+from sketches import SKETCH_COLUMNS, bucket_of
+
+
+class _ExpenseColumns:
+    """One user's expenses as growable NumPy columns; categories are stored by id"""
+
+    def __init__(self, capacity: int = 64):
+        self.size = 0
+        self.id = np.empty(capacity, dtype=np.int64)
+        self.amount = np.empty(capacity, dtype=np.float64)
+        self.category_id = np.empty(capacity, dtype=np.int32)
+        self.description = np.empty(capacity, dtype=object)
+        self.date = np.empty(capacity, dtype='datetime64[D]')
+        self.created_at = np.empty(capacity, dtype=object)
+        self.recurring_id = np.empty(capacity, dtype=np.int64)  # -1 when not recurring
+        self.currency = np.empty(capacity, dtype=object)
+
+    _columns = ('id', 'amount', 'category_id', 'description', 'date', 'created_at', 'recurring_id', 'currency')
+
+    def _grow(self, needed: int):
+        capacity = len(self.id)
+        if self.size + needed <= capacity:
+            return
+        new_capacity = max(capacity * 2, self.size + needed)
+        for column in self._columns:
+            old = getattr(self, column)
+            new = np.empty(new_capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, column, new)
+
+    def append(self, rows: List[Tuple]):
+        """Append (id, amount, category_id, description, date, created_at, recurring_id, currency) rows"""
+        self._grow(len(rows))
+        start, end = self.size, self.size + len(rows)
+        for column, values in zip(self._columns, zip(*rows)):
+            getattr(self, column)[start:end] = values
+        self.size = end
+
+    def position(self, expense_id: int) -> Optional[int]:
+        matches = np.flatnonzero(self.id[:self.size] == expense_id)
+        return int(matches[0]) if len(matches) else None
+
+    def remove(self, position: int):
+        keep = np.ones(self.size, dtype=bool)
+        keep[position] = False
+        for column in self._columns:
+            values = getattr(self, column)
+            values[:self.size - 1] = values[:self.size][keep]
+        self.size -= 1
+
+    def frame(self, category_names: np.ndarray) -> pd.DataFrame:
+        """Rows in get_expenses form; `category_names` maps category ids to names"""
+        n = self.size
+        df = pd.DataFrame({
+            'id': self.id[:n],
+            'amount': self.amount[:n],
+            'category': category_names[self.category_id[:n]],
+            'description': self.description[:n],
+            'date': np.datetime_as_string(self.date[:n], unit='D').astype(object),
+            'created_at': self.created_at[:n],
+            'currency': self.currency[:n],
+        })
+        # Newest first, matching ORDER BY date DESC
+        order = np.argsort(-self.date[:n].astype(np.int64), kind='stable')
+        return df.iloc[order].reset_index(drop=True)
+
+
+class InMemoryBackend(StorageBackend):
+    """Pure in-memory storage with columnar NumPy arrays per user.
+
+    Nothing touches disk, so it isolates Python/pandas/Plotly cost from
+    storage cost in benchmarks and lets tests run in parallel without locks.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users: Dict[int, Dict] = {}
+        self._expenses: Dict[int, _ExpenseColumns] = {}
+        self._budgets: Dict[int, Dict[Tuple[str, int, int], Tuple[float, str]]] = {}
+        self._recurring: Dict[int, Dict] = {}
+        self._next_user_id = 1
+        self._next_expense_id = 1
+        self._next_rule_id = 1
+        self._versions: Dict[int, int] = {}
+        self._tokens: Dict[str, Tuple[int, datetime]] = {}
+        # Change log: latest (seq, op, amount, category, description, date,
+        # currency, changed_at) per expense id, plus [last_seq, floor_seq] per user
+        self._changes: Dict[int, Dict[int, Tuple]] = {}
+        self._change_state: Dict[int, List[int]] = {}
+        # Categorizer training counts: expenses per category and (category, feature) counts per user
+        self._model_docs: Dict[int, Counter] = {}
+        self._model_features: Dict[int, Counter] = {}
+        # Running spend per user keyed by (month, category, currency), and budget
+        # alerts keyed by (category, month, year, threshold)
+        self._monthly_totals: Dict[int, Counter] = {}
+        # Amount sketch counts per user keyed by (month, category, currency, bucket)
+        self._sketches: Dict[int, Counter] = {}
+        self._alerts: Dict[int, Dict[Tuple, Dict]] = {}
+        self._next_alert_id = 1
+        # Category dimension: rows by id (built-in ones first, with user_id None),
+        # ids by (user_id, name), and names indexed by id for decoding columns
+        self._categories: Dict[int, Dict] = {}
+        self._category_ids: Dict[Tuple[Optional[int], str], int] = {}
+        self._category_names: List[str] = [""]
+        for name, icon, description in DEFAULT_CATEGORIES:
+            self._new_category(None, name, icon, description)
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _new_category(self, user_id: Optional[int], name: str, icon: str, description: str = "") -> int:
+        category_id = len(self._category_names)
+        self._categories[category_id] = {'id': category_id, 'user_id': user_id, 'name': name, 'icon': icon,
+                                         'description': description}
+        self._category_ids[(user_id, name)] = category_id
+        self._category_names.append(name)
+        return category_id
+
+    def _find_category(self, user_id: int, name: str) -> Optional[int]:
+        """Id of a built-in category or one of the user's own, by name"""
+        return self._category_ids.get((None, name), self._category_ids.get((user_id, name)))
+
+    def _category_id(self, user_id: int, name: str) -> int:
+        """Id for a category name, creating a user category the first time a name is used"""
+        category_id = self._find_category(user_id, name)
+        if category_id is None:
+            category_id = self._new_category(user_id, name, CUSTOM_CATEGORY_ICON)
+        return category_id
+
+    def _names(self) -> np.ndarray:
+        return np.array(self._category_names, dtype=object)
+
+    def _touch(self, user_id: int):
+        """Bump a user's data version after a write"""
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def _log_change(self, user_id: int, expense_id: int, op: str, row: Optional[Tuple] = None):
+        """Record the latest change to an expense; an older entry for it is superseded"""
+        state = self._change_state.setdefault(user_id, [0, 0])
+        state[0] += 1
+        changed_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self._changes.setdefault(user_id, {})[expense_id] = (state[0], op, *(row or (None,) * 5), changed_at)
+
+    def _train(self, user_id: int, category: str, description: str, sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) one expense from a user's categorizer counts"""
+        docs = self._model_docs.setdefault(user_id, Counter())
+        features = self._model_features.setdefault(user_id, Counter())
+        docs[category] += sign
+        for feature, n in feature_counts(description).items():
+            features[(category, feature)] += sign * n
+        if sign < 0:
+            # Adding an empty Counter drops entries whose count fell to zero
+            self._model_docs[user_id] = docs + Counter()
+            self._model_features[user_id] = features + Counter()
+
+    def _apply_monthly_total(self, user_id: int, category: str, currency: str, date: str, count: int,
+                             amount: float):
+        month = month_of(date)[0]
+        self._monthly_totals.setdefault(user_id, Counter())[(month, category, currency)] += amount
+        sketch = self._sketches.setdefault(user_id, Counter())
+        key = (month, category, currency, bucket_of(amount))
+        sketch[key] += count
+        if sketch[key] <= 0:
+            del sketch[key]
+
+    def _budget_usage(self, user_id: int, category: str, date: str) -> Optional[Tuple[float, float, str]]:
+        """(spent, budget, budget currency) for the category in `date`'s month, or None without a budget"""
+        month_key, month, year = month_of(date)
+        budget = self._budgets.get(user_id, {}).get((category, month, year))
+        if budget is None:
+            return None
+        totals = [(currency, total) for (m, c, currency), total in self._monthly_totals.get(user_id, {}).items()
+                  if m == month_key and c == category]
+        spent = float(np.dot([total for _, total in totals],
+                             get_rates().factors([currency for currency, _ in totals], budget[1]))) if totals else 0.0
+        return spent, budget[0], budget[1]
+
+    def _raise_budget_alerts(self, user_id: int, category: str, date: str, before: Optional[Tuple[float, float, str]]):
+        """Record alert thresholds crossed since `before`, a _budget_usage result taken before the write"""
+        after = self._budget_usage(user_id, category, date)
+        if after is None:
+            return
+        spent, budget, currency = after
+        _, month, year = month_of(date)
+        crossed = crossed_thresholds(usage(*before[:2]) if before else 0.0, usage(spent, budget))
+        if not crossed:
+            return
+        # Only the highest threshold is worth showing; it supersedes lower unread ones
+        alerts = self._alerts.setdefault(user_id, {})
+        for key, alert in alerts.items():
+            if key[:3] == (category, month, year) and alert['threshold'] < crossed[-1]:
+                alert['dismissed'] = True
+        key = (category, month, year, crossed[-1])
+        alert_id = alerts[key]['id'] if key in alerts else self._next_alert_id
+        self._next_alert_id += key not in alerts
+        alerts[key] = {'id': alert_id, 'category': category, 'month': month, 'year': year,
+                       'threshold': crossed[-1], 'spent': spent, 'budget': budget, 'currency': currency,
+                       'created_at': self._now(), 'dismissed': False}
+
+    def _columns_for(self, user_id: int) -> _ExpenseColumns:
+        if user_id not in self._expenses:
+            self._expenses[user_id] = _ExpenseColumns()
+        return self._expenses[user_id]
+
+    def create_user(self, username: str, email: str, password: str) -> bool:
+        """Create new user account"""
+        with self._lock:
+            if any(u['username'] == username or u['email'] == email for u in self._users.values()):
+                return False
+            user_id = self._next_user_id
+            self._next_user_id += 1
+            self._users[user_id] = {
+                'id': user_id, 'username': username, 'email': email,
+                'password_hash': self.hash_password(password),
+            }
+            return True
+
+    def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
+        """Authenticate user login"""
+        password_hash = self.hash_password(password)
+        with self._lock:
+            for user in self._users.values():
+                if user['username'] == username and user['password_hash'] == password_hash:
+                    return {"id": user['id'], "username": user['username'], "email": user['email']}
+        return None
+
+    def create_api_token(self, user_id: int) -> Optional[str]:
+        """Issue an API token for a user"""
+        token = secrets.token_urlsafe(32)
+        now = datetime.now()
+        with self._lock:
+            self._tokens = {h: t for h, t in self._tokens.items() if t[1] > now}
+            self._tokens[self.hash_token(token)] = (user_id, now + timedelta(hours=config.API_TOKEN_TTL_HOURS))
+        return token
+
+    def get_api_token_user(self, token: str) -> Optional[Dict]:
+        """User an unexpired API token belongs to"""
+        with self._lock:
+            entry = self._tokens.get(self.hash_token(token))
+            if entry is None or entry[1] <= datetime.now() or entry[0] not in self._users:
+                return None
+            user = self._users[entry[0]]
+            return {"id": user['id'], "username": user['username'], "email": user['email']}
+
+    def revoke_api_token(self, token: str) -> bool:
+        """Invalidate an API token"""
+        with self._lock:
+            return self._tokens.pop(self.hash_token(token), None) is not None
+
+    def add_expense(self, user_id: int, amount: float, category: str, description: str, date: str,
+                    currency: Optional[str] = None) -> bool:
+        """Add new expense"""
+        try:
+            with self._lock:
+                currency = currency or config.BASE_CURRENCY
+                before = self._budget_usage(user_id, category, date)
+                self._columns_for(user_id).append([(
+                    self._next_expense_id, amount, self._category_id(user_id, category), description,
+                    np.datetime64(date, 'D'), self._now(), -1, currency
+                )])
+                self._log_change(user_id, self._next_expense_id, "upsert",
+                                 (amount, category, description, date, currency))
+                self._train(user_id, category, description)
+                self._apply_monthly_total(user_id, category, currency, date, 1, amount)
+                self._raise_budget_alerts(user_id, category, date, before)
+                self._next_expense_id += 1
+                self._touch(user_id)
+            return True
+        except Exception:
+            return False
+
+    def add_expenses(self, user_id: int, rows: List[Tuple]) -> int:
+        """Add many expenses at once; rows are (amount, category, description, date, currency)"""
+        with self._lock:
+            new_rows = [
+                (self._next_expense_id + i, amount, category, description,
+                 np.datetime64(date, 'D'), self._now(), -1, currency or config.BASE_CURRENCY)
+                for i, (amount, category, description, date, currency) in enumerate(rows)
+            ]
+            self._columns_for(user_id).append([
+                (row[0], row[1], self._category_id(user_id, row[2]), *row[3:]) for row in new_rows])
+            self._next_expense_id += len(new_rows)
+            for row in new_rows:
+                before = self._budget_usage(user_id, row[2], str(row[4]))
+                self._log_change(user_id, row[0], "upsert", (row[1], row[2], row[3], str(row[4]), row[7]))
+                self._train(user_id, row[2], row[3])
+                self._apply_monthly_total(user_id, row[2], row[7], str(row[4]), 1, row[1])
+                self._raise_budget_alerts(user_id, row[2], str(row[4]), before)
+            if new_rows:
+                self._touch(user_id)
+        return len(new_rows)
+
+    def get_user_stats(self, user_id: int) -> Dict:
+        """Get a user's expense count, total, date range and per-category totals"""
+        with self._lock:
+            columns = self._columns_for(user_id)
+            n = columns.size
+            amounts, dates = columns.amount[:n], columns.date[:n]
+            names = self._names()[columns.category_id[:n]]
+            categories = pd.Series(amounts).groupby(names).sum().to_dict() if n else {}
+            breakdown = (list(pd.Series(amounts).groupby([names, columns.currency[:n]])
+                              .sum().items()) if n else [])
+            return {
+                "count": n,
+                "total": float(amounts.sum()),
+                "min_date": str(dates.min()) if n else None,
+                "max_date": str(dates.max()) if n else None,
+                "version": self._versions.get(user_id, 0),
+                "categories": categories,
+                "breakdown": [(category, currency, float(total)) for (category, currency), total in breakdown],
+            }
+
+    def get_expenses(self, user_id: int, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None) -> pd.DataFrame:
+        """Get a user's expenses, newest first, optionally limited to [start_date, end_date]"""
+        with self._lock:
+            df = self._columns_for(user_id).frame(self._names())
+        if start_date:
+            df = df[df['date'] >= start_date]
+        if end_date:
+            df = df[df['date'] <= end_date]
+        return df.reset_index(drop=True) if start_date or end_date else df
+
+    def delete_expense(self, expense_id: int, user_id: int) -> bool:
+        """Delete an expense; False if the user has no such (unarchived) expense"""
+        with self._lock:
+            columns = self._columns_for(user_id)
+            position = columns.position(expense_id)
+            if position is not None:
+                category = self._category_names[columns.category_id[position]]
+                self._train(user_id, category, columns.description[position], -1)
+                self._apply_monthly_total(user_id, category, columns.currency[position],
+                                          str(columns.date[position]), -1, -columns.amount[position])
+                columns.remove(position)
+                self._log_change(user_id, expense_id, "delete")
+                self._touch(user_id)
+        return position is not None
+
+    def update_expense(self, expense_id: int, user_id: int, amount: float, category: str, description: str, date: str,
+                       currency: Optional[str] = None) -> bool:
+        """Update an expense; the currency is kept unless a new one is given.
+
+        False if the user has no such (unarchived) expense.
+        """
+        try:
+            with self._lock:
+                columns = self._columns_for(user_id)
+                position = columns.position(expense_id)
+                if position is not None:
+                    before = self._budget_usage(user_id, category, date)
+                    old_category = self._category_names[columns.category_id[position]]
+                    self._train(user_id, old_category, columns.description[position], -1)
+                    self._train(user_id, category, description)
+                    self._apply_monthly_total(user_id, old_category, columns.currency[position],
+                                              str(columns.date[position]), -1, -columns.amount[position])
+                    columns.amount[position] = amount
+                    columns.category_id[position] = self._category_id(user_id, category)
+                    columns.description[position] = description
+                    columns.date[position] = np.datetime64(date, 'D')
+                    if currency:
+                        columns.currency[position] = currency
+                    self._log_change(user_id, expense_id, "upsert",
+                                     (amount, category, description, date, columns.currency[position]))
+                    self._apply_monthly_total(user_id, category, columns.currency[position], date, 1, amount)
+                    self._raise_budget_alerts(user_id, category, date, before)
+                    self._touch(user_id)
+            return position is not None
+        except Exception:
+            return False
+
+    def get_changes_since(self, user_id: int, seq: int, limit: int = 1000) -> Dict:
+        """Net expense changes after `seq`, oldest first, at most `limit` per batch"""
+        with self._lock:
+            last_seq, floor_seq = self._change_state.get(user_id, [0, 0])
+            if seq < floor_seq or seq > last_seq:
+                return {"changes": pd.DataFrame(columns=CHANGE_COLUMNS), "last_seq": last_seq,
+                        "has_more": False, "reset": True}
+            entries = sorted((entry[0], entry[1], expense_id, *entry[2:7])
+                             for expense_id, entry in self._changes.get(user_id, {}).items() if entry[0] > seq)
+        has_more = len(entries) > limit
+        if has_more:
+            entries = entries[:limit]
+            last_seq = entries[-1][0]
+        return {"changes": pd.DataFrame(entries, columns=CHANGE_COLUMNS), "last_seq": last_seq,
+                "has_more": has_more, "reset": False}
+
+    def compact_change_log(self, before: str) -> int:
+        """Drop entries logged before `before`, raising each user's floor; returns rows removed"""
+        removed = 0
+        with self._lock:
+            for user_id, changes in self._changes.items():
+                old = [expense_id for expense_id, entry in changes.items() if entry[-1] < before]
+                if old:
+                    state = self._change_state[user_id]
+                    state[1] = max(state[1], max(changes[expense_id][0] for expense_id in old))
+                    for expense_id in old:
+                        del changes[expense_id]
+                    removed += len(old)
+        return removed
+
+    def get_category_model(self, user_id: int) -> Tuple[Dict[str, int], pd.DataFrame]:
+        """Training counts of a user's categorizer"""
+        with self._lock:
+            docs = dict(self._model_docs.get(user_id, {}))
+            features = [(category, feature, n)
+                        for (category, feature), n in self._model_features.get(user_id, {}).items()]
+        return docs, pd.DataFrame(features, columns=['category', 'feature', 'count'])
+
+    def get_amount_sketches(self, user_id: int, start_month: Optional[str] = None,
+                            end_month: Optional[str] = None) -> pd.DataFrame:
+        """Amount sketch rows for months in [start_month, end_month]"""
+        with self._lock:
+            rows = [(*key, n) for key, n in self._sketches.get(user_id, {}).items()
+                    if (not start_month or key[0] >= start_month) and (not end_month or key[0] <= end_month)]
+        return pd.DataFrame(rows, columns=SKETCH_COLUMNS)
+
+    def get_categories(self, user_id: int) -> pd.DataFrame:
+        """Built-in categories followed by the user's own"""
+        with self._lock:
+            rows = [dict(category, custom=category['user_id'] is not None)
+                    for category in self._categories.values()
+                    if category['user_id'] is None or category['user_id'] == user_id]
+        df = pd.DataFrame(rows, columns=CATEGORY_COLUMNS + ['user_id'])[CATEGORY_COLUMNS]
+        return df.sort_values(['custom', 'id'], ignore_index=True)
+
+    def add_category(self, user_id: int, name: str, icon: Optional[str] = None, description: str = "") -> bool:
+        """Create a user-defined category"""
+        name = name.strip()
+        with self._lock:
+            if not name or self._find_category(user_id, name) is not None:
+                return False
+            self._new_category(user_id, name, icon or CUSTOM_CATEGORY_ICON, description)
+        return True
+
+    def set_budget(self, user_id: int, category: str, amount: float, month: int, year: int,
+                   currency: Optional[str] = None) -> bool:
+        """Set budget for a category"""
+        with self._lock:
+            month_start = f"{year:04d}-{month:02d}-01"
+            before = self._budget_usage(user_id, category, month_start)
+            self._category_id(user_id, category)
+            self._budgets.setdefault(user_id, {})[(category, month, year)] = (amount, currency or config.BASE_CURRENCY)
+            self._raise_budget_alerts(user_id, category, month_start, before)
+        return True
+
+    def set_budgets_bulk(self, user_id: int, rows: List[Tuple]) -> int:
+        """Upsert many budgets at once; rows are (category, month, year, amount, currency)"""
+        with self._lock:
+            for category, month, year, amount, currency in rows:
+                self.set_budget(user_id, category, amount, month, year, currency)
+        return len(rows)
+
+    def get_budgets(self, user_id: int, month: int, year: int, months: int = 1) -> pd.DataFrame:
+        """Get budgets for a specific month/year, or for `months` consecutive months starting there"""
+        first = year * 12 + month - 1
+        with self._lock:
+            rows = [(category, m, y, amount, currency)
+                    for (category, m, y), (amount, currency) in self._budgets.get(user_id, {}).items()
+                    if first <= y * 12 + m - 1 < first + months]
+        df = pd.DataFrame(rows, columns=['category', 'month', 'year', 'amount', 'currency'])
+        if months == 1:
+            return df[['category', 'amount', 'currency']]
+        return df.sort_values(['year', 'month', 'category'], ignore_index=True)
+
+    def get_budget_alerts(self, user_id: int, include_dismissed: bool = False, limit: int = 20) -> pd.DataFrame:
+        """A user's budget threshold alerts, newest first"""
+        with self._lock:
+            alerts = [dict(alert) for alert in self._alerts.get(user_id, {}).values()
+                      if include_dismissed or not alert['dismissed']]
+        alerts.sort(key=lambda alert: (alert['created_at'], alert['id']), reverse=True)
+        return pd.DataFrame(alerts[:limit], columns=ALERT_COLUMNS)
+
+    def dismiss_budget_alerts(self, user_id: int, alert_ids: Optional[List[int]] = None) -> bool:
+        """Mark alerts (all of a user's when `alert_ids` is None) as seen"""
+        with self._lock:
+            for alert in self._alerts.get(user_id, {}).values():
+                if alert_ids is None or alert['id'] in alert_ids:
+                    alert['dismissed'] = True
+        return True
+
+    def add_recurring_expense(self, user_id: int, amount: float, category: str, description: str,
+                              frequency: str, start_date: str, interval: int = 1,
+                              cron: Optional[str] = None, end_date: Optional[str] = None,
+                              currency: Optional[str] = None) -> bool:
+        """Create a recurring expense rule"""
+        with self._lock:
+            rule_id = self._next_rule_id
+            self._next_rule_id += 1
+            self._recurring[rule_id] = {
+                'id': rule_id, 'user_id': user_id, 'amount': amount, 'category': category,
+                'description': description, 'frequency': frequency, 'interval': interval,
+                'cron': cron, 'start_date': start_date, 'end_date': end_date,
+                'materialized_through': None, 'active': True,
+                'currency': currency or config.BASE_CURRENCY,
+            }
+        return True
+
+    _rule_columns = ['id', 'amount', 'category', 'description', 'frequency', 'interval', 'cron',
+                     'start_date', 'end_date', 'materialized_through', 'currency']
+
+    def get_recurring_expenses(self, user_id: int) -> pd.DataFrame:
+        """Get active recurring expense rules for a user"""
+        with self._lock:
+            rules = [dict(rule) for rule in self._recurring.values()
+                     if rule['user_id'] == user_id and rule['active']]
+        df = pd.DataFrame(rules, columns=self._rule_columns + ['user_id'])[self._rule_columns]
+        return df.sort_values('start_date').reset_index(drop=True)
+
+    def deactivate_recurring_expense(self, rule_id: int, user_id: int) -> bool:
+        """Stop a recurring rule; already materialized expenses are kept"""
+        with self._lock:
+            rule = self._recurring.get(rule_id)
+            if rule and rule['user_id'] == user_id:
+                rule['active'] = False
+        return True
+
+    def get_due_recurring_expenses(self, until: str) -> pd.DataFrame:
+        """Get active rules for all users whose high-water mark is behind `until`"""
+        with self._lock:
+            rules = [dict(rule) for rule in self._recurring.values()
+                     if rule['active'] and rule['start_date'] <= until
+                     and (rule['materialized_through'] is None or rule['materialized_through'] < until)
+                     and (rule['end_date'] is None or rule['materialized_through'] is None
+                          or rule['materialized_through'] < rule['end_date'])]
+        columns = ['id', 'user_id'] + self._rule_columns[1:]
+        df = pd.DataFrame(rules, columns=columns)
+        df['shard'] = self.name
+        return df
+
+    def materialize_recurring(self, shard: str, rows: List[Tuple], watermarks: List[Tuple[str, int]]) -> int:
+        """Insert occurrences and advance their rules' high-water marks atomically"""
+        inserted = 0
+        with self._lock:
+            by_user: Dict[int, List[Tuple]] = {}
+            for user_id, amount, category, description, date, recurring_id, currency in rows:
+                columns = self._columns_for(user_id)
+                existing = (columns.recurring_id[:columns.size] == recurring_id) & \
+                    (columns.date[:columns.size] == np.datetime64(date, 'D'))
+                if existing.any():
+                    continue
+                by_user.setdefault(user_id, []).append((
+                    self._next_expense_id, amount, category, description,
+                    np.datetime64(date, 'D'), self._now(), recurring_id, currency
+                ))
+                self._next_expense_id += 1
+                inserted += 1
+            for user_id, user_rows in by_user.items():
+                self._columns_for(user_id).append([
+                    (row[0], row[1], self._category_id(user_id, row[2]), *row[3:]) for row in user_rows])
+                for row in user_rows:
+                    before = self._budget_usage(user_id, row[2], str(row[4]))
+                    self._log_change(user_id, row[0], "upsert", (row[1], row[2], row[3], str(row[4]), row[7]))
+                    self._train(user_id, row[2], row[3])
+                    self._apply_monthly_total(user_id, row[2], row[7], str(row[4]), 1, row[1])
+                    self._raise_budget_alerts(user_id, row[2], str(row[4]), before)
+                self._touch(user_id)
+            for materialized_through, rule_id in watermarks:
+                self._recurring[rule_id]['materialized_through'] = materialized_through
+        return inserted
+
+    def get_diagnostics(self, user_id: Optional[int] = None) -> Dict[str, str]:
+        """Backend details for the diagnostics panel"""
+        with self._lock:
+            rows = sum(columns.size for columns in self._expenses.values())
+        return {"Backend": self.name, "Expenses in memory": f"{rows:,}"}
@@ -0,0 +1,319 @@
+# prefetch.py
+"""Background prefetch of page data after login and ahead of likely navigation.
+
+Right after login the dashboard's expenses (and its rolling statistics) and
+the current month's expenses for the budget analysis are loaded in a
+thread pool, along with the page the user most often opens after the
+dashboard. Each page visit then prefetches the page that most often
+follows it for that user. Pages take a prefetched value instead of
+querying when it was loaded at the current data version; a value loaded
+before a write is discarded as stale. Prefetched values are used once.
+
+Finished values are held by the SessionMemoryManager, so they count
+against the session memory budget (and show in the diagnostics panel's
+session cache) and are spilled or dropped like any other cached object;
+one dropped before a page takes it is simply loaded again.
+"""
+import threading
+import time
+from calendar import monthrange
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import config
+from backend import StorageBackend
+from currency import convert_frame
+from rolling import get_rolling_stats
+from session_memory import SessionMemoryManager, get_manager
+from sketches import month_sketches
+
+
+class PageJob(NamedTuple):
+    """What to load for a page: the keys it provides, and a loader returning {key: value}"""
+    keys: Callable[[str, date], List[tuple]]
+    load: Callable[[StorageBackend, int, str, date, int, threading.Event], Dict[tuple, Any]]
+
+
+def _load_dashboard(db: StorageBackend, user_id: int, base: str, today: date, version: int,
+                    cancelled: threading.Event) -> Dict[tuple, Any]:
+    expenses = convert_frame(db.get_expenses(user_id), base)
+    if not cancelled.is_set():
+        # Shared process cache, keyed by data version
+        get_rolling_stats(expenses, user_id, base, version)
+    return {("expenses", base): expenses}
+
+
+def _load_budget(db: StorageBackend, user_id: int, base: str, today: date, version: int,
+                 cancelled: threading.Event) -> Dict[tuple, Any]:
+    month_start = today.replace(day=1)
+    month_end = today.replace(day=monthrange(today.year, today.month)[1])
+    expenses = db.get_expenses(user_id, month_start.isoformat(), month_end.isoformat())
+    return {("month_expenses", base, today.year, today.month): convert_frame(expenses, base)}
+
+
+def _load_export(db: StorageBackend, user_id: int, base: str, today: date, version: int,
+                 cancelled: threading.Event) -> Dict[tuple, Any]:
+    # The summary's distribution figures; shared process cache, keyed by data version
+    month_sketches(db, user_id, base, version)
+    if cancelled.is_set():
+        return {}
+    # The default export range is the whole history
+    return {("expenses", base): convert_frame(db.get_expenses(user_id), base)}
+
+
+# Pages worth prefetching, in the order used when there is no navigation history
+PAGE_JOBS: Dict[str, PageJob] = {
+    "Dashboard": PageJob(lambda base, today: [("expenses", base)], _load_dashboard),
+    "Budget Tracker": PageJob(lambda base, today: [("month_expenses", base, today.year, today.month)],
+                              _load_budget),
+    "Export Data": PageJob(lambda base, today: [("expenses", base)], _load_export),
+}
+# Warmed right after login, besides the page predicted to follow the dashboard
+LOGIN_PAGES = ("Dashboard", "Budget Tracker")
+
+
+class _Prefetched(NamedTuple):
+    version: int
+    value: Any
+
+
+def _memory_key(key: tuple) -> str:
+    """Key of a prefetched value in the session memory manager"""
+    return "prefetch:" + "|".join(str(part) for part in key)
+
+
+class _Session:
+    """One session's prefetches: jobs still running, and the data version of values not yet taken"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.cancelled = threading.Event()
+        self.jobs: Dict[str, Tuple[Future, Set[tuple]]] = {}
+        self.ready: Dict[tuple, int] = {}
+        self.last_used = time.time()
+
+
+class Prefetcher:
+    """Runs PAGE_JOBS in a bounded thread pool and hands their results to the pages"""
+
+    def __init__(self, workers: int, max_pending: int, idle_seconds: float, memory: SessionMemoryManager):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.idle_seconds = idle_seconds
+        self.memory = memory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") if workers else None
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _Session] = {}
+        # user id -> page -> pages opened next, learned from this process's navigation
+        self._transitions: Dict[int, Dict[str, Counter]] = {}
+        self.submitted = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def warm_up(self, session_state, db: StorageBackend, user_id: int, base: str):
+        """Prefetch the login pages and the page most likely opened after the dashboard"""
+        for page in dict.fromkeys(LOGIN_PAGES + (self.predict_next(user_id, "Dashboard"),)):
+            self.submit(session_state, db, user_id, base, page)
+
+    def visit(self, session_state, db: StorageBackend, user_id: int, base: str, page: str):
+        """Note a page view; on navigation, learn the transition and prefetch the likely next page"""
+        previous = session_state.get("prefetch_page")
+        if previous == page:
+            return
+        session_state["prefetch_page"] = page
+        if previous is not None:
+            with self._lock:
+                self._transitions.setdefault(user_id, {}).setdefault(previous, Counter())[page] += 1
+        next_page = self.predict_next(user_id, page)
+        if next_page is not None:
+            self.submit(session_state, db, user_id, base, next_page)
+
+    def predict_next(self, user_id: int, page: str) -> Optional[str]:
+        """The prefetchable page this user most often opens after `page`"""
+        candidates = [candidate for candidate in PAGE_JOBS if candidate != page]
+        with self._lock:
+            counts = self._transitions.get(user_id, {}).get(page, Counter())
+            # max keeps the first of equal counts, so ties fall back to the PAGE_JOBS order
+            return max(candidates, key=lambda candidate: counts[candidate], default=None)
+
+    def submit(self, session_state, db: StorageBackend, user_id: int, base: str, page: str) -> bool:
+        """Start prefetching `page` unless it is already running or prefetched; False if skipped"""
+        if self._executor is None or page not in PAGE_JOBS:
+            return False
+        job = PAGE_JOBS[page]
+        today = date.today()
+        keys = set(job.keys(base, today))
+        name = f"{page}:{base}"
+        with self._lock:
+            self._expire_idle()
+            session = self._session(session_state, user_id)
+            finished = self._collect(session)
+        self._store(session_state, finished)
+        with self._lock:
+            if name in session.jobs:
+                return False
+            if keys <= session.ready.keys():
+                return False
+            if sum(not future.done() for s in self._sessions.values() for future, _ in s.jobs.values()) \
+                    >= self.max_pending:
+                self.skipped += 1
+                return False
+            future = self._executor.submit(self._run, job, db, user_id, base, today, session.cancelled)
+            session.jobs[name] = (future, keys)
+            self.submitted += 1
+        return True
+
+    @staticmethod
+    def _run(job: PageJob, db: StorageBackend, user_id: int, base: str, today: date,
+             cancelled: threading.Event) -> Dict[tuple, _Prefetched]:
+        if cancelled.is_set():
+            return {}
+        version = db.get_user_stats(user_id)['version']
+        values = job.load(db, user_id, base, today, version, cancelled)
+        return {} if cancelled.is_set() else {key: _Prefetched(version, value) for key, value in values.items()}
+
+    def take(self, session_state, key: tuple, current_version: Callable[[], int]) -> Optional[Any]:
+        """The prefetched value for `key` if it is still current, else None (the page loads it itself).
+
+        A prefetch still running is waited for, since its query is already
+        under way; one still queued is cancelled. `current_version` is only
+        called when there is a value to check.
+        """
+        session_id = SessionMemoryManager.session_id(session_state)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                self.misses += 1
+                return None
+            session.last_used = time.time()
+            for name, (future, keys) in list(session.jobs.items()):
+                if key in keys and future.cancel():
+                    del session.jobs[name]
+                    self.cancelled += 1
+            running = [future for future, keys in session.jobs.values() if key in keys]
+        for future in running:
+            # Exceptions are counted when the job is collected
+            future.exception()
+        with self._lock:
+            finished = self._collect(session)
+        self._store(session_state, finished)
+        with self._lock:
+            version = session.ready.pop(key, None)
+        # None when nothing was prefetched, or the memory manager dropped it
+        value = None if version is None else self.memory.pop(session_state, _memory_key(key))
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        if version != current_version():
+            with self._lock:
+                self.stale += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def cancel(self, session_state):
+        """Stop this session's prefetches and drop their results (e.g. on logout)"""
+        session_state.pop("prefetch_page", None)
+        with self._lock:
+            session = self._sessions.pop(SessionMemoryManager.session_id(session_state), None)
+            keys = self._drop(session) if session is not None else []
+        self.memory.discard(session_state, keys)
+
+    def _session(self, session_state, user_id: int) -> _Session:
+        session_id = SessionMemoryManager.session_id(session_state)
+        session = self._sessions.get(session_id)
+        if session is None or session.user_id != user_id:
+            if session is not None:
+                self.memory.discard(session_state, self._drop(session))
+            session = self._sessions[session_id] = _Session(user_id)
+        session.last_used = time.time()
+        return session
+
+    def _collect(self, session: _Session) -> Dict[tuple, _Prefetched]:
+        """Note the versions of finished jobs' values in `ready`; returns the values for `_store`"""
+        finished = {}
+        for name, (future, _) in list(session.jobs.items()):
+            if not future.done():
+                continue
+            del session.jobs[name]
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                self.failed += 1
+            elif not session.cancelled.is_set():
+                finished.update(future.result())
+        session.ready.update((key, prefetched.version) for key, prefetched in finished.items())
+        return finished
+
+    def _store(self, session_state, finished: Dict[tuple, _Prefetched]):
+        # Outside the prefetcher lock: putting may spill other objects to disk
+        for key, prefetched in finished.items():
+            self.memory.put(session_state, _memory_key(key), prefetched.value)
+
+    def _drop(self, session: _Session) -> List[str]:
+        """Cancel a session's jobs; returns the memory keys of its untaken values"""
+        # Running jobs see the event between steps and return nothing
+        session.cancelled.set()
+        for future, _ in session.jobs.values():
+            if future.cancel():
+                self.cancelled += 1
+        keys = [_memory_key(key) for key in session.ready]
+        session.jobs.clear()
+        session.ready.clear()
+        return keys
+
+    def _expire_idle(self):
+        # The memory manager releases the values of idle sessions itself
+        now = time.time()
+        for session_id in [s for s, session in self._sessions.items() if now - session.last_used > self.idle_seconds]:
+            self._drop(self._sessions.pop(session_id))
+
+    def totals(self) -> Dict[str, int]:
+        with self._lock:
+            running = sum(not future.done() for s in self._sessions.values() for future, _ in s.jobs.values())
+            return {
+                "workers": self.workers,
+                "running": running,
+                "submitted": self.submitted,
+                "skipped": self.skipped,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+            }
+
+
+_prefetcher_lock = threading.Lock()
+_prefetcher: Optional[Prefetcher] = None
+
+
+def get_prefetcher() -> Prefetcher:
+    """Process-wide prefetcher built from config"""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher(config.PREFETCH_WORKERS, config.PREFETCH_MAX_PENDING,
+                                     config.SESSION_IDLE_SECONDS, get_manager())
+        return _prefetcher
+
+
+def prefetch_diagnostics() -> Dict[str, str]:
+    """Prefetch figures for the diagnostics panel"""
+    totals = get_prefetcher().totals()
+    if not totals["workers"]:
+        return {"Prefetch": "disabled"}
+    asked = totals["hits"] + totals["misses"] + totals["stale"]
+    hit_rate = f"{totals['hits'] / asked:.0%}" if asked else "-"
+    return {
+        "Prefetch hit rate": f"{hit_rate} ({totals['hits']} of {asked} page loads, {totals['stale']} stale)",
+        "Prefetches": (f"{totals['submitted']} started, {totals['running']} running, {totals['cancelled']} cancelled, "
+                       f"{totals['skipped']} skipped, {totals['failed']} failed"),
+    }
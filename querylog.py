@@ -0,0 +1,306 @@
+# querylog.py
+"""SQLite statement monitoring: a rotating slow-query log and per-call time budgets.
+
+Connections opened with `connect` install two SQLite hooks. Cursor
+statements are timed from execute until their rows have been fetched, with
+the parameter shape (never the values) and the row count; the trace callback
+catches the statements no cursor issues, such as the COMMIT of `with conn:`
+or executescript, and times each until the next one starts. Statements
+slower than SLOW_QUERY_MS are written to the slow-query log.
+
+The progress handler gives a connection a time budget: once the call that
+opened it has run longer than that, SQLite interrupts the running statement
+and the caller gets a QueryTimeout instead of a thread stuck in a query.
+"""
+import logging
+import logging.handlers
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+import config
+
+# How often (in SQLite VM instructions) the budget is checked; a fraction of a millisecond
+PROGRESS_STEPS = 10_000
+# Longer statements are cut in the log
+MAX_LOGGED_SQL = 1000
+
+
+class QueryTimeout(sqlite3.OperationalError):
+    """A statement was interrupted because its call ran past the time budget"""
+
+
+def is_query_timeout(error: Optional[BaseException]) -> bool:
+    """True for a QueryTimeout, or an error raised while handling one (pandas wraps execute errors)"""
+    while error is not None:
+        if isinstance(error, QueryTimeout):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class SlowQueryLog:
+    """Process-wide record of slow, interrupted and failed statements"""
+
+    def __init__(self, path: Optional[str], threshold_ms: float, max_bytes: int, keep: int):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        self.slow = 0
+        self.timeouts = 0
+        self.slowest = (0.0, "")
+        self._logger: Optional[logging.Logger] = None
+        if path:
+            # The file is only created once something is logged
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=keep,
+                                                           encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._logger = logging.getLogger(f"daily_budget.slow_queries.{path}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+    def record(self, sql: str, shape: str, rows: Optional[int], elapsed_ms: float, database: str,
+               status: str = "ok"):
+        if status == "ok" and elapsed_ms < self.threshold_ms:
+            return
+        text = " ".join(sql.split())
+        if len(text) > MAX_LOGGED_SQL:
+            text = text[:MAX_LOGGED_SQL] + "..."
+        with self._lock:
+            self.slow += 1
+            self.timeouts += status == "timeout"
+            if elapsed_ms > self.slowest[0]:
+                self.slowest = (elapsed_ms, text)
+        if self._logger is not None:
+            self._logger.info("%.1f ms | %s | rows=%s | params=%s | %s | %s",
+                              elapsed_ms, status, "-" if rows is None else rows, shape or "-", database, text)
+
+
+_log_lock = threading.Lock()
+_slow_query_log: Optional[SlowQueryLog] = None
+
+
+def get_slow_query_log() -> SlowQueryLog:
+    """The slow-query log configured by SLOW_QUERY_* (built on first use)"""
+    global _slow_query_log
+    with _log_lock:
+        if _slow_query_log is None:
+            path = config.SLOW_QUERY_LOG
+            if path is None:
+                path = os.path.join(os.path.dirname(config.DB_PATH), "slow_queries.log")
+            _slow_query_log = SlowQueryLog(path, config.SLOW_QUERY_MS, config.SLOW_QUERY_LOG_BYTES,
+                                           config.SLOW_QUERY_LOG_KEEP)
+        return _slow_query_log
+
+
+def query_diagnostics() -> Dict[str, str]:
+    """Slow-query figures for the diagnostics panel"""
+    log = get_slow_query_log()
+    slowest_ms, slowest_sql = log.slowest
+    details = {
+        "Slow queries": f"{log.slow} over {log.threshold_ms:.0f} ms",
+        "Query timeouts": str(log.timeouts),
+    }
+    if slowest_sql:
+        details["Slowest query"] = f"{slowest_ms:.0f} ms: {slowest_sql[:60]}"
+    return details
+
+
+def _shape(parameters: Any, many: bool) -> str:
+    """Placeholder count or names of the parameters, without the values"""
+    if many:
+        return f"{len(parameters)}x{_shape(parameters[0], False) if parameters else '()'}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(sorted(parameters)) + "}"
+    return f"({len(parameters)})"
+
+
+class _Statement:
+    """A statement from the moment SQLite starts it; `owner` is the cursor that issued it, if any"""
+    __slots__ = ("sql", "parameters", "many", "owner", "started", "rows")
+
+    def __init__(self, sql: str, parameters: Any = (), many: bool = False,
+                 owner: Optional[sqlite3.Cursor] = None):
+        self.sql = sql
+        self.parameters = parameters
+        self.many = many
+        self.owner = owner
+        self.started = time.perf_counter()
+        self.rows = 0
+
+
+class MonitoredCursor(sqlite3.Cursor):
+    """Cursor that tells its connection the statement's parameters and the rows it returns"""
+
+    def execute(self, sql: str, parameters: Any = ()) -> "MonitoredCursor":
+        connection = self.connection
+        connection._start(_Statement(sql, parameters, False, self))
+        connection._in_cursor = True
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            connection._raise(e)
+        finally:
+            connection._in_cursor = False
+        if self.description is None:
+            # No result rows: the statement has already run to completion
+            connection._fetched(self, self.rowcount, done=True)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters) -> "MonitoredCursor":
+        parameters = list(seq_of_parameters)
+        connection = self.connection
+        connection._start(_Statement(sql, parameters, True, self))
+        connection._in_cursor = True
+        try:
+            super().executemany(sql, parameters)
+        except sqlite3.OperationalError as e:
+            connection._raise(e)
+        finally:
+            connection._in_cursor = False
+        connection._fetched(self, self.rowcount, done=True)
+        return self
+
+    def fetchone(self):
+        try:
+            row = super().fetchone()
+        except sqlite3.OperationalError as e:
+            self.connection._raise(e)
+        self.connection._fetched(self, row is not None, done=row is None)
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = self.arraysize if size is None else size
+        try:
+            rows = super().fetchmany(size)
+        except sqlite3.OperationalError as e:
+            self.connection._raise(e)
+        self.connection._fetched(self, len(rows), done=len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        try:
+            rows = super().fetchall()
+        except sqlite3.OperationalError as e:
+            self.connection._raise(e)
+        self.connection._fetched(self, len(rows), done=True)
+        return rows
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.connection._fetched(self, 0, done=True)
+            raise
+        except sqlite3.OperationalError as e:
+            self.connection._raise(e)
+        self.connection._fetched(self, 1)
+        return row
+
+    def close(self):
+        self.connection._fetched(self, 0, done=True)
+        super().close()
+
+
+class MonitoredConnection(sqlite3.Connection):
+    """Connection reporting statement timings to the slow-query log, with an optional time budget"""
+
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self._database = os.path.basename(str(database)).split("?")[0]
+        self._log = get_slow_query_log()
+        self._statement: Optional[_Statement] = None
+        self._in_cursor = False
+        self._budget_ms: Optional[float] = None
+        self._deadline: Optional[float] = None
+        self.set_trace_callback(self._traced)
+
+    def set_time_budget(self, budget_ms: Optional[float]):
+        """Interrupt statements once `budget_ms` has passed from now; None or 0 removes the limit.
+
+        The progress handler is only installed while there is a budget, so
+        connections without one do not pay for it on every statement.
+        """
+        self._budget_ms = budget_ms or None
+        self._deadline = time.monotonic() + budget_ms / 1000 if budget_ms else None
+        self.set_progress_handler(self._over_budget if budget_ms else None, PROGRESS_STEPS)
+
+    def _over_budget(self) -> bool:
+        return self._deadline is not None and time.monotonic() > self._deadline
+
+    def _traced(self, sql: str):
+        # Statements run inside a cursor call (its implicit BEGIN, trigger programs,
+        # executemany's repeated steps) are timed as part of that call
+        if self._in_cursor:
+            return
+        # Others come from the sqlite3 module (the COMMIT of `with conn:`) or executescript
+        self._start(_Statement(sql))
+
+    def _start(self, statement: _Statement):
+        if self._statement is not None:
+            self._finish()
+        self._statement = statement
+
+    def _finish(self, status: str = "ok"):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        elapsed_ms = (time.perf_counter() - statement.started) * 1000
+        if status != "ok" or elapsed_ms >= self._log.threshold_ms:
+            rows = statement.rows if statement.owner is not None else None
+            shape = _shape(statement.parameters, statement.many) if statement.owner is not None else ""
+            self._log.record(statement.sql, shape, rows, elapsed_ms, self._database, status)
+
+    def _fetched(self, cursor: sqlite3.Cursor, rows: int, done: bool = False):
+        statement = self._statement
+        if statement is not None and statement.owner is cursor:
+            statement.rows += max(rows, 0)
+            if done:
+                self._finish()
+
+    def _raise(self, error: sqlite3.OperationalError):
+        """Log the failed statement and raise; an interrupt past the deadline becomes a QueryTimeout"""
+        if "interrupted" in str(error) and self._over_budget():
+            self._finish("timeout")
+            raise QueryTimeout(f"Query stopped after its {self._budget_ms:.0f} ms time budget") from error
+        self._finish("error")
+        raise error
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or MonitoredCursor)
+
+    def execute(self, sql: str, parameters: Any = ()) -> MonitoredCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> MonitoredCursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        try:
+            super().commit()
+        except sqlite3.OperationalError as e:
+            self._raise(e)
+        self._finish()
+
+    def __exit__(self, *exc_info):
+        try:
+            result = super().__exit__(*exc_info)
+        except sqlite3.OperationalError as e:
+            self._raise(e)
+        self._finish()
+        return result
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+def connect(database: str, budget_ms: Optional[float] = None, **kwargs) -> MonitoredConnection:
+    """sqlite3.connect with statement monitoring and, if given, a time budget for the connection"""
+    kwargs.setdefault("factory", MonitoredConnection)
+    conn = sqlite3.connect(database, **kwargs)
+    conn.set_time_budget(budget_ms)
+    return conn
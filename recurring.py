@@ -0,0 +1,173 @@
+# recurring.py
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from typing import Optional, Set
+from backend import StorageBackend, get_backend
+from daily import once_a_day
+
+FREQUENCIES = ["daily", "weekly", "monthly", "yearly", "custom"]
+
+
+def _present(value) -> bool:
+    """True for a non-null, non-empty column value"""
+    return value is not None and not pd.isna(value) and value != ''
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Optional[Set[int]]:
+    """Parse one cron field (`*`, `5`, `1,15`, `1-5`, `*/2`); None means unrestricted"""
+    field = field.strip()
+    if field == '*':
+        return None
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/')
+            step = int(step_text)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-'))
+        else:
+            start = end = int(part)
+        if start < low or end > high:
+            raise ValueError(f"Cron value out of range {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expression: str):
+    """Parse a 'day-of-month month day-of-week' expression (day-of-week 0 = Monday)"""
+    fields = expression.split()
+    if len(fields) != 3:
+        raise ValueError("Custom schedules need three fields: day-of-month month day-of-week")
+    return (_parse_cron_field(fields[0], 1, 31),
+            _parse_cron_field(fields[1], 1, 12),
+            _parse_cron_field(fields[2], 0, 6))
+
+
+def occurrences(rule, start: date, end: date) -> pd.DatetimeIndex:
+    """Dates on which a rule fires within [start, end], computed without per-day loops"""
+    anchor = pd.Timestamp(rule['start_date'])
+    first = max(pd.Timestamp(start), anchor)
+    last = pd.Timestamp(end)
+    if _present(rule.get('end_date')):
+        last = min(last, pd.Timestamp(rule['end_date']))
+    if first > last:
+        return pd.DatetimeIndex([])
+
+    interval = max(int(rule.get('interval') or 1), 1)
+    frequency = rule['frequency']
+
+    if frequency in ('daily', 'weekly'):
+        step = interval * (7 if frequency == 'weekly' else 1)
+        offset = (first - anchor).days
+        first_step = -(-offset // step) * step  # round up to the next multiple of step
+        days = np.arange(first_step, (last - anchor).days + 1, step)
+        return anchor + pd.to_timedelta(days, unit='D')
+
+    if frequency in ('monthly', 'yearly'):
+        step = interval * (12 if frequency == 'yearly' else 1)
+        months_to_last = (last.year - anchor.year) * 12 + last.month - anchor.month
+        month_offsets = np.arange(0, months_to_last + 1, step)
+        month_starts = pd.PeriodIndex([anchor.to_period('M')] * len(month_offsets)) + month_offsets
+        month_starts = month_starts.to_timestamp()
+        # Clamp the anchor's day to shorter months (e.g. the 31st -> the 30th)
+        day = np.minimum(anchor.day, month_starts.days_in_month)
+        dates = month_starts + pd.to_timedelta(day - 1, unit='D')
+        return dates[(dates >= first) & (dates <= last)]
+
+    if frequency == 'custom':
+        days_of_month, months, weekdays = parse_cron(rule['cron'] if _present(rule['cron']) else '* * *')
+        days = pd.date_range(first, last, freq='D')
+        month_ok = np.ones(len(days), dtype=bool) if months is None else days.month.isin(months)
+        dom_ok = None if days_of_month is None else days.day.isin(days_of_month)
+        dow_ok = None if weekdays is None else days.dayofweek.isin(weekdays)
+        if dom_ok is not None and dow_ok is not None:
+            day_ok = dom_ok | dow_ok  # cron semantics: either restriction may match
+        elif dom_ok is not None:
+            day_ok = dom_ok
+        elif dow_ok is not None:
+            day_ok = dow_ok
+        else:
+            day_ok = np.ones(len(days), dtype=bool)
+        return days[month_ok & day_ok]
+
+    raise ValueError(f"Unknown frequency: {frequency}")
+
+
+def project_recurring(rules_df: pd.DataFrame, start: date, end: date) -> pd.DataFrame:
+    """Upcoming charges in [start, end] that have not been materialized yet"""
+    frames = []
+    for _, rule in rules_df.iterrows():
+        window_start = start
+        if _present(rule['materialized_through']):
+            window_start = max(start, date.fromisoformat(rule['materialized_through']) + timedelta(days=1))
+        dates = occurrences(rule, window_start, end)
+        if len(dates):
+            frames.append(pd.DataFrame({
+                'recurring_id': rule['id'],
+                'date': dates,
+                'amount': rule['amount'],
+                'category': rule['category'],
+                'description': rule['description'],
+                'currency': rule['currency'],
+            }))
+    if not frames:
+        return pd.DataFrame(columns=['recurring_id', 'date', 'amount', 'category', 'description', 'currency'])
+    return pd.concat(frames, ignore_index=True).sort_values('date')
+
+
+class RecurringScheduler:
+    """Materializes due recurring expenses for all users in batched inserts"""
+
+    def __init__(self, db: StorageBackend, batch_size: int = 1000):
+        self.db = db
+        self.batch_size = batch_size
+
+    def run(self, until: Optional[date] = None) -> int:
+        """Insert every occurrence up to `until` (default today); returns rows inserted.
+
+        Each batch inserts its rows and advances the matching high-water marks
+        in one transaction, so a crash mid-run never loses or repeats work, and
+        a run after downtime simply catches up from each rule's mark.
+        """
+        until = until or date.today()
+        rules = self.db.get_due_recurring_expenses(until.isoformat())
+        inserted = 0
+
+        for shard, shard_rules in rules.groupby('shard', sort=False):
+            rows, watermarks = [], []
+            for _, rule in shard_rules.iterrows():
+                start = date.fromisoformat(rule['start_date'])
+                if _present(rule['materialized_through']):
+                    start = date.fromisoformat(rule['materialized_through']) + timedelta(days=1)
+                dates = occurrences(rule, start, until).strftime('%Y-%m-%d')
+                rows.extend(
+                    (int(rule['user_id']), float(rule['amount']), rule['category'],
+                     rule['description'], day, int(rule['id']), rule['currency'])
+                    for day in dates
+                )
+                watermark = until.isoformat()
+                if _present(rule['end_date']):
+                    watermark = min(watermark, rule['end_date'])
+                watermarks.append((watermark, int(rule['id'])))
+
+                if len(rows) >= self.batch_size:
+                    inserted += self.db.materialize_recurring(shard, rows, watermarks)
+                    rows, watermarks = [], []
+
+            if watermarks:
+                inserted += self.db.materialize_recurring(shard, rows, watermarks)
+        return inserted
+
+
+@once_a_day()
+def run_scheduler_if_due(db: StorageBackend, today: date) -> int:
+    """Materialize recurring expenses due up to today"""
+    return RecurringScheduler(db).run(today)
+
+
+if __name__ == "__main__":
+    print(f"Materialized {RecurringScheduler(get_backend()).run()} recurring expenses")
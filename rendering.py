@@ -0,0 +1,152 @@
+# rendering.py
+import numpy as np
+import pandas as pd
+from typing import Callable, List, Optional
+import config
+from currency import symbol
+from lru import LRUCache
+
+# Rendered fragments keyed by (template name, row content hash). Identical row
+# content renders to identical HTML, so the cache is shared by all sessions.
+_fragment_cache = LRUCache(20000)
+
+
+def escape(values: pd.Series) -> pd.Series:
+    """HTML-escape a column of user-entered text"""
+    return (values.fillna('').astype(str)
+            .str.replace('&', '&amp;', regex=False)
+            .str.replace('<', '&lt;', regex=False)
+            .str.replace('>', '&gt;', regex=False)
+            .str.replace('"', '&quot;', regex=False))
+
+
+def money(values: pd.Series, decimals: int = 2, grouped: bool = True,
+          currencies: Optional[pd.Series] = None) -> pd.Series:
+    """Format a numeric column as amounts, prefixed with each row's currency symbol"""
+    pattern = f"{{:{',' if grouped else ''}.{decimals}f}}"
+    prefix = symbol(config.BASE_CURRENCY) if currencies is None else currencies.map(symbol)
+    return prefix + values.astype(float).map(pattern.format)
+
+
+def _currencies(rows: pd.DataFrame) -> Optional[pd.Series]:
+    return rows['currency'] if 'currency' in rows.columns else None
+
+
+def render_section(df: pd.DataFrame, template: Callable[[pd.DataFrame], pd.Series],
+                   columns: Optional[List[str]] = None) -> str:
+    """Render every row of `df` with `template` and join them into one HTML block.
+
+    Templates build a whole column of fragments at once with vectorized string
+    operations. Rows whose `columns` content was rendered before are served
+    from the cache, so only new or changed rows go through the template.
+    """
+    if df.empty:
+        return ""
+    columns = columns or list(df.columns)
+    keys = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    name = template.__name__
+
+    fragments = _fragment_cache.get_many((name, key) for key in keys)
+
+    missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+    if missing:
+        rendered = template(df.iloc[missing]).tolist()
+        for i, fragment in zip(missing, rendered):
+            fragments[i] = fragment
+        _fragment_cache.put_many(((name, keys[i]), fragment) for i, fragment in zip(missing, rendered))
+    return "".join(fragments)
+
+
+def fragment_cache_size() -> int:
+    return len(_fragment_cache)
+
+
+# Templates: each takes a frame and returns one HTML fragment per row
+
+def expense_card(rows: pd.DataFrame) -> pd.Series:
+    """Dashboard recent-expense card (amount, category, date, description, currency)"""
+    description = escape(rows['description'])
+    description = description.where(description != '', 'No description')
+    return ('''
+        <div class="expense-card">
+            <div style="display: flex; justify-content: space-between; align-items: center;">
+                <div>
+                    <strong style="font-size: 1.1rem; color: #1f2937;">''' + money(rows['amount'], grouped=False, currencies=_currencies(rows)) + '''</strong>
+                    <span style="margin-left: 1rem; color: #6b7280;">→ ''' + escape(rows['category']) + '''</span>
+                </div>
+                <div style="text-align: right; color: #9ca3af; font-size: 0.9rem;">
+                    ''' + rows['date'].astype(str) + '''
+                </div>
+            </div>
+            <div style="margin-top: 0.5rem; color: #6b7280; font-size: 0.9rem;">
+                <i class="fas fa-comment-alt" style="margin-right: 0.5rem;"></i>
+                ''' + description + '''
+            </div>
+        </div>
+        ''')
+
+
+def budget_card(rows: pd.DataFrame) -> pd.Series:
+    """Budget tracker card (category, amount, actual_amount, remaining, percentage, currency)"""
+    percentage = rows['percentage'].astype(float)
+    over, near = percentage > 100, percentage > 80
+    status_class = np.select([over, near], ["budget-danger", "budget-warning"], "budget-success")
+    status_text = np.select([over, near], ["🚨 Over Budget!", "⚠️ Near Limit"], "✅ On Track")
+    progress_class = np.select([over, near], ["progress-danger", "progress-warning"], "progress-success")
+    # Cap at 150% for display
+    progress_width = np.minimum(percentage, 150).astype(str)
+    currencies = _currencies(rows)
+
+    return ('''
+            <div class="''' + pd.Series(status_class, index=rows.index) + '''">
+                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1rem;">
+                    <h4 style="margin: 0;"><i class="fas fa-tag icon"></i>''' + escape(rows['category']) + '''</h4>
+                    <span style="font-weight: bold; font-size: 1.1rem;">''' + pd.Series(status_text, index=rows.index) + '''</span>
+                </div>
+
+                <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
+                    <span><strong>Budget:</strong> ''' + money(rows['amount'], currencies=currencies) + '''</span>
+                    <span><strong>Spent:</strong> ''' + money(rows['actual_amount'], currencies=currencies) + '''</span>
+                    <span><strong>Remaining:</strong> ''' + money(rows['remaining'], currencies=currencies) + '''</span>
+                </div>
+
+                <div class="progress-container">
+                    <div class="progress-bar ''' + pd.Series(progress_class, index=rows.index) + '''" style="width: ''' + progress_width + '''%;"></div>
+                </div>
+
+                <div style="text-align: center; font-size: 0.9rem; margin-top: 0.5rem;">
+                    <strong>''' + percentage.map('{:.1f}'.format) + '''%</strong> of budget used
+                </div>
+            </div>
+            ''')
+
+
+def budget_usage_item(rows: pd.DataFrame) -> pd.Series:
+    """List item for budget insight alerts (category, percentage)"""
+    return ("<li>" + escape(rows['category']) + ": "
+            + rows['percentage'].astype(float).map('{:.1f}'.format) + "% used</li>")
+
+
+def budget_alert_item(rows: pd.DataFrame) -> pd.Series:
+    """Sidebar budget alert (category, threshold, spent, budget, currency)"""
+    over = rows['threshold'].astype(int) >= 100
+    icon = pd.Series(np.where(over, "🚨", "⚠️"), index=rows.index)
+    style = pd.Series(np.where(over, "alert-error", "alert-warning"), index=rows.index)
+    currencies = _currencies(rows)
+    return ('<div class="' + style + '" style="padding: 0.5rem 0.75rem; margin: 0.25rem 0;">' + icon + " <strong>"
+            + rows['threshold'].astype(int).astype(str) + "%</strong> of " + escape(rows['category'])
+            + " used<br><small>" + money(rows['spent'], decimals=0, currencies=currencies) + " of "
+            + money(rows['budget'], decimals=0, currencies=currencies) + "</small></div>")
+
+
+def duplicate_item(rows: pd.DataFrame) -> pd.Series:
+    """List item for a possible duplicate (amount, category, date, currency)"""
+    return ("<li>" + money(rows['amount'], grouped=False, currencies=_currencies(rows)) + " • " + escape(rows['category'])
+            + " • " + rows['date'].astype(str) + "</li>")
+
+
+def outlier_item(rows: pd.DataFrame) -> pd.Series:
+    """List item for an unusual expense (amount, category, median, currency)"""
+    currencies = _currencies(rows)
+    return ("<li>" + money(rows['amount'], grouped=False, currencies=currencies) + " in " + escape(rows['category'])
+            + " (typical " + money(rows['median'], grouped=False, currencies=currencies) + ")</li>")
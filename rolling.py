@@ -0,0 +1,120 @@
+# rolling.py
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Dict, Optional, Tuple
+from calendar_dim import day_numbers, to_day
+from currency import get_rates
+from lru import LRUCache
+
+MOVING_AVERAGE_WINDOWS = (7, 30, 90)
+
+
+def _month_start(day: int) -> int:
+    """Day number of the first of the month containing `day`"""
+    return int(np.datetime64(day, 'D').astype('datetime64[M]').astype('datetime64[D]').astype(np.int64))
+
+
+def _month_length(day: int) -> int:
+    month = np.datetime64(day, 'D').astype('datetime64[M]')
+    return int(((month + 1).astype('datetime64[D]') - month.astype('datetime64[D]')).astype(np.int64))
+
+
+class RollingStats:
+    """Window sums over a user's daily spend via prefix sums.
+
+    Spend is laid out as one dense array cell per calendar day from the
+    first expense to today (or the latest future-dated expense); the prefix
+    sum of that array answers any window total with two lookups.
+    """
+
+    def __init__(self, expenses: pd.DataFrame, today: Optional[int] = None):
+        self.today = to_day(date.today()) if today is None else today
+        if expenses.empty:
+            self.first_day = self.today
+            daily = np.zeros(1)
+        else:
+            days = day_numbers(expenses['date'])
+            self.first_day = int(days.min())
+            last_day = max(int(days.max()), self.today)
+            daily = np.bincount(days - self.first_day, weights=expenses['amount'].to_numpy(dtype=np.float64),
+                                minlength=last_day - self.first_day + 1)
+        self.daily = daily
+        self.last_day = self.first_day + len(daily) - 1
+        # prefix[i] is the spend on all days before first_day + i
+        self.prefix = np.concatenate(([0.0], np.cumsum(daily)))
+
+    def _position(self, day: int) -> int:
+        return min(max(day - self.first_day, 0), len(self.daily))
+
+    def window_sum(self, end_day: int, days: int) -> float:
+        """Total spend over the `days` days ending on `end_day` (inclusive)"""
+        return float(self.prefix[self._position(end_day + 1)] - self.prefix[self._position(end_day + 1 - days)])
+
+    def window_mean(self, end_day: int, days: int) -> float:
+        """Average daily spend over the `days` days ending on `end_day`"""
+        return self.window_sum(end_day, days) / days
+
+    def month_to_date(self, day: Optional[int] = None) -> float:
+        """Spend from the first of `day`'s month through `day`"""
+        day = self.today if day is None else day
+        return self.window_sum(day, day - _month_start(day) + 1)
+
+    def moving_averages(self, windows: Tuple[int, ...] = MOVING_AVERAGE_WINDOWS,
+                        start_day: Optional[int] = None) -> pd.DataFrame:
+        """Daily spend and trailing `windows`-day averages for every day from `start_day` to the last day"""
+        start = self._position(self.first_day if start_day is None else start_day)
+        ends = np.arange(start, len(self.daily)) + 1
+        frame = pd.DataFrame({
+            'date': (self.first_day + ends - 1).astype('datetime64[D]'),
+            'amount': self.daily[start:],
+        })
+        for window in windows:
+            frame[f'ma_{window}'] = (self.prefix[ends] - self.prefix[np.maximum(ends - window, 0)]) / window
+        return frame
+
+    def month_to_date_curve(self, day: Optional[int] = None) -> pd.DataFrame:
+        """Cumulative spend by day of month for `day`'s month (through `day`) and the full previous month"""
+        day = self.today if day is None else day
+        start = _month_start(day)
+        previous_start = _month_start(start - 1)
+        frames = []
+        for label, first, last in (("This month", start, day), ("Last month", previous_start, start - 1)):
+            offsets = np.arange(last - first + 1)
+            ends = np.clip(first + offsets + 1 - self.first_day, 0, len(self.daily))
+            cumulative = self.prefix[ends] - self.prefix[self._position(first)]
+            frames.append(pd.DataFrame({'day_of_month': offsets + 1, 'amount': cumulative, 'period': label}))
+        return pd.concat(frames, ignore_index=True)
+
+    def velocity(self, day: Optional[int] = None, recent_days: int = 7) -> Dict[str, float]:
+        """Month-to-date spend, its daily pace, the month-end projection and last month at the same point"""
+        day = self.today if day is None else day
+        start = _month_start(day)
+        elapsed = day - start + 1
+        month_to_date = self.window_sum(day, elapsed)
+        previous_start = _month_start(start - 1)
+        previous_same_point = self.window_sum(previous_start + min(elapsed, start - previous_start) - 1,
+                                              min(elapsed, start - previous_start))
+        return {
+            "month_to_date": month_to_date,
+            "daily_rate": month_to_date / elapsed,
+            "recent_rate": self.window_mean(day, recent_days),
+            "projected": month_to_date / elapsed * _month_length(day),
+            "previous_month_to_date": previous_same_point,
+            "previous_month_total": self.window_sum(start - 1, start - previous_start),
+        }
+
+
+# Built statistics keyed by (user, base currency, rate version, data version, today)
+_rolling_cache = LRUCache(256)
+
+
+def get_rolling_stats(expenses: pd.DataFrame, user_id: int, base: str, version: int) -> RollingStats:
+    """Rolling statistics for `expenses` (already converted to `base`), built once per data version"""
+    key = (user_id, base, get_rates().version, version, date.today())
+    cached = _rolling_cache.get(key)
+    if cached is not None:
+        return cached
+    stats = RollingStats(expenses)
+    _rolling_cache.put(key, stats)
+    return stats
@@ -0,0 +1,305 @@
+# session_memory.py
+import atexit
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, Optional
+import config
+
+# Session-state flags the Manage Expenses page sets per expense id
+FLAG_PREFIXES = ("editing_", "confirm_delete_")
+
+
+def estimate_size(obj: Any, depth: int = 4) -> int:
+    """Approximate bytes held by an object, following containers and attributes"""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(estimate_size(k, depth - 1) + estimate_size(v, depth - 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, depth - 1) for item in obj)
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        return size + estimate_size(vars(obj), depth - 1)
+    return size
+
+
+def process_memory() -> Optional[int]:
+    """Resident set size of this process in bytes, if the platform exposes it"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def format_bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+class _Entry:
+    __slots__ = ("obj", "size", "last_used", "spill_path")
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+        self.size = estimate_size(obj)
+        self.last_used = time.time()
+        self.spill_path: Optional[str] = None
+
+
+class SessionMemoryManager:
+    """Process-wide store for large per-session objects under a global byte budget.
+
+    Sessions keep only a small id in `st.session_state`; the objects live
+    here so the least recently used ones can be spilled to disk (or dropped
+    when spilling is off) once the total passes the budget, and whole
+    sessions are released after they go idle. Callers must be able to
+    rebuild anything `get` no longer returns.
+
+    Spilled objects are pickled, so they go to a private directory (mode
+    0700) created inside `spill_dir` on the first spill and removed by
+    `close`; nobody else can plant a file there for `get` to unpickle.
+    """
+
+    def __init__(self, budget_bytes: int, spill_dir: Optional[str], idle_seconds: float):
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self._private_dir: Optional[str] = None
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict[str, _Entry]] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._state_sizes: Dict[str, int] = {}
+        self.spills = 0
+        self.evictions = 0
+
+    @staticmethod
+    def session_id(session_state) -> str:
+        if "session_id" not in session_state:
+            session_state["session_id"] = uuid.uuid4().hex
+        return session_state["session_id"]
+
+    def get(self, session_state, key: str) -> Optional[Any]:
+        """Fetch a cached object, reloading it if it was spilled; None if evicted"""
+        session = self.session_id(session_state)
+        with self._lock:
+            entry = self._entries.get(session, {}).get(key)
+            if entry is None:
+                return None
+            if entry.obj is None and entry.spill_path:
+                try:
+                    with open(entry.spill_path, "rb") as f:
+                        entry.obj = pickle.load(f)
+                except (OSError, pickle.UnpicklingError, EOFError):
+                    self._discard(session, key)
+                    return None
+                self._remove_spill(entry)
+            entry.last_used = time.time()
+            self._enforce_budget(keep=(session, key))
+            return entry.obj
+
+    def pop(self, session_state, key: str) -> Optional[Any]:
+        """Fetch a cached object and remove it from the cache; None if evicted"""
+        with self._lock:
+            obj = self.get(session_state, key)
+            self._discard(self.session_id(session_state), key)
+            return obj
+
+    def discard(self, session_state, keys: Iterable[str]):
+        """Drop cached objects of this session, if present"""
+        session = self.session_id(session_state)
+        with self._lock:
+            for key in keys:
+                self._discard(session, key)
+
+    def put(self, session_state, key: str, obj: Any):
+        """Cache an object for this session"""
+        session = self.session_id(session_state)
+        with self._lock:
+            self._discard(session, key)
+            self._entries.setdefault(session, {})[key] = _Entry(obj)
+            self._last_seen[session] = time.time()
+            self._enforce_budget(keep=(session, key))
+
+    def track(self, session_state):
+        """Per-rerun bookkeeping: re-measure this session, release idle ones, enforce the budget.
+
+        Cached objects are mutated in place between reruns (e.g. a detector
+        refresh), so their sizes are refreshed here rather than on `put`.
+        """
+        session = self.session_id(session_state)
+        now = time.time()
+        state_size = sum(estimate_size(session_state[key]) for key in list(session_state.keys()))
+        with self._lock:
+            self._last_seen[session] = now
+            self._state_sizes[session] = state_size
+            for entry in self._entries.get(session, {}).values():
+                if entry.obj is not None:
+                    entry.size = estimate_size(entry.obj)
+            for idle in [s for s, seen in self._last_seen.items() if now - seen > self.idle_seconds]:
+                self._release(idle)
+            self._enforce_budget()
+
+    def release(self, session_state):
+        """Drop everything cached for this session (e.g. on logout)"""
+        with self._lock:
+            self._release(self.session_id(session_state))
+
+    def _release(self, session: str):
+        for key in list(self._entries.get(session, {})):
+            self._discard(session, key)
+        self._entries.pop(session, None)
+        self._last_seen.pop(session, None)
+        self._state_sizes.pop(session, None)
+
+    def _discard(self, session: str, key: str):
+        entry = self._entries.get(session, {}).pop(key, None)
+        if entry is not None:
+            self._remove_spill(entry)
+
+    @staticmethod
+    def _remove_spill(entry: _Entry):
+        if entry.spill_path:
+            try:
+                os.remove(entry.spill_path)
+            except OSError:
+                pass
+            entry.spill_path = None
+
+    def _resident_bytes(self) -> int:
+        return sum(entry.size for entries in self._entries.values()
+                   for entry in entries.values() if entry.obj is not None)
+
+    def _enforce_budget(self, keep: Optional[tuple] = None):
+        """Spill or drop least recently used objects until the total fits the budget"""
+        total = self._resident_bytes()
+        if total <= self.budget_bytes:
+            return
+        candidates = sorted(
+            ((entry.last_used, session, key) for session, entries in self._entries.items()
+             for key, entry in entries.items() if entry.obj is not None and (session, key) != keep)
+        )
+        for _, session, key in candidates:
+            if total <= self.budget_bytes:
+                break
+            entry = self._entries[session][key]
+            total -= entry.size
+            if not self._spill(session, key, entry):
+                self._discard(session, key)
+                self.evictions += 1
+
+    def _spill(self, session: str, key: str, entry: _Entry) -> bool:
+        if not self.spill_dir:
+            return False
+        try:
+            if self._private_dir is None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self._private_dir = tempfile.mkdtemp(prefix="daily_budget_spill-", dir=self.spill_dir)
+            path = os.path.join(self._private_dir, f"{session}_{key}.pkl")
+            with open(path, "wb") as f:
+                pickle.dump(entry.obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except (OSError, pickle.PicklingError):
+            return False
+        entry.obj, entry.spill_path = None, path
+        self.spills += 1
+        return True
+
+    def close(self):
+        """Forget spilled objects and remove the private spill directory"""
+        with self._lock:
+            for entries in self._entries.values():
+                for key in [k for k, entry in entries.items() if entry.obj is None]:
+                    del entries[key]
+            if self._private_dir is not None:
+                shutil.rmtree(self._private_dir, ignore_errors=True)
+                self._private_dir = None
+
+    def session_usage(self, session_state) -> Dict[str, int]:
+        """Bytes cached in memory and on disk, plus plain session-state size, for this session"""
+        session = self.session_id(session_state)
+        with self._lock:
+            entries = list(self._entries.get(session, {}).values())
+            return {
+                "cached": sum(e.size for e in entries if e.obj is not None),
+                "spilled": sum(e.size for e in entries if e.obj is None),
+                "state": self._state_sizes.get(session, 0),
+            }
+
+    def totals(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._last_seen),
+                "resident": self._resident_bytes(),
+                "budget": self.budget_bytes,
+                "spills": self.spills,
+                "evictions": self.evictions,
+            }
+
+
+_manager_lock = threading.Lock()
+_manager: Optional[SessionMemoryManager] = None
+
+
+def get_manager() -> SessionMemoryManager:
+    """Process-wide session memory manager built from config"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            spill_dir = config.SESSION_SPILL_DIR
+            if spill_dir is None:
+                spill_dir = tempfile.gettempdir()
+            _manager = SessionMemoryManager(int(config.SESSION_MEMORY_BUDGET_MB * 1024 * 1024),
+                                            spill_dir or None, config.SESSION_IDLE_SECONDS)
+            atexit.register(_manager.close)
+        return _manager
+
+
+def collect_stale_flags(session_state, live_ids: Iterable[int]) -> int:
+    """Remove cleared edit/delete flags and flags for expenses no longer listed; returns count"""
+    live = {int(expense_id) for expense_id in live_ids}
+    removed = 0
+    for key in [k for k in list(session_state.keys()) if isinstance(k, str) and k.startswith(FLAG_PREFIXES)]:
+        suffix = key.rsplit("_", 1)[-1]
+        if not session_state[key] or not suffix.isdigit() or int(suffix) not in live:
+            del session_state[key]
+            removed += 1
+    return removed
+
+
+def memory_diagnostics(session_state) -> Dict[str, str]:
+    """Session and process memory figures for the diagnostics panel"""
+    manager = get_manager()
+    usage = manager.session_usage(session_state)
+    totals = manager.totals()
+    return {
+        "Session cache": f"{format_bytes(usage['cached'])} in memory, {format_bytes(usage['spilled'])} spilled",
+        "Session state": format_bytes(usage['state']),
+        "All sessions": (f"{totals['sessions']} sessions, {format_bytes(totals['resident'])} "
+                         f"of {format_bytes(totals['budget'])} budget"),
+        "Spills / evictions": f"{totals['spills']} / {totals['evictions']}",
+        "Process RSS": format_bytes(process_memory()),
+    }
@@ -0,0 +1,174 @@
+# sketches.py
+import math
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from backend import StorageBackend
+from calendar_dim import day_numbers, to_day
+from currency import convert_frame, get_rates
+from lru import LRUCache
+
+# Every quantile estimate is within this fraction of an actual amount at that rank
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+# Smaller amounts share the lowest bucket
+MIN_AMOUNT = 0.01
+
+# Columns returned by get_amount_sketches
+SKETCH_COLUMNS = ['month', 'category', 'currency', 'bucket', 'count']
+
+
+def bucket_ids(amounts) -> np.ndarray:
+    """Log-scale bucket of each amount; bucket i holds (GAMMA**(i-1), GAMMA**i]"""
+    values = np.maximum(np.abs(np.asarray(amounts, dtype=np.float64)), MIN_AMOUNT)
+    return np.ceil(np.log(values) / _LOG_GAMMA).astype(np.int64)
+
+
+def bucket_of(amount: float) -> int:
+    return int(bucket_ids([amount])[0])
+
+
+def bucket_values(buckets) -> np.ndarray:
+    """Representative amount of each bucket, within RELATIVE_ACCURACY of every amount in it"""
+    return 2 * GAMMA ** np.asarray(buckets, dtype=np.float64) / (GAMMA + 1)
+
+
+class QuantileSketch:
+    """Amounts summarized as counts per log-scale bucket (the DDSketch layout).
+
+    Sketches merge by adding counts and forget an amount by subtracting
+    one, so the stored per-month, per-category sketches stay exact under
+    edits and deletes, and any set of them combines into the sketch of the
+    union without touching the rows.
+    """
+
+    def __init__(self, buckets: Iterable[int] = (), counts: Iterable[int] = ()):
+        buckets = np.asarray(buckets, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        self.buckets, inverse = np.unique(buckets, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts, minlength=len(self.buckets)).astype(np.int64)
+        keep = self.counts > 0
+        self.buckets, self.counts = self.buckets[keep], self.counts[keep]
+
+    @classmethod
+    def from_amounts(cls, amounts) -> "QuantileSketch":
+        buckets = bucket_ids(amounts)
+        return cls(buckets, np.ones(len(buckets), dtype=np.int64))
+
+    @classmethod
+    def from_rows(cls, rows: pd.DataFrame, base: str) -> "QuantileSketch":
+        """Merge stored (currency, bucket, count) rows into one sketch of amounts in `base`.
+
+        Buckets in another currency are re-bucketed at their representative
+        value times the rate, which widens the error bound by one bucket.
+        """
+        if rows.empty:
+            return cls()
+        buckets = rows['bucket'].to_numpy(dtype=np.int64)
+        factors = get_rates().factors(rows['currency'], base)
+        converted = np.where(factors == 1.0, buckets, bucket_ids(bucket_values(buckets) * factors))
+        return cls(converted, rows['count'].to_numpy(dtype=np.int64))
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        return QuantileSketch(np.concatenate([self.buckets, other.buckets]),
+                              np.concatenate([self.counts, other.counts]))
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def clip(self, low: float, high: float) -> "QuantileSketch":
+        """Only the buckets that can hold amounts in [low, high]"""
+        keep = (self.buckets >= bucket_of(low)) & (self.buckets <= bucket_of(high))
+        return QuantileSketch(self.buckets[keep], self.counts[keep])
+
+    def quantiles(self, qs) -> np.ndarray:
+        """Amounts at ranks `qs` (0 to 1); NaN for an empty sketch"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not len(self.counts):
+            return np.full(len(qs), np.nan)
+        cumulative = np.cumsum(self.counts)
+        positions = np.searchsorted(cumulative, qs * (cumulative[-1] - 1), side='right')
+        return bucket_values(self.buckets[positions])
+
+    def quantile(self, q: float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def summary(self) -> Dict[str, float]:
+        """Count, median, the p25-p75 "typical" range and p90"""
+        p25, median, p75, p90 = self.quantiles([0.25, 0.5, 0.75, 0.9])
+        return {"count": self.count, "median": median, "typical_low": p25, "typical_high": p75, "p90": p90}
+
+
+def merge_all(sketches: Iterable[QuantileSketch]) -> QuantileSketch:
+    merged = QuantileSketch()
+    for sketch in sketches:
+        merged = merged.merge(sketch)
+    return merged
+
+
+def percentile_table(sketches: Dict[str, QuantileSketch]) -> pd.DataFrame:
+    """One row of QuantileSketch.summary per category, most expenses first"""
+    rows = [{"category": category, **sketch.summary()} for category, sketch in sketches.items() if sketch.count]
+    columns = ['category', 'count', 'median', 'typical_low', 'typical_high', 'p90']
+    table = pd.DataFrame(rows, columns=columns)
+    return table.sort_values('count', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def full_months(start: date, end: date) -> Optional[Tuple[str, str]]:
+    """First and last months ('YYYY-MM') lying entirely within [start, end], or None"""
+    first = start if start.day == 1 else (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+    last_month_end = (end + timedelta(days=1)).replace(day=1) - timedelta(days=1)
+    last = end.replace(day=1) if end == last_month_end else end.replace(day=1) - timedelta(days=1)
+    if first > last:
+        return None
+    return first.strftime('%Y-%m'), last.strftime('%Y-%m')
+
+
+# Per-category sketches for a month span, keyed by (user, base currency, rate
+# version, data version, first month, last month)
+_sketch_cache = LRUCache(512)
+
+
+def month_sketches(db: StorageBackend, user_id: int, base: str, version: int,
+                   start_month: Optional[str] = None, end_month: Optional[str] = None) -> Dict[str, QuantileSketch]:
+    """Per-category amount sketches in `base` over [start_month, end_month], merged from the stored ones"""
+    key = (user_id, base, get_rates().version, version, start_month, end_month)
+    cached = _sketch_cache.get(key)
+    if cached is not None:
+        return cached
+    rows = db.get_amount_sketches(user_id, start_month, end_month)
+    sketches = {category: QuantileSketch.from_rows(group, base) for category, group in rows.groupby('category')}
+    _sketch_cache.put(key, sketches)
+    return sketches
+
+
+def range_sketches(db: StorageBackend, user_id: int, base: str, version: int, start: date, end: date,
+                   expenses: Optional[pd.DataFrame] = None) -> Dict[str, QuantileSketch]:
+    """Per-category sketches for [start, end].
+
+    Whole months come from the stored sketches; only the days of partial
+    months at either end are sketched from rows: taken from `expenses` (the
+    range's rows, already converted to `base`) when given, else loaded.
+    """
+    months = full_months(start, end)
+    if months is None:
+        sketches, edges = {}, [(start, end)]
+    else:
+        sketches = dict(month_sketches(db, user_id, base, version, *months))
+        covered_from = date.fromisoformat(f"{months[0]}-01")
+        covered_to = pd.Period(months[1]).end_time.date()
+        edges = [(first, last) for first, last in ((start, covered_from - timedelta(days=1)),
+                                                     (covered_to + timedelta(days=1), end)) if first <= last]
+    for first, last in edges:
+        if expenses is None:
+            rows = convert_frame(db.get_expenses(user_id, first.isoformat(), last.isoformat()), base)
+        else:
+            days = day_numbers(expenses['date'])
+            rows = expenses[(days >= to_day(first)) & (days <= to_day(last))]
+        for category, group in rows.groupby('category'):
+            edge_sketch = QuantileSketch.from_amounts(group['amount'])
+            sketches[category] = sketches[category].merge(edge_sketch) if category in sketches else edge_sketch
+    return sketches
@@ -0,0 +1,269 @@
+# storage.py
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, List, Optional
+import config
+
+SHARD_MODES = ("none", "hash", "tenant")
+
+# Tables whose rows belong to one user and therefore live in that user's shard
+USER_TABLES = ("categories", "expenses", "budgets", "recurring_expenses", "user_stats", "user_category_stats",
+               "expense_archive", "archived_rollups", "change_log_state", "expense_changes",
+               "category_model_docs", "category_model_features", "monthly_category_totals", "budget_alerts",
+               "amount_sketches")
+
+# Placement lookups are cached for the whole process (the app builds a new
+# ExpenseTrackerDB per rerun); keyed by (catalog path, user id). A rebalance,
+# usually run from another process, bumps the catalog's placement epoch file;
+# a process seeing a new epoch drops its cached placements for that catalog.
+_placement_lock = threading.Lock()
+_placements: Dict[tuple, str] = {}
+_placement_epochs: Dict[str, int] = {}
+
+
+def shard_for_hash(user_id: int, shard_count: int) -> int:
+    """Stable shard number for a user id"""
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+
+class StorageRouter:
+    """Maps users to the SQLite file that holds their data.
+
+    The catalog database always holds the users table. With sharding off,
+    user data lives in the catalog too; in "hash" mode users are spread over
+    a fixed number of shard files, and in "tenant" mode each user gets a file.
+    Each user's current shard is recorded in users.shard, so placement stays
+    correct while a rebalance is moving data between files.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, shard_mode: Optional[str] = None,
+                 shard_count: Optional[int] = None, shard_dir: Optional[str] = None):
+        self.db_path = db_path or config.DB_PATH
+        self.shard_mode = shard_mode or config.SHARD_MODE
+        if self.shard_mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode: {self.shard_mode}")
+        self.shard_count = shard_count or config.SHARD_COUNT
+        self.shard_dir = shard_dir or config.SHARD_DIR or os.path.join(
+            os.path.dirname(os.path.abspath(self.db_path)), "shards")
+
+    @property
+    def sharded(self) -> bool:
+        return self.shard_mode != "none"
+
+    def shard_name_for_new_user(self, user_id: int) -> Optional[str]:
+        """Shard file name to place a newly created user in"""
+        if self.shard_mode == "hash":
+            return f"shard_{shard_for_hash(user_id, self.shard_count):03d}.db"
+        if self.shard_mode == "tenant":
+            return f"user_{user_id}.db"
+        return None
+
+    def shard_path(self, shard_name: Optional[str]) -> str:
+        """Absolute path of a shard file; None means the catalog"""
+        if not shard_name:
+            return self.db_path
+        return os.path.join(self.shard_dir, shard_name)
+
+    @property
+    def epoch_path(self) -> str:
+        """File whose counter changes whenever users move between files"""
+        return os.path.join(self.shard_dir, "placement.epoch")
+
+    def placement_epoch(self) -> int:
+        try:
+            with open(self.epoch_path) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump_placement_epoch(self):
+        """Make every process re-read placements from the catalog on its next lookup"""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        temp_path = f"{self.epoch_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(str(self.placement_epoch() + 1))
+        os.replace(temp_path, self.epoch_path)
+
+    def path_for_user(self, user_id: int) -> str:
+        """Path of the database file holding a user's data"""
+        if not self.sharded:
+            return self.db_path
+        key = (self.db_path, user_id)
+        epoch = self.placement_epoch()
+        with _placement_lock:
+            if _placement_epochs.get(self.db_path) != epoch:
+                for cached in [k for k in _placements if k[0] == self.db_path]:
+                    del _placements[cached]
+                _placement_epochs[self.db_path] = epoch
+            shard_name = _placements.get(key)
+        if shard_name is None:
+            conn = sqlite3.connect(self.db_path)
+            row = conn.execute("SELECT shard FROM users WHERE id = ?", (user_id,)).fetchone()
+            conn.close()
+            if row is None:
+                shard_name = self.shard_name_for_new_user(user_id)
+            else:
+                # Users created before sharding was enabled stay in the catalog until rebalanced
+                shard_name = row[0] or ""
+            with _placement_lock:
+                _placements[key] = shard_name
+        return self.shard_path(shard_name)
+
+    def remember_placement(self, user_id: int, shard_name: Optional[str]):
+        """Update the cached placement after a user is created or moved"""
+        with _placement_lock:
+            _placements[(self.db_path, user_id)] = shard_name or ""
+
+    def shard_paths(self) -> List[str]:
+        """Every file that may hold user data, for cross-shard scans"""
+        if not self.sharded:
+            return [self.db_path]
+        conn = sqlite3.connect(self.db_path)
+        names = [row[0] for row in conn.execute(
+            "SELECT DISTINCT shard FROM users WHERE shard IS NOT NULL")]
+        conn.close()
+        if os.path.isdir(self.shard_dir):
+            names += [name for name in os.listdir(self.shard_dir)
+                      if name.endswith(".db") and ".snapshot" not in name]
+        paths = [self.db_path] + [self.shard_path(name) for name in sorted(set(names))]
+        return [path for path in paths if os.path.exists(path)]
+
+
+def _copy_user_rows(source: sqlite3.Connection, destination: sqlite3.Connection, user_id: int):
+    """Copy one user's rows between files, letting the destination assign new ids.
+
+    Row ids are per file, so keeping the old ones could collide with users
+    already in the destination; recurring rule ids and the user's own
+    category ids are remapped on the rows that refer to them (built-in
+    category ids are the same in every file). Change-log entries refer to
+    the old expense ids, so they are not copied and the user's log floor is
+    raised to force clients to resync.
+    """
+    # Referenced table -> (referencing column, old id -> new id); unmapped
+    # recurring ids are dropped, unmapped category ids are built-in and kept
+    remapped = {"categories": ("category_id", {}), "recurring_expenses": ("recurring_id", {})}
+    tables = tuple(remapped) + tuple(t for t in USER_TABLES if t not in remapped)
+    destination.execute("DELETE FROM expense_changes WHERE user_id = ?", (user_id,))
+    for table in (t for t in tables if t != "expense_changes"):
+        destination.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+        cursor = source.execute(f"SELECT * FROM {table} WHERE user_id = ?", (user_id,))
+        columns = [col[0] for col in cursor.description]
+        id_index = columns.index("id") if "id" in columns else None
+        insert_columns = [col for col in columns if col != "id"]
+        insert = (f"INSERT INTO {table} ({', '.join(insert_columns)}) "
+                  f"VALUES ({', '.join('?' for _ in insert_columns)})")
+        references = [(insert_columns.index(column), ids, referenced == "categories")
+                      for referenced, (column, ids) in remapped.items() if column in insert_columns]
+
+        for row in cursor.fetchall():
+            values = list(row if id_index is None else row[:id_index] + row[id_index + 1:])
+            for index, ids, keep_unmapped in references:
+                if values[index] is not None:
+                    values[index] = ids.get(values[index], values[index] if keep_unmapped else None)
+            new_id = destination.execute(insert, values).lastrowid
+            if table in remapped:
+                remapped[table][1][row[id_index]] = new_id
+    # The audit trail stays with the old file; mark the move so point-in-time
+    # restores in the new file never reach back past it
+    destination.execute("INSERT INTO expense_audit (user_id, expense_id, op) VALUES (?, 0, 'moved')", (user_id,))
+    # Advance past every position a client could hold, so all of them resync
+    destination.execute("UPDATE change_log_state SET last_seq = last_seq + 1, floor_seq = last_seq + 1 "
+                        "WHERE user_id = ?", (user_id,))
+
+
+def rebalance(db, router: StorageRouter) -> int:
+    """Move users whose recorded shard differs from the router's placement.
+
+    Each user is copied into the target file and committed there before the
+    catalog entry is switched and the source rows are deleted, so an
+    interrupted run leaves every user readable from exactly one placement.
+    Switching bumps the placement epoch, so running processes stop using the
+    old file. A write to the old file between the copy and the switch would
+    be lost, so stop the app (and the API) while rebalancing.
+    Returns the number of users moved.
+    """
+    catalog = sqlite3.connect(router.db_path)
+    users = catalog.execute("SELECT id, shard FROM users").fetchall()
+    catalog.close()
+
+    moved = 0
+    for user_id, current in users:
+        target = router.shard_name_for_new_user(user_id)
+        if target == current:
+            continue
+        source_path = router.shard_path(current)
+        target_path = router.shard_path(target)
+        db.ensure_schema(target_path)
+
+        source = sqlite3.connect(source_path)
+        destination = sqlite3.connect(target_path)
+        try:
+            with destination:
+                _copy_user_rows(source, destination, user_id)
+
+            catalog = sqlite3.connect(router.db_path)
+            with catalog:
+                catalog.execute("UPDATE users SET shard = ? WHERE id = ?", (target, user_id))
+            catalog.close()
+            router.bump_placement_epoch()
+            router.remember_placement(user_id, target)
+
+            if source_path != target_path:
+                with source:
+                    for table in USER_TABLES:
+                        source.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+        finally:
+            source.close()
+            destination.close()
+        moved += 1
+    return moved
+
+
+def aggregate_stats(router: StorageRouter) -> List[Dict]:
+    """Per-shard user, expense and amount totals (in the base currency) for admin reporting"""
+    from currency import get_rates
+
+    rates = get_rates()
+    results = []
+    for path in router.shard_paths():
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            users, expenses = conn.execute(
+                "SELECT COUNT(DISTINCT user_id), COUNT(*) FROM expenses"
+            ).fetchone()
+            by_currency = conn.execute(
+                "SELECT currency, SUM(amount) FROM expenses GROUP BY currency"
+            ).fetchall()
+            total = float(sum(amount * factor for (_, amount), factor in zip(
+                by_currency, rates.factors([c for c, _ in by_currency], config.BASE_CURRENCY))))
+        except sqlite3.OperationalError:
+            # Catalog-only file in sharded mode has no expenses table
+            users, expenses, total = 0, 0, 0.0
+        finally:
+            conn.close()
+        results.append({"path": path, "users": users, "expenses": expenses, "total_amount": total})
+    return results
+
+
+if __name__ == "__main__":
+    from currency import format_amount
+    from database import ExpenseTrackerDB
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    storage_router = StorageRouter()
+    if command == "rebalance":
+        print(f"Moved {rebalance(ExpenseTrackerDB(router=storage_router), storage_router)} users")
+    elif command == "stats":
+        shard_stats = aggregate_stats(storage_router)
+        for shard in shard_stats:
+            print(f"{shard['path']}: {shard['users']} users, {shard['expenses']} expenses, "
+                  f"{format_amount(shard['total_amount'], config.BASE_CURRENCY)}")
+        print(f"TOTAL: {sum(s['users'] for s in shard_stats)} users, "
+              f"{sum(s['expenses'] for s in shard_stats)} expenses, "
+              f"{format_amount(sum(s['total_amount'] for s in shard_stats), config.BASE_CURRENCY)}")
+    else:
+        print("Usage: python storage.py [stats|rebalance]")
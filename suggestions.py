@@ -0,0 +1,180 @@
+# suggestions.py
+import bisect
+import heapq
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+import config
+from backend import StorageBackend
+from calendar_dim import day_numbers, to_day
+from session_memory import get_manager
+
+# Frequency counts lose half their weight for every this many days since last use
+RECENCY_HALF_LIFE_DAYS = 60
+QUICK_ADD_PREFIX = "quick add: "
+
+
+@dataclass
+class Suggestion:
+    description: str
+    category: str
+    amount: float
+    currency: str
+    count: int
+    score: float
+
+
+class _Entry:
+    """Aggregates for one normalized description"""
+    __slots__ = ("display", "count", "last_day", "categories", "amounts")
+
+    def __init__(self):
+        self.display = ""
+        self.count = 0
+        self.last_day = 0
+        self.categories: Counter = Counter()
+        self.amounts: Counter = Counter()
+
+
+def normalize(description: str) -> str:
+    """Lookup key for a description; Quick Add entries share the key of the plain name"""
+    key = " ".join(str(description or "").lower().split())
+    return key[len(QUICK_ADD_PREFIX):] if key.startswith(QUICK_ADD_PREFIX) else key
+
+
+class SuggestionIndex:
+    """Past descriptions of one user, for prefix lookups and Quick Add.
+
+    Keys are kept in a sorted list, so a prefix is a bisect range; each key
+    maps to its count, last use and most common category and amount. The
+    index is loaded once and then kept current from the change log, so
+    reruns never rescan the expense table.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.last_seq: Optional[int] = None
+        self._keys: List[str] = []
+        self._entries: Dict[str, _Entry] = {}
+        # Expense id -> (key, display, category, amount, currency, day), to undo edits and deletes
+        self._rows: Dict[int, Tuple] = {}
+
+    def _reset(self):
+        self._keys, self._entries, self._rows = [], {}, {}
+
+    def _add(self, expense_id: int, description: str, category: str, amount: float, currency: str, day: int):
+        key = normalize(description)
+        if not key:
+            return
+        display = str(description).strip()
+        if display.lower().startswith(QUICK_ADD_PREFIX):
+            display = display[len(QUICK_ADD_PREFIX):].strip()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+            bisect.insort(self._keys, key)
+        entry.count += 1
+        if day >= entry.last_day:
+            entry.last_day, entry.display = day, display
+        entry.categories[category] += 1
+        entry.amounts[(round(float(amount), 2), currency)] += 1
+        self._rows[expense_id] = (key, display, category, round(float(amount), 2), currency, day)
+
+    def _remove(self, expense_id: int):
+        row = self._rows.pop(expense_id, None)
+        if row is None:
+            return
+        key, _, category, amount, currency, _ = row
+        entry = self._entries[key]
+        entry.count -= 1
+        if entry.count <= 0:
+            del self._entries[key]
+            self._keys.pop(bisect.bisect_left(self._keys, key))
+            return
+        # Adding an empty Counter drops entries whose count fell to zero
+        entry.categories[category] -= 1
+        entry.categories += Counter()
+        entry.amounts[(amount, currency)] -= 1
+        entry.amounts += Counter()
+
+    def build(self, expenses: pd.DataFrame):
+        """Load a user's full history"""
+        self._reset()
+        if expenses.empty:
+            return
+        for row, day in zip(expenses.itertuples(index=False), day_numbers(expenses['date'])):
+            self._add(int(row.id), row.description, row.category, row.amount,
+                      getattr(row, 'currency', config.BASE_CURRENCY), int(day))
+
+    def sync(self, db: StorageBackend) -> int:
+        """Bring the index up to date; returns the number of changes applied.
+
+        While the change log still reaches back to a user's first write it
+        alone rebuilds the index; otherwise the full history is loaded once.
+        Later calls apply only the entries written since the previous sync.
+        """
+        if self.last_seq is None:
+            self._reset()
+            self.last_seq = 0
+            start = db.get_changes_since(self.user_id, 0, limit=1)
+            if start["reset"]:
+                # Replay from the position read before loading, so writes made
+                # during the load are not missed (replaying a change is idempotent)
+                self.last_seq = start["last_seq"]
+                self.build(db.get_expenses(self.user_id))
+        applied = 0
+        while True:
+            batch = db.get_changes_since(self.user_id, self.last_seq)
+            if batch["reset"]:
+                self.last_seq = None
+                return applied + self.sync(db)
+            for change in batch["changes"].itertuples(index=False):
+                self._remove(int(change.id))
+                if change.op == "upsert":
+                    self._add(int(change.id), change.description, change.category, change.amount,
+                              change.currency, to_day(change.date))
+            applied += len(batch["changes"])
+            self.last_seq = batch["last_seq"]
+            if not batch["has_more"]:
+                return applied
+
+    def _suggestion(self, key: str, today: int) -> Suggestion:
+        entry = self._entries[key]
+        (amount, currency), _ = entry.amounts.most_common(1)[0]
+        category, _ = entry.categories.most_common(1)[0]
+        score = entry.count * 0.5 ** (max(today - entry.last_day, 0) / RECENCY_HALF_LIFE_DAYS)
+        return Suggestion(entry.display, category, amount, currency, entry.count, score)
+
+    def lookup(self, prefix: str, limit: int = 5) -> List[Suggestion]:
+        """Best-scoring past descriptions starting with `prefix`"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + "\uffff", lo)
+        today = to_day(date.today())
+        matches = (self._suggestion(key, today) for key in self._keys[lo:hi])
+        return heapq.nlargest(limit, matches, key=lambda s: s.score)
+
+    def top(self, limit: int = 4) -> List[Suggestion]:
+        """The user's most frequent recent expenses, for Quick Add"""
+        today = to_day(date.today())
+        return heapq.nlargest(limit, (self._suggestion(key, today) for key in self._keys), key=lambda s: s.score)
+
+
+def get_suggestion_index(session_state, db: StorageBackend, user_id: int) -> SuggestionIndex:
+    """This session's suggestion index for a user, synced with the latest changes.
+
+    Like the anomaly detector it lives in the session memory manager, so it
+    counts against the global budget and is rebuilt if evicted.
+    """
+    manager = get_manager()
+    key = f"suggestion_index_{user_id}"
+    index = manager.get(session_state, key)
+    if index is None:
+        index = SuggestionIndex(user_id)
+        manager.put(session_state, key, index)
+    index.sync(db)
+    return index
@@ -0,0 +1,35 @@
+# tests/conftest.py
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from database import ExpenseTrackerDB  # noqa: E402
+from storage import StorageRouter  # noqa: E402
+
+
+@pytest.fixture
+def tmp_config(tmp_path, monkeypatch):
+    """Point every file the app writes at tmp_path"""
+    monkeypatch.setattr(config, "DB_PATH", str(tmp_path / "expense_tracker.db"))
+    monkeypatch.setattr(config, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(config, "BACKUP_DIR", str(tmp_path / "backups"))
+    monkeypatch.setattr(config, "SLOW_QUERY_LOG", "")
+    return tmp_path
+
+
+@pytest.fixture
+def db(tmp_config):
+    """Empty SQLite database in a temporary directory"""
+    return ExpenseTrackerDB(router=StorageRouter(config.DB_PATH, shard_mode="none"))
+
+
+@pytest.fixture
+def make_user(db):
+    """Create a user and return its id"""
+    def make(username: str) -> int:
+        assert db.create_user(username, f"{username}@example.com", "secret123")
+        return db.authenticate_user(username, "secret123")['id']
+    return make
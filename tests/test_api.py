@@ -0,0 +1,84 @@
+# tests/test_api.py
+import json
+import threading
+import urllib.request
+from urllib.error import HTTPError
+import pytest
+from api import make_server
+
+
+@pytest.fixture
+def api(db, make_user):
+    """Running API server; yields a request(method, path, body) helper authenticated as alice"""
+    server = make_server("127.0.0.1", 0, db)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    token = None
+
+    def request(method: str, path: str, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        req = urllib.request.Request(base + path, data=data, method=method)
+        req.add_header("Content-Type", "application/json")
+        if token:
+            req.add_header("Authorization", f"Bearer {token}")
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status, json.loads(response.read() or b"null")
+        except HTTPError as e:
+            return e.code, json.loads(e.read() or b"null")
+
+    make_user("alice")
+    token = request("POST", "/api/token", {"username": "alice", "password": "secret123"})[1]["token"]
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def _expense_id(db, username: str) -> int:
+    user_id = db.authenticate_user(username, "secret123")['id']
+    return int(db.get_expenses(user_id)['id'].iloc[0])
+
+
+EXPENSE = {"amount": 12.5, "category": "Food & Dining", "description": "Lunch", "date": "2026-10-01"}
+
+
+def test_update_and_delete_missing_expense_return_404(api):
+    assert api("PUT", "/api/expenses/999", EXPENSE)[0] == 404
+    assert api("DELETE", "/api/expenses/999")[0] == 404
+
+
+def test_update_and_delete_another_users_expense_return_404(api, db, make_user):
+    other_id = make_user("bob")
+    assert db.add_expense(other_id, 40.0, "Transportation", "Taxi", "2026-10-02")
+    expense_id = _expense_id(db, "bob")
+
+    assert api("PUT", f"/api/expenses/{expense_id}", EXPENSE)[0] == 404
+    assert api("DELETE", f"/api/expenses/{expense_id}")[0] == 404
+    expenses = db.get_expenses(other_id)
+    assert len(expenses) == 1 and expenses['amount'].iloc[0] == 40.0
+
+
+def test_updating_a_missing_expense_adds_no_category(api, db, make_user):
+    user_id = db.authenticate_user("alice", "secret123")['id']
+    other_id = make_user("bob")
+    assert db.add_expense(other_id, 40.0, "Transportation", "Taxi", "2026-10-02")
+    categories = db.get_categories(user_id)['name'].tolist()
+
+    for expense_id in (999, _expense_id(db, "bob")):
+        assert api("PUT", f"/api/expenses/{expense_id}", {**EXPENSE, "category": "Bogus Cat"})[0] == 404
+    assert db.get_categories(user_id)['name'].tolist() == categories
+
+
+def test_batch_reports_404_per_missing_item(api, db):
+    assert api("POST", "/api/expenses", EXPENSE)[0] == 201
+    expense_id = _expense_id(db, "alice")
+
+    status, payload = api("POST", "/api/batch", {"operations": [
+        {"op": "update", "id": expense_id, **EXPENSE, "amount": 20},
+        {"op": "update", "id": 999, **EXPENSE},
+        {"op": "delete", "id": 999},
+        {"op": "delete", "id": expense_id},
+    ]})
+    assert status == 200
+    assert [result["status"] for result in payload["results"]] == [200, 404, 404, 200]
@@ -0,0 +1,20 @@
+# tests/test_changelog.py
+
+
+def test_changes_since_reports_added_expense_ids(db, make_user):
+    user_id = make_user("alice")
+    # Edits add audit rows but no expenses, so audit and expense ids stop lining up
+    assert db.add_expense(user_id, 5.0, "Shopping", "Pen", "2026-09-30")
+    first_id = int(db.get_expenses(user_id)['id'].iloc[0])
+    for amount in (6.0, 7.0):
+        assert db.update_expense(first_id, user_id, amount, "Shopping", "Pen", "2026-09-30")
+    start = db.get_changes_since(user_id, 0)["last_seq"]
+    assert db.add_expense(user_id, 12.5, "Food & Dining", "Lunch", "2026-10-01")
+    assert db.add_expenses(user_id, [(40.0, "Transportation", "Taxi", "2026-10-02", None),
+                                     (8.0, "Food & Dining", "Coffee", "2026-10-03", None)]) == 2
+
+    changes = db.get_changes_since(user_id, start)
+    assert not changes["reset"]
+    added = [expense_id for expense_id in db.get_expenses(user_id)['id'] if expense_id != first_id]
+    assert sorted(changes["changes"]['id'].tolist()) == sorted(added)
+    assert set(changes["changes"]['op']) == {"upsert"}
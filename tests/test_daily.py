@@ -0,0 +1,21 @@
+# tests/test_daily.py
+from datetime import date
+import pytest
+from daily import once_a_day
+
+
+def test_runs_once_per_day_and_retries_after_an_error():
+    calls = []
+
+    @once_a_day(skipped=-1)
+    def job(db, today):
+        calls.append((db, today))
+        if len(calls) == 1:
+            raise RuntimeError("first run fails")
+        return len(calls)
+
+    with pytest.raises(RuntimeError):
+        job("db")
+    assert job("db") == 2
+    assert job("db") == -1
+    assert calls == [("db", date.today())] * 2
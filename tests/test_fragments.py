@@ -0,0 +1,143 @@
+# tests/test_fragments.py
+"""Storage calls made by single interactions with the full app.
+
+A widget inside a page section must rerun only that section, without
+reloading its data. AppTest reruns the whole script for every interaction,
+so the script runner is replaced by one that reruns only the fragment that
+drew the changed widget, as the browser asks.
+"""
+import dataclasses
+import functools
+import os
+import random
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+import pytest
+import backend
+import config
+import prefetch
+from benchmark import CATEGORIES, seed
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+class CountingBackend:
+    """Backend wrapper recording the name of every storage call"""
+
+    def __init__(self, db):
+        self._db = db
+        self.calls: List[str] = []
+
+    def __getattr__(self, name: str):
+        value = getattr(self._db, name)
+        if name.startswith("_") or not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def counted(*args, **kwargs):
+            self.calls.append(name)
+            return value(*args, **kwargs)
+        return counted
+
+
+@pytest.fixture
+def fragment_runner(monkeypatch):
+    """Make AppTest rerun only the fragment set on the returned runner class"""
+    import streamlit.testing.v1.app_test as app_test
+    from streamlit.runtime.scriptrunner_utils.script_requests import RerunData, ScriptRequests
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    class FragmentRunner(LocalScriptRunner):
+        """Notes which fragment drew each widget; while `fragment` is set, runs rerun that fragment alone"""
+        widget_fragments: Dict[str, str] = {}
+        fragment: Optional[str] = None
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if FragmentRunner.fragment:
+                # Drop the full run the base class queues on creation; it would absorb the fragment rerun
+                self._requests = ScriptRequests()
+
+        def request_rerun(self, rerun_data: RerunData) -> bool:
+            if FragmentRunner.fragment:
+                rerun_data = dataclasses.replace(rerun_data, fragment_id_queue=[FragmentRunner.fragment])
+            return super().request_rerun(rerun_data)
+
+        def forward_msgs(self):
+            messages = super().forward_msgs()
+            for message in messages:
+                if message.WhichOneof("type") != "delta" or not message.delta.fragment_id:
+                    continue
+                element = message.delta.new_element
+                kind = element.WhichOneof("type")
+                widget_id = getattr(getattr(element, kind), "id", "") if kind else ""
+                if widget_id:
+                    FragmentRunner.widget_fragments[widget_id] = message.delta.fragment_id
+            return messages
+
+    monkeypatch.setattr(app_test, "LocalScriptRunner", FragmentRunner)
+    return FragmentRunner
+
+
+@pytest.fixture
+def counting_db(db, monkeypatch):
+    """The temporary database, seeded with one user and counting its calls; app.py gets it too"""
+    counting = CountingBackend(db)
+    seed(counting, 1, 200, random.Random(42))
+    # app.py asks for its backend on every run
+    monkeypatch.setattr(backend, "get_backend", lambda name=None: counting)
+    # Background prefetches would add calls at unpredictable times
+    monkeypatch.setattr(config, "PREFETCH_WORKERS", 0)
+    monkeypatch.setattr(prefetch, "_prefetcher", None)
+    return counting
+
+
+def _labelled(widgets, label: str):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def _first_edit_button(app):
+    return next(button for button in app.button if button.key and button.key.startswith("edit_"))
+
+
+# (name, page, action, storage calls expected). An action returns the widget it
+# changed; None reloads the page, a full run that also reads the sidebar's
+# alerts, stats and diagnostics.
+INTERACTIONS: List[Tuple[str, str, Optional[Callable], int]] = [
+    ("reload dashboard", "Dashboard", None, 5),
+    ("moving-average span", "Dashboard",
+     lambda app: app.radio(key="dashboard_average_span").set_value("1 year"), 0),
+    ("reload manage expenses", "Manage Expenses", None, 5),
+    ("amount slider", "Manage Expenses",
+     lambda app: app.slider[0].set_value((app.slider[0].min + 100, app.slider[0].max)), 0),
+    ("category filter", "Manage Expenses",
+     lambda app: _labelled(app.selectbox, "📂 Category").set_value(CATEGORIES[0]), 0),
+    ("search", "Manage Expenses", lambda app: _labelled(app.text_input, "🔍 Search").input("benchmark"), 0),
+    ("sort", "Manage Expenses",
+     lambda app: _labelled(app.selectbox, "🔄 Sort by").set_value("Amount (High to Low)"), 0),
+    ("open edit form", "Manage Expenses", lambda app: _first_edit_button(app).click(), 1),
+]
+
+
+@pytest.mark.parametrize("page, action, expected", [interaction[1:] for interaction in INTERACTIONS],
+                         ids=[interaction[0] for interaction in INTERACTIONS])
+def test_interaction_storage_calls(fragment_runner, counting_db, page, action, expected):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    app.session_state["user"] = counting_db.authenticate_user("bench0", "benchmark")
+    app.run()
+    _labelled(app.sidebar.selectbox, "Navigate").set_value(page).run()
+    counting_db.calls.clear()
+    if action is None:
+        app.run()
+    else:
+        widget = action(app)
+        fragment_runner.fragment = fragment_runner.widget_fragments.get(widget.id)
+        try:
+            widget.run()
+        finally:
+            fragment_runner.fragment = None
+
+    assert not app.exception, [error.value for error in app.exception]
+    assert len(counting_db.calls) == expected, dict(Counter(counting_db.calls))
@@ -0,0 +1,20 @@
+# tests/test_lru.py
+from lru import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get_many(["a", "b", "c"]) == [1, None, 3]
+    assert len(cache) == 2
+
+
+def test_cached_none_differs_from_missing():
+    cache = LRUCache(2)
+    missing = object()
+    cache.put("a", None)
+    assert cache.get("a", missing) is None
+    assert cache.get("b", missing) is missing
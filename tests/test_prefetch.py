@@ -0,0 +1,51 @@
+# tests/test_prefetch.py
+from datetime import date
+import pytest
+from prefetch import Prefetcher
+from session_memory import SessionMemoryManager
+
+
+@pytest.fixture
+def user_id(db, make_user):
+    user_id = make_user("alice")
+    assert db.add_expense(user_id, 12.5, "Food & Dining", "Lunch", date.today().isoformat())
+    return user_id
+
+
+def _prefetch(prefetcher: Prefetcher, state, db, user_id: int, *pages: str):
+    """Prefetch `pages` and wait until their values are stored"""
+    for page in pages:
+        assert prefetcher.submit(state, db, user_id, "INR", page)
+    for session in prefetcher._sessions.values():
+        for future, _ in session.jobs.values():
+            future.result()
+    # Submitting a page again collects the finished values and skips it
+    assert not prefetcher.submit(state, db, user_id, "INR", pages[0])
+
+
+def test_prefetched_values_are_held_by_the_memory_manager(db, user_id):
+    memory = SessionMemoryManager(64 * 1024 * 1024, None, 3600)
+    prefetcher, state = Prefetcher(1, 4, 3600, memory), {}
+    _prefetch(prefetcher, state, db, user_id, "Dashboard")
+    assert memory.session_usage(state)["cached"] > 0
+
+    expenses = prefetcher.take(state, ("expenses", "INR"), lambda: db.get_user_stats(user_id)['version'])
+    assert len(expenses) == 1
+    assert memory.session_usage(state)["cached"] == 0
+
+    _prefetch(prefetcher, state, db, user_id, "Dashboard")
+    prefetcher.cancel(state)
+    assert memory.session_usage(state)["cached"] == 0
+
+
+def test_values_evicted_over_budget_are_loaded_again(db, user_id):
+    # No room and no spilling: each value stored evicts the one before
+    memory = SessionMemoryManager(0, None, 3600)
+    prefetcher, state = Prefetcher(1, 4, 3600, memory), {}
+    _prefetch(prefetcher, state, db, user_id, "Dashboard", "Budget Tracker")
+
+    today = date.today()
+    keys = [("expenses", "INR"), ("month_expenses", "INR", today.year, today.month)]
+    taken = [prefetcher.take(state, key, lambda: db.get_user_stats(user_id)['version']) for key in keys]
+    assert sum(value is not None for value in taken) == 1
+    assert prefetcher.totals()["hits"] == 1 and prefetcher.totals()["misses"] == 1
@@ -0,0 +1,22 @@
+# tests/test_recurring.py
+import time
+from datetime import date, timedelta
+import backup
+from recurring import RecurringScheduler
+
+
+def test_materialized_expenses_survive_restore_to_now(db, make_user):
+    user_id = make_user("alice")
+    # Earlier expenses keep the ids of rows the write helpers insert apart from expense ids
+    for amount in (5.0, 6.0):
+        assert db.add_expense(user_id, amount, "Shopping", "Pen", "2025-01-15")
+    backup.run_backup(db)
+    start = date.today() - timedelta(days=14)
+    assert db.add_recurring_expense(user_id, 100.0, "Food & Dining", "Milk", "weekly", start.isoformat())
+    assert RecurringScheduler(db).run() == 3
+    expense_ids = sorted(db.get_expenses(user_id)['id'].tolist())
+
+    time.sleep(0.01)
+    backup.restore_user(db, user_id, backup._utc_now())
+    assert sorted(db.get_expenses(user_id)['id'].tolist()) == expense_ids
+    assert db.get_user_stats(user_id)['count'] == 5
@@ -0,0 +1,24 @@
+# tests/test_session_memory.py
+import os
+import stat
+from session_memory import SessionMemoryManager
+
+
+def test_spills_go_to_a_private_directory_removed_on_close(tmp_path):
+    manager = SessionMemoryManager(budget_bytes=1, spill_dir=str(tmp_path), idle_seconds=3600)
+    state = {}
+    manager.put(state, "first", list(range(1000)))
+    manager.put(state, "second", list(range(1000)))
+    assert manager.totals()["spills"] == 1
+
+    (private_dir,) = os.listdir(tmp_path)
+    assert private_dir.startswith("daily_budget_spill-")
+    assert stat.S_IMODE(os.stat(tmp_path / private_dir).st_mode) == 0o700
+    assert manager.get(state, "first") == list(range(1000))
+
+    manager.put(state, "third", list(range(1000)))
+    manager.close()
+    assert os.listdir(tmp_path) == []
+    # Spilled objects are gone; resident ones stay
+    assert manager.get(state, "second") is None
+    assert manager.get(state, "third") == list(range(1000))
@@ -0,0 +1,43 @@
+# tests/test_storage.py
+import os
+import sqlite3
+import config
+from database import ExpenseTrackerDB
+from storage import StorageRouter, rebalance
+
+
+def test_rebalance_from_another_process_moves_cached_placements(tmp_config):
+    router = StorageRouter(config.DB_PATH, shard_mode="hash", shard_count=4)
+    db = ExpenseTrackerDB(router=router)
+    assert db.create_user("alice", "alice@example.com", "secret123")
+    user_id = db.authenticate_user("alice", "secret123")['id']
+    assert db.add_expense(user_id, 10.0, "Food & Dining", "Lunch", "2026-10-01")
+    old_path = router.path_for_user(user_id)
+
+    # Simulate the rebalance process: its own router, and a cache this process does not share
+    other = StorageRouter(config.DB_PATH, shard_mode="tenant")
+    other.remember_placement = lambda *args: None
+    assert rebalance(ExpenseTrackerDB(router=other), other) == 1
+
+    new_path = router.path_for_user(user_id)
+    assert new_path != old_path
+    assert os.path.basename(new_path) == f"user_{user_id}.db"
+    assert len(db.get_expenses(user_id)) == 1
+
+
+def test_placement_is_read_once_per_epoch(tmp_config):
+    router = StorageRouter(config.DB_PATH, shard_mode="hash", shard_count=4)
+    db = ExpenseTrackerDB(router=router)
+    assert db.create_user("bob", "bob@example.com", "secret123")
+    user_id = db.authenticate_user("bob", "secret123")['id']
+    path = router.path_for_user(user_id)
+
+    # Without an epoch change the cached placement is used
+    conn = sqlite3.connect(config.DB_PATH)
+    with conn:
+        conn.execute("UPDATE users SET shard = 'elsewhere.db' WHERE id = ?", (user_id,))
+    conn.close()
+    assert router.path_for_user(user_id) == path
+
+    router.bump_placement_epoch()
+    assert router.path_for_user(user_id) == router.shard_path("elsewhere.db")
@@ -1,7 +1,10 @@
 # utils.py
+import os
 import streamlit as st
 
 def load_css(file_path):
-    """Loads an external CSS file into the Streamlit app."""
+    """Loads an external CSS file into the Streamlit app; relative paths resolve against the project directory."""
+    if not os.path.isabs(file_path):
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path)
     with open(file_path) as f:
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
\ No newline at end of file
@@ -1,31 +1,145 @@
 # pages/add_expense.py
+import pandas as pd
 import streamlit as st
 from datetime import datetime
-from database import ExpenseTrackerDB
+from typing import List, Optional, Tuple
+from backend import StorageBackend
+import config
+from anomalies import get_existing_detector
+from categories import MAX_CATEGORY_NAME_LENGTH
+from categorizer import SUGGEST_MIN_CONFIDENCE, CategoryModel, get_model
+from currency import available_currencies, format_amount, get_rates, session_currency
+from suggestions import Suggestion, get_suggestion_index, normalize
 
+# Quick Add defaults (in the base currency) for users without enough history
+DEFAULT_QUICK_EXPENSES = [
+    ("Coffee", 50, "Food & Dining"),
+    ("Lunch", 120, "Food & Dining"),
+    ("Gas", 350, "Transportation"),
+    ("Groceries", 1000, "Food & Dining")
+]
 
-def show_add_expense(db: ExpenseTrackerDB):
+
+def _short_amount(amount: float, currency: str) -> str:
+    return format_amount(amount, currency, decimals=0 if float(amount).is_integer() else 2)
+
+
+def _apply_suggestion(suggestion: Suggestion, category_names, currencies):
+    """Pre-fill the form from a suggestion (runs before the widgets are rebuilt)"""
+    st.session_state.add_amount = max(float(suggestion.amount), 1.0)
+    st.session_state.add_description = suggestion.description
+    if suggestion.category in category_names:
+        st.session_state.add_category = suggestion.category
+    if suggestion.currency in currencies:
+        st.session_state.add_currency = suggestion.currency
+
+
+def _apply_category(description: str, category: str):
+    """Pre-fill the description and the categorizer's pick"""
+    st.session_state.add_description = description
+    st.session_state.add_category = category
+
+
+def _create_category(db: StorageBackend, category_names: List[str]):
+    """Save the New Category form and select the category (runs before the widgets are rebuilt)"""
+    name = st.session_state.new_category_name.strip()
+    if not name:
+        st.session_state.new_category_message = (False, "Enter a name for the category.")
+    elif name in category_names:
+        st.session_state.new_category_message = (False, f"{name} already exists.")
+    elif db.add_category(st.session_state.user['id'], name,
+                         description=st.session_state.new_category_description.strip()):
+        st.session_state.add_category = name
+        st.session_state.new_category_message = (True, f"Added {name}.")
+    else:
+        st.session_state.new_category_message = (False, "Failed to add the category. Please try again.")
+
+
+def _prepare_import(raw: pd.DataFrame, model: Optional[CategoryModel], category_names: List[str],
+                    currencies: List[str], default_currency: str) -> Tuple[pd.DataFrame, int]:
+    """Normalize an uploaded CSV and fill missing or unknown categories from the categorizer.
+
+    Returns the importable rows (with an `auto` flag on predicted categories)
+    and the number of rows skipped for a bad date or amount.
+    """
+    columns = {str(c).strip().lower(): c for c in raw.columns}
+    if not {'date', 'amount'} <= columns.keys():
+        raise ValueError("The file needs at least 'date' and 'amount' columns")
+
+    def column(name: str, default) -> pd.Series:
+        return raw[columns[name]] if name in columns else pd.Series(default, index=raw.index, dtype=object)
+
+    rows = pd.DataFrame({
+        'date': pd.to_datetime(raw[columns['date']], errors='coerce').dt.strftime('%Y-%m-%d'),
+        'amount': pd.to_numeric(raw[columns['amount']], errors='coerce'),
+        'description': column('description', '').fillna('').astype(str).str.strip(),
+        'category': column('category', None).astype(object),
+        'currency': column('currency', default_currency).fillna(default_currency).astype(str).str.upper(),
+    })
+    valid = rows['date'].notna() & (rows['amount'] > 0)
+    rows = rows[valid].reset_index(drop=True)
+    rows.loc[~rows['currency'].isin(currencies), 'currency'] = default_currency
+
+    rows['auto'] = ~rows['category'].isin(category_names)
+    if rows['auto'].any():
+        predicted = pd.Series("Other", index=rows.index[rows['auto']], dtype=object)
+        if model is not None:
+            categories, _ = model.predict(rows.loc[rows['auto'], 'description'])
+            predicted[:] = categories
+            predicted[~predicted.isin(category_names)] = "Other"
+        rows.loc[rows['auto'], 'category'] = predicted
+    return rows, int((~valid).sum())
+
+
+def show_add_expense(db: StorageBackend):
     """Display add expense form with enhanced UI"""
     st.markdown('<h2><i class="fas fa-plus-circle icon"></i>Add New Expense</h2>',
                 unsafe_allow_html=True)
 
-    # Enhanced categories with icons and descriptions
-    categories = [
-        ("Food & Dining", "fas fa-utensils", "Restaurants, groceries, beverages"),
-        ("Transportation", "fas fa-car", "Gas, public transport, parking"),
-        ("Housing", "fas fa-home", "Rent, utilities, maintenance"),
-        ("Shopping", "fas fa-shopping-bag",
-         "Clothing, electronics, general purchases"),
-        ("Healthcare", "fas fa-heartbeat", "Medical bills, pharmacy, insurance"),
-        ("Entertainment", "fas fa-film", "Movies, games, subscriptions"),
-        ("Education", "fas fa-graduation-cap", "Books, courses, tuition"),
-        ("Business", "fas fa-briefcase", "Office supplies, professional services"),
-        ("Travel", "fas fa-plane", "Flights, hotels, vacation expenses"),
-        ("Utilities", "fas fa-bolt", "Electricity, water, internet, phone"),
-        ("Clothing", "fas fa-tshirt", "Apparel, shoes, accessories"),
-        ("Gifts", "fas fa-gift", "Presents, donations, charity"),
-        ("Other", "fas fa-ellipsis-h", "Miscellaneous expenses")
-    ]
+    # Built-in categories followed by the user's own
+    categories = db.get_categories(st.session_state.user['id'])
+    category_names = categories['name'].tolist()
+    currencies = available_currencies()
+    base_currency = session_currency(st.session_state)
+    st.session_state.setdefault("add_currency", base_currency)
+
+    # Past descriptions come from an in-memory index kept current from the
+    # change log, so lookups never rescan the expense table
+    index = get_suggestion_index(st.session_state, db, st.session_state.user['id'])
+
+    query = st.text_input(
+        "🔎 Smart Suggestions",
+        key="suggestion_query",
+        placeholder="Start typing a past expense, e.g. coffee",
+        help="Pick a match to fill in its usual category and amount"
+    )
+    if query.strip():
+        matches = index.lookup(query)
+        if matches:
+            suggestion_cols = st.columns(len(matches))
+            for i, suggestion in enumerate(matches):
+                with suggestion_cols[i]:
+                    st.button(
+                        f"{suggestion.description}\n{_short_amount(suggestion.amount, suggestion.currency)} · {suggestion.category}",
+                        key=f"suggestion_{i}",
+                        use_container_width=True,
+                        on_click=_apply_suggestion,
+                        args=(suggestion, category_names, currencies)
+                    )
+        else:
+            st.caption("No past expenses match. Fill in the form below.")
+
+        # Category guessed from the words of the query, learned from this user's history
+        model = get_model(db, st.session_state.user['id'])
+        if model is not None:
+            guess, confidence = model.predict_one(query)
+            if guess in category_names and confidence >= SUGGEST_MIN_CONFIDENCE:
+                st.button(
+                    f"🏷️ Looks like {guess} ({confidence:.0%}) — use it",
+                    key="category_suggestion",
+                    on_click=_apply_category,
+                    args=(query.strip(), guess)
+                )
 
     with st.form("add_expense_form", clear_on_submit=True):
         st.markdown(
@@ -34,19 +148,28 @@ def show_add_expense(db: ExpenseTrackerDB):
         col1, col2 = st.columns(2)
 
         with col1:
-            amount = st.number_input(
-                "💰 Amount (₹)",
-                min_value=1.00,
-                step=1.00,
-                format="%.2f",
-                help="Enter the expense amount in Rupees"
-            )
+            amount_col, currency_col = st.columns([2, 1])
+            with amount_col:
+                amount = st.number_input(
+                    "💰 Amount",
+                    min_value=1.00,
+                    step=1.00,
+                    format="%.2f",
+                    key="add_amount",
+                    help="Enter the expense amount in the selected currency"
+                )
+            with currency_col:
+                currency = st.selectbox(
+                    "💱 Currency",
+                    options=currencies,
+                    key="add_currency"
+                )
 
             # Category selection with enhanced display
-            category_names = [cat[0] for cat in categories]
             selected_category = st.selectbox(
                 "📂 Category",
                 options=category_names,
+                key="add_category",
                 help="Select the most appropriate category for this expense"
             )
 
@@ -61,7 +184,8 @@ def show_add_expense(db: ExpenseTrackerDB):
                 "📝 Description",
                 placeholder="Enter a brief description of the expense...",
                 help="Optional: Add details about this expense",
-                max_chars=200
+                max_chars=200,
+                key="add_description"
             )
 
         # Submit section
@@ -77,12 +201,23 @@ def show_add_expense(db: ExpenseTrackerDB):
 
         if submit_button:
             if amount > 0:
+                # Warn about likely duplicates using the index built on earlier page loads,
+                # which holds amounts in the display currency
+                detector = get_existing_detector(
+                    st.session_state, st.session_state.user['id'])
+                converted_amount = amount * get_rates().factors([currency], base_currency)[0]
+                if detector and detector.check_candidate(
+                        converted_amount, selected_category, expense_date.strftime('%Y-%m-%d')):
+                    st.markdown(
+                        '<div class="alert-warning"><i class="fas fa-clone icon"></i>A matching expense with the same amount and category already exists around this date. Check Manage Expenses if this was added twice.</div>', unsafe_allow_html=True)
+
                 if db.add_expense(
                     st.session_state.user['id'],
                     amount,
                     selected_category,
                     description.strip(),
-                    expense_date.strftime('%Y-%m-%d')
+                    expense_date.strftime('%Y-%m-%d'),
+                    currency
                 ):
                     st.markdown(
                         '<div class="alert-success"><i class="fas fa-check-circle icon"></i>Expense added successfully!</div>', unsafe_allow_html=True)
@@ -92,7 +227,7 @@ def show_add_expense(db: ExpenseTrackerDB):
                     st.markdown(f'''
                     <div class="metric-card" style="margin-top: 1rem;">
                         <h4><i class="fas fa-receipt icon"></i>Expense Summary</h4>
-                        <p><strong>Amount:</strong> ₹{amount:.2f}</p>
+                        <p><strong>Amount:</strong> {format_amount(amount, currency, grouped=False)}</p>
                         <p><strong>Category:</strong> {selected_category}</p>
                         <p><strong>Date:</strong> {expense_date.strftime('%B %d, %Y')}</p>
                         <p><strong>Description:</strong> {description if description.strip() else 'No description provided'}</p>
@@ -103,30 +238,87 @@ def show_add_expense(db: ExpenseTrackerDB):
                         '<div class="alert-error"><i class="fas fa-exclamation-triangle icon"></i>Failed to add expense. Please try again.</div>', unsafe_allow_html=True)
             else:
                 st.markdown(
-                    '<div class="alert-warning"><i class="fas fa-info-circle icon"></i>Please enter a valid amount greater than ₹0.00.</div>', unsafe_allow_html=True)
+                    '<div class="alert-warning"><i class="fas fa-info-circle icon"></i>Please enter a valid amount greater than zero.</div>', unsafe_allow_html=True)
+
+    # User-defined categories; the new one is selected in the form above
+    with st.expander("🏷️ New Category"):
+        with st.form("category_form", clear_on_submit=True):
+            name_col, description_col = st.columns([1, 2])
+            with name_col:
+                st.text_input("Name", max_chars=MAX_CATEGORY_NAME_LENGTH, key="new_category_name")
+            with description_col:
+                st.text_input("Description", placeholder="What belongs in this category?",
+                              key="new_category_description")
+            st.form_submit_button("➕ Add Category", on_click=_create_category,
+                                  args=(db, category_names))
+        message = st.session_state.pop("new_category_message", None)
+        if message:
+            (st.success if message[0] else st.warning)(message[1])
 
     # Quick add buttons for common expenses
     st.markdown("---")
     st.markdown('<h4><i class="fas fa-bolt icon"></i>Quick Add</h4>',
                 unsafe_allow_html=True)
 
-    quick_expenses = [
-        ("Coffee", 50, "Food & Dining"),
-        ("Lunch", 120, "Food & Dining"),
-        ("Gas", 350, "Transportation"),
-        ("Groceries", 1000, "Food & Dining")
-    ]
+    # The user's most frequent recent expenses, topped up with defaults
+    quick_expenses = [(s.description, s.amount, s.category, s.currency) for s in index.top(len(DEFAULT_QUICK_EXPENSES))]
+    used = {normalize(name) for name, *_ in quick_expenses}
+    for name, amount, category in DEFAULT_QUICK_EXPENSES:
+        if len(quick_expenses) < len(DEFAULT_QUICK_EXPENSES) and normalize(name) not in used:
+            quick_expenses.append((name, amount, category, config.BASE_CURRENCY))
 
     cols = st.columns(len(quick_expenses))
-    for i, (name, amount, category) in enumerate(quick_expenses):
+    for i, (name, amount, category, quick_currency) in enumerate(quick_expenses):
         with cols[i]:
-            if st.button(f"{name}\n₹{amount}", key=f"quick_{i}", use_container_width=True):
+            label = _short_amount(amount, quick_currency)
+            if st.button(f"{name}\n{label}", key=f"quick_{i}", use_container_width=True):
                 if db.add_expense(
                     st.session_state.user['id'],
                     amount,
                     category,
                     f"Quick add: {name}",
-                    datetime.now().strftime('%Y-%m-%d')
+                    datetime.now().strftime('%Y-%m-%d'),
+                    quick_currency
                 ):
-                    st.success(f"Added {name} (₹{amount}) successfully!")
+                    st.success(f"Added {name} ({label}) successfully!")
                     st.rerun()
+
+    # Bulk import; rows without a known category are categorized automatically
+    st.markdown("---")
+    with st.expander("📥 Import from CSV"):
+        st.caption("Columns: date, amount, description, and optionally category and currency. "
+                   "Missing categories are suggested from your past expenses.")
+        uploaded = st.file_uploader("CSV file", type="csv", key="import_file")
+        if uploaded is not None:
+            try:
+                rows, skipped = _prepare_import(pd.read_csv(uploaded), get_model(db, st.session_state.user['id']),
+                                                category_names, currencies, base_currency)
+            except (ValueError, pd.errors.ParserError) as e:
+                st.error(f"Could not read the file: {e}")
+                return
+            if skipped:
+                st.warning(f"Skipping {skipped} rows with a missing date or a non-positive amount.")
+            st.caption(f"{int(rows['auto'].sum())} of {len(rows)} categories were suggested; review them before importing.")
+            edited = st.data_editor(
+                rows,
+                key="import_editor",
+                hide_index=True,
+                use_container_width=True,
+                disabled=['date', 'amount', 'description', 'currency', 'auto'],
+                column_config={
+                    'category': st.column_config.SelectboxColumn("Category", options=category_names, required=True),
+                    'auto': st.column_config.CheckboxColumn("Suggested"),
+                }
+            )
+            if st.button(f"📥 Import {len(edited)} expenses", type="primary", disabled=edited.empty):
+                try:
+                    added = db.add_expenses(
+                        st.session_state.user['id'],
+                        list(edited[['amount', 'category', 'description', 'date', 'currency']]
+                             .itertuples(index=False, name=None))
+                    )
+                except Exception:
+                    st.markdown(
+                        '<div class="alert-error"><i class="fas fa-exclamation-triangle icon"></i>Import failed; no expenses were added.</div>', unsafe_allow_html=True)
+                else:
+                    st.success(f"Imported {added} expenses.")
@@ -0,0 +1,22 @@
+# pages/alerts.py
+import streamlit as st
+from backend import StorageBackend
+from rendering import budget_alert_item, render_section
+
+
+def show_budget_alerts(db: StorageBackend):
+    """Display unread budget threshold alerts in the sidebar.
+
+    Alerts are raised by the expense and budget writes themselves, so this
+    is one indexed read with no budget recomputation.
+    """
+    alerts = db.get_budget_alerts(st.session_state.user['id'], limit=5)
+    if alerts.empty:
+        return
+    st.markdown(render_section(alerts, budget_alert_item,
+                               ['category', 'threshold', 'spent', 'budget', 'currency']),
+                unsafe_allow_html=True)
+    if st.button("✔️ Dismiss alerts", key="dismiss_budget_alerts", use_container_width=True):
+        db.dismiss_budget_alerts(st.session_state.user['id'], alerts['id'].tolist())
+        st.rerun()
+    st.markdown("---")
@@ -1,8 +1,10 @@
 # pages/auth.py
 import streamlit as st
-from database import ExpenseTrackerDB
+from backend import StorageBackend
+from currency import session_currency
+from prefetch import get_prefetcher
 
-def show_auth_page(db: ExpenseTrackerDB):
+def show_auth_page(db: StorageBackend):
     # ... (Copy the entire show_auth_page function here)
     tab1, tab2 = st.tabs([
         "🔑 Login",
@@ -39,6 +41,9 @@ def show_auth_page(db: ExpenseTrackerDB):
                     user = db.authenticate_user(username, password)
                     if user:
                         st.session_state.user = user
+                        # Start loading the first pages' data while the app reruns
+                        get_prefetcher().warm_up(st.session_state, db, user['id'],
+                                                 session_currency(st.session_state))
                         st.markdown(
                             '<div class="alert-success"><i class="fas fa-check-circle icon"></i>Login successful! Redirecting...</div>',
                             unsafe_allow_html=True)
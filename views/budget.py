@@ -1,11 +1,137 @@
 # pages/budget.py
 import streamlit as st
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from database import ExpenseTrackerDB
+import calendar
+from datetime import datetime, date
+from typing import List, Tuple
+from backend import StorageBackend
+from currency import available_currencies, convert_frame, format_amount, session_currency
+from prefetch import get_prefetcher
+from recurring import project_recurring
+from rendering import render_section, budget_card, budget_usage_item
+
+
+# Months shown by the budget planner
+PLAN_HORIZONS = (3, 6, 12)
+
+
+def _month_label(index: int) -> str:
+    """'Jan 2026' for a month index (year * 12 + month - 1)"""
+    return datetime(index // 12, index % 12 + 1, 1).strftime('%b %Y')
+
+
+def _load_plan(db: StorageBackend, categories: List[str], start_index: int, months: int,
+               currency: str) -> pd.DataFrame:
+    """Category x month grid of saved budgets in `currency`, read with one range query"""
+    labels = [_month_label(start_index + i) for i in range(months)]
+    budgets = convert_frame(db.get_budgets(
+        st.session_state.user['id'], start_index % 12 + 1, start_index // 12, months), currency)
+    grid = pd.DataFrame(np.nan, index=pd.Index(categories, name="Category"), columns=labels)
+    if not budgets.empty:
+        budgets['label'] = (budgets['year'] * 12 + budgets['month'] - 1).map(_month_label)
+        saved = budgets.pivot_table(index='category', columns='label', values='amount', aggfunc='last')
+        grid.update(saved.reindex(index=grid.index, columns=labels))
+    return grid.round(2)
+
+
+def _average_spend(db: StorageBackend, categories: List[str], start_index: int, months: int,
+                   currency: str) -> pd.Series:
+    """Average monthly spend per category over the `months` full months before the plan"""
+    first = start_index - months
+    expenses = convert_frame(db.get_expenses(
+        st.session_state.user['id'],
+        date(first // 12, first % 12 + 1, 1).isoformat(),
+        (date(start_index // 12, start_index % 12 + 1, 1) - pd.Timedelta(days=1)).isoformat()), currency)
+    if expenses.empty:
+        return pd.Series(np.nan, index=categories)
+    return (expenses.groupby('category')['amount'].sum() / months).reindex(categories).round(0)
+
+
+def _changed_cells(saved: pd.DataFrame, edited: pd.DataFrame, start_index: int) -> List[Tuple]:
+    """(category, month, year, amount) for every positive cell that differs from the saved plan"""
+    changed = edited.notna() & (edited > 0) & ~np.isclose(edited.fillna(0), saved.fillna(0), atol=0.005)
+    rows = []
+    for position, label in enumerate(edited.columns):
+        index = start_index + position
+        for category in edited.index[changed[label].to_numpy()]:
+            rows.append((category, index % 12 + 1, index // 12, float(edited.at[category, label])))
+    return rows
+
+
+def _show_budget_planner(db: StorageBackend, categories: List[str], selected_month: int, selected_year: int,
+                         currencies: List[str], base_currency: str):
+    """Editable category x month budget grid, saved with one bulk upsert"""
+    plan_col1, plan_col2 = st.columns(2)
+    with plan_col1:
+        months = st.selectbox("📆 Plan Length", options=list(PLAN_HORIZONS), index=len(PLAN_HORIZONS) - 1,
+                              format_func=lambda n: f"{n} months", key="plan_months")
+    with plan_col2:
+        currency = st.selectbox("💱 Plan Currency", options=currencies,
+                                index=currencies.index(base_currency) if base_currency in currencies else 0,
+                                key="plan_currency")
+
+    # The draft survives reruns; tools replace it and bump the editor key so
+    # the grid starts again from the new values
+    start_index = selected_year * 12 + selected_month - 1
+    plan_key = (st.session_state.user['id'], start_index, months, currency)
+    plan = st.session_state.get("budget_plan")
+    if plan is None or plan['key'] != plan_key:
+        saved = _load_plan(db, categories, start_index, months, currency)
+        plan = st.session_state.budget_plan = {'key': plan_key, 'saved': saved, 'draft': saved.copy(), 'revision': 0}
+
+    edited = st.data_editor(
+        plan['draft'],
+        key=f"budget_plan_{plan['revision']}",
+        use_container_width=True,
+        column_config={label: st.column_config.NumberColumn(label, min_value=0.0, step=100.0, format="%.0f")
+                       for label in plan['draft'].columns}
+    )
+
+    def replace_draft(draft: pd.DataFrame):
+        plan['draft'] = draft.round(2)
+        plan['revision'] += 1
+        st.rerun()
+
+    tool_col1, tool_col2, tool_col3 = st.columns(3)
+    with tool_col1:
+        st.markdown("<br>", unsafe_allow_html=True)  # Spacing
+        if st.button("➡️ Copy Forward", use_container_width=True,
+                     help="Fill each empty month with the month before it"):
+            replace_draft(edited.ffill(axis=1))
+    with tool_col2:
+        percent = st.number_input("Scale by %", min_value=-90.0, max_value=500.0, value=10.0, step=5.0,
+                                  key="plan_scale")
+        if st.button("📈 Apply Scaling", use_container_width=True):
+            replace_draft(edited * (1 + percent / 100))
+    with tool_col3:
+        history = st.number_input("Average of last N months", min_value=1, max_value=24, value=3, step=1,
+                                  key="plan_history")
+        if st.button("📊 Use Average Spend", use_container_width=True,
+                     help="Set every month of each category to its average monthly spend"):
+            average = _average_spend(db, categories, start_index, int(history), currency)
+            draft = edited.copy()
+            has_average = average.notna() & (average > 0)
+            draft.loc[has_average[has_average].index, :] = np.repeat(
+                average[has_average].to_numpy()[:, None], len(draft.columns), axis=1)
+            replace_draft(draft)
+
+    changes = _changed_cells(plan['saved'], edited, start_index)
+    st.caption("Clearing a cell leaves its saved budget unchanged.")
+    if st.button(f"💾 Save {len(changes)} Changed Budgets", type="primary", disabled=not changes,
+                 use_container_width=True):
+        try:
+            saved = db.set_budgets_bulk(st.session_state.user['id'],
+                                        [(*change, currency) for change in changes])
+        except Exception:
+            st.error("Failed to save the budget plan.")
+        else:
+            st.session_state.pop("budget_plan", None)
+            st.success(f"Saved {saved} budgets.")
+            st.rerun()
 
 
-def show_budget_tracker(db: ExpenseTrackerDB):
+def show_budget_tracker(db: StorageBackend):
     """Display comprehensive budget tracking interface"""
     st.markdown('<h2><i class="fas fa-bullseye icon"></i>Budget Tracker</h2>',
                 unsafe_allow_html=True)
@@ -36,21 +162,7 @@ def show_budget_tracker(db: ExpenseTrackerDB):
     st.markdown('<h3><i class="fas fa-cog icon"></i>Set Monthly Budgets</h3>',
                 unsafe_allow_html=True)
 
-    categories = [
-        ("Food & Dining", "fas fa-utensils"),
-        ("Transportation", "fas fa-car"),
-        ("Housing", "fas fa-home"),
-        ("Shopping", "fas fa-shopping-bag"),
-        ("Healthcare", "fas fa-heartbeat"),
-        ("Entertainment", "fas fa-film"),
-        ("Education", "fas fa-graduation-cap"),
-        ("Business", "fas fa-briefcase"),
-        ("Travel", "fas fa-plane"),
-        ("Utilities", "fas fa-bolt"),
-        ("Clothing", "fas fa-tshirt"),
-        ("Gifts", "fas fa-gift"),
-        ("Other", "fas fa-ellipsis-h")
-    ]
+    category_names = db.get_categories(st.session_state.user['id'])['name'].tolist()
 
     with st.form("budget_form"):
         budget_form_col1, budget_form_col2, budget_form_col3 = st.columns(3)
@@ -58,31 +170,46 @@ def show_budget_tracker(db: ExpenseTrackerDB):
         with budget_form_col1:
             budget_category = st.selectbox(
                 "📂 Category",
-                options=[cat[0] for cat in categories]
+                options=category_names
             )
 
         with budget_form_col2:
-            budget_amount = st.number_input(
-                "💰 Monthly Budget (₹)",
-                min_value=0.01,
-                step=1.00,
-                format="%.2f"
-            )
+            amount_col, currency_col = st.columns([2, 1])
+            with amount_col:
+                budget_amount = st.number_input(
+                    "💰 Monthly Budget",
+                    min_value=0.01,
+                    step=1.00,
+                    format="%.2f"
+                )
+            with currency_col:
+                currencies = available_currencies()
+                base_currency = session_currency(st.session_state)
+                budget_currency = st.selectbox(
+                    "💱 Currency",
+                    options=currencies,
+                    index=currencies.index(base_currency) if base_currency in currencies else 0
+                )
 
         with budget_form_col3:
             st.markdown("<br>", unsafe_allow_html=True)  # Spacing
             if st.form_submit_button("💾 Set Budget", type="primary", use_container_width=True):
                 if budget_amount > 0:
                     if db.set_budget(st.session_state.user['id'], budget_category, budget_amount, selected_month,
-                                     selected_year):
+                                     selected_year, budget_currency):
+                        st.session_state.pop("budget_plan", None)
                         st.success(
-                            f"Budget set for {budget_category}: ₹{budget_amount:.2f}")
+                            f"Budget set for {budget_category}: {format_amount(budget_amount, budget_currency, grouped=False)}")
                         st.rerun()
                     else:
                         st.error("Failed to set budget.")
                 else:
                     st.warning("Please enter a valid budget amount.")
 
+    with st.expander("🗓️ Budget Planner"):
+        _show_budget_planner(db, category_names, selected_month, selected_year,
+                             currencies, base_currency)
+
     st.markdown("---")
 
     # Budget vs Actual Analysis
@@ -90,10 +217,22 @@ def show_budget_tracker(db: ExpenseTrackerDB):
         f'<h3><i class="fas fa-chart-bar icon"></i>Budget Analysis - {datetime(selected_year, selected_month, 1).strftime("%B %Y")}</h3>',
         unsafe_allow_html=True)
 
-    # Get budgets and expenses for selected month/year
-    budgets_df = db.get_budgets(
-        st.session_state.user['id'], selected_month, selected_year)
-    expenses_df = db.get_expenses(st.session_state.user['id'])
+    # Get budgets and expenses for selected month/year, both in the display currency
+    base_currency = session_currency(st.session_state)
+    budgets_df = convert_frame(db.get_budgets(
+        st.session_state.user['id'], selected_month, selected_year), base_currency)[['category', 'amount']]
+    month_start = date(selected_year, selected_month, 1)
+    month_end = date(selected_year, selected_month,
+                     calendar.monthrange(selected_year, selected_month)[1])
+    # The current month's expenses may have been prefetched after login or navigation
+    expenses_df = None
+    if (selected_year, selected_month) == (current_date.year, current_date.month):
+        expenses_df = get_prefetcher().take(
+            st.session_state, ("month_expenses", base_currency, selected_year, selected_month),
+            lambda: db.get_user_stats(st.session_state.user['id'])['version'])
+    if expenses_df is None:
+        expenses_df = convert_frame(db.get_expenses(
+            st.session_state.user['id'], month_start.isoformat(), month_end.isoformat()), base_currency)
 
     if budgets_df.empty:
         st.markdown('''
@@ -106,12 +245,8 @@ def show_budget_tracker(db: ExpenseTrackerDB):
         return
 
     if not expenses_df.empty:
-        # Filter expenses for selected month/year
-        expenses_df['date'] = pd.to_datetime(expenses_df['date'])
-        current_month_expenses = expenses_df[
-            (expenses_df['date'].dt.month == selected_month) &
-            (expenses_df['date'].dt.year == selected_year)
-        ]
+        # The query is already limited to the selected month
+        current_month_expenses = expenses_df
 
         # Calculate actual spending by category
         if not current_month_expenses.empty:
@@ -146,60 +281,57 @@ def show_budget_tracker(db: ExpenseTrackerDB):
         summary_col1, summary_col2, summary_col3, summary_col4 = st.columns(4)
 
         with summary_col1:
-            st.metric("💰 Total Budget", f"₹{total_budget:,.2f}")
+            st.metric("💰 Total Budget", format_amount(total_budget, base_currency))
         with summary_col2:
-            st.metric("💸 Total Spent", f"₹{total_spent:,.2f}")
+            st.metric("💸 Total Spent", format_amount(total_spent, base_currency))
         with summary_col3:
-            st.metric("💵 Remaining", f"₹{total_remaining:,.2f}")
+            st.metric("💵 Remaining", format_amount(total_remaining, base_currency))
         with summary_col4:
             st.metric("📊 Used", f"{overall_percentage:.1f}%")
 
         st.markdown("---")
 
-        # Individual category analysis
-        for _, row in budget_analysis.iterrows():
-            percentage = row['percentage']
-
-            # Determine status and styling
-            if percentage > 100:
-                status_class = "budget-danger"
-                status_text = "🚨 Over Budget!"
-                progress_class = "progress-danger"
-                # Cap at 150% for display
-                progress_width = min(percentage, 150)
-            elif percentage > 80:
-                status_class = "budget-warning"
-                status_text = "⚠️ Near Limit"
-                progress_class = "progress-warning"
-                progress_width = percentage
-            else:
-                status_class = "budget-success"
-                status_text = "✅ On Track"
-                progress_class = "progress-success"
-                progress_width = percentage
-
-            st.markdown(f'''
-            <div class="{status_class}">
-                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1rem;">
-                    <h4 style="margin: 0;"><i class="fas fa-tag icon"></i>{row['category']}</h4>
-                    <span style="font-weight: bold; font-size: 1.1rem;">{status_text}</span>
-                </div>
-
-                <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-                    <span><strong>Budget:</strong> ₹{row['amount']:,.2f}</span>
-                    <span><strong>Spent:</strong> ₹{row['actual_amount']:,.2f}</span>
-                    <span><strong>Remaining:</strong> ₹{row['remaining']:,.2f}</span>
-                </div>
-
-                <div class="progress-container">
-                    <div class="progress-bar {progress_class}" style="width: {progress_width}%;"></div>
-                </div>
+        # Individual category analysis, rendered in one pass and sent as one element
+        budget_analysis['currency'] = base_currency
+        st.markdown(render_section(budget_analysis, budget_card,
+                                   ['category', 'amount', 'actual_amount', 'remaining', 'percentage', 'currency']),
+                    unsafe_allow_html=True)
+
+        # Upcoming recurring charges, projected from the rules without materializing them
+        projection_start = max(month_start, current_date.date())
+        if projection_start <= month_end:
+            upcoming = convert_frame(project_recurring(
+                db.get_recurring_expenses(st.session_state.user['id']),
+                projection_start, month_end), base_currency)
+            if not upcoming.empty:
+                st.markdown("---")
+                st.markdown(
+                    '<h4><i class="fas fa-redo icon"></i>Upcoming Recurring Charges</h4>', unsafe_allow_html=True)
+
+                upcoming_by_category = upcoming.groupby('category')['amount'].sum()
+                projection = budget_analysis[['category', 'amount', 'actual_amount']].copy()
+                projection['upcoming'] = projection['category'].map(
+                    upcoming_by_category).fillna(0)
+                projection['projected_percentage'] = (
+                    (projection['actual_amount'] + projection['upcoming']) / projection['amount'] * 100).round(1)
+
+                projected_total = total_spent + projection['upcoming'].sum()
+                projection_col1, projection_col2 = st.columns(2)
+                with projection_col1:
+                    st.metric("🔁 Upcoming This Month",
+                              format_amount(upcoming['amount'].sum(), base_currency))
+                with projection_col2:
+                    st.metric("📈 Projected Total", format_amount(projected_total, base_currency),
+                              delta=f"{(projected_total / total_budget * 100) if total_budget > 0 else 0:.1f}% of budget",
+                              delta_color="off")
 
-                <div style="text-align: center; font-size: 0.9rem; margin-top: 0.5rem;">
-                    <strong>{percentage:.1f}%</strong> of budget used
+                st.markdown(f'''
+                <div class="metric-card">
+                    <ul style="margin: 0;">
+                        {"".join([f"<li>{row['category']}: {format_amount(row['upcoming'], base_currency)} upcoming → {row['projected_percentage']:.1f}% of budget by month end</li>" for _, row in projection[projection['upcoming'] > 0].iterrows()])}
+                    </ul>
                 </div>
-            </div>
-            ''', unsafe_allow_html=True)
+                ''', unsafe_allow_html=True)
 
         # Budget insights
         st.markdown("---")
@@ -220,7 +352,7 @@ def show_budget_tracker(db: ExpenseTrackerDB):
                 <div class="alert-error">
                     <h5><i class="fas fa-exclamation-triangle icon"></i>Over Budget ({len(over_budget_categories)} categories)</h5>
                     <ul style="margin: 0;">
-                        {"".join([f"<li>{row['category']}: {row['percentage']:.1f}% used</li>" for _, row in over_budget_categories.iterrows()])}
+                        {render_section(over_budget_categories, budget_usage_item, ['category', 'percentage'])}
                     </ul>
                 </div>
                 ''', unsafe_allow_html=True)
@@ -230,7 +362,7 @@ def show_budget_tracker(db: ExpenseTrackerDB):
                 <div class="alert-warning">
                     <h5><i class="fas fa-exclamation-circle icon"></i>Near Limit ({len(near_limit_categories)} categories)</h5>
                     <ul style="margin: 0;">
-                        {"".join([f"<li>{row['category']}: {row['percentage']:.1f}% used</li>" for _, row in near_limit_categories.iterrows()])}
+                        {render_section(near_limit_categories, budget_usage_item, ['category', 'percentage'])}
                     </ul>
                 </div>
                 ''', unsafe_allow_html=True)
@@ -241,7 +373,7 @@ def show_budget_tracker(db: ExpenseTrackerDB):
                 <div class="alert-success">
                     <h5><i class="fas fa-check-circle icon"></i>Well Under Budget ({len(under_budget_categories)} categories)</h5>
                     <ul style="margin: 0;">
-                        {"".join([f"<li>{row['category']}: {row['percentage']:.1f}% used</li>" for _, row in under_budget_categories.iterrows()])}
+                        {render_section(under_budget_categories, budget_usage_item, ['category', 'percentage'])}
                     </ul>
                 </div>
                 ''', unsafe_allow_html=True)
@@ -251,7 +383,7 @@ def show_budget_tracker(db: ExpenseTrackerDB):
                 st.markdown(f'''
                 <div style="background: #e0f2fe; border-left: 4px solid #0288d1; padding: 1rem; border-radius: 8px;">
                     <h5><i class="fas fa-info-circle icon"></i>Savings Opportunity</h5>
-                    <p style="margin: 0;">You have <strong>₹{total_remaining:,.2f}</strong> remaining across all budgets. Consider saving or investing this amount!</p>
+                    <p style="margin: 0;">You have <strong>{format_amount(total_remaining, base_currency)}</strong> remaining across all budgets. Consider saving or investing this amount!</p>
                 </div>
                 ''', unsafe_allow_html=True)
 
@@ -1,16 +1,31 @@
 # pages/dashboard.py
 import streamlit as st
-from database import ExpenseTrackerDB
+from backend import StorageBackend
 from analytics import ExpenseAnalytics
+from anomalies import get_detector
+from currency import format_amount, session_currency
+from fragments import PageData, section
+from rendering import render_section, expense_card, duplicate_item, outlier_item
+from rolling import RollingStats
 
+# Spans offered for the moving-average chart, in days
+AVERAGE_SPANS = {"3 months": 90, "6 months": 180, "1 year": 365}
 
-def show_dashboard(db: ExpenseTrackerDB):
+
+def _signed_amount(amount: float, currency: str) -> str:
+    """Metric delta with the sign first, which st.metric reads for the arrow direction"""
+    return f"{'-' if amount < 0 else '+'}{format_amount(abs(amount), currency)}"
+
+
+def show_dashboard(db: StorageBackend):
     """Display comprehensive analytics dashboard"""
     st.markdown('<h2><i class="fas fa-chart-line icon"></i>Analytics Dashboard</h2>',
                 unsafe_allow_html=True)
 
-    # Get user expenses
-    expenses_df = db.get_expenses(st.session_state.user['id'])
+    # Get user expenses, converted to the session's display currency
+    base_currency = session_currency(st.session_state)
+    data = PageData(db, st.session_state.user['id'], base_currency)
+    expenses_df = data["expenses"]
 
     if expenses_df.empty:
         st.markdown('''
@@ -27,7 +42,7 @@ def show_dashboard(db: ExpenseTrackerDB):
         return
 
     # Initialize analytics
-    analytics = ExpenseAnalytics(expenses_df)
+    analytics = ExpenseAnalytics(expenses_df, base_currency)
 
     # Key metrics row
     col1, col2, col3, col4 = st.columns(4)
@@ -41,13 +56,13 @@ def show_dashboard(db: ExpenseTrackerDB):
     with col1:
         st.metric(
             label="💰 Total Spent",
-            value=f"₹{total_expenses:,.2f}",
+            value=format_amount(total_expenses, base_currency),
             help="Total amount spent across all categories"
         )
     with col2:
         st.metric(
             label="📊 Average Expense",
-            value=f"₹{avg_expense:.2f}",
+            value=format_amount(avg_expense, base_currency, grouped=False),
             help="Average amount per expense entry"
         )
     with col3:
@@ -83,26 +98,96 @@ def show_dashboard(db: ExpenseTrackerDB):
     if line_chart:
         st.plotly_chart(line_chart, use_container_width=True)
 
+    # Trends from prefix sums over daily spend, rebuilt only when the data changes
+    rolling = data["rolling"]
+    velocity = rolling.velocity()
+    st.markdown('<h3><i class="fas fa-tachometer-alt icon"></i>Spending Pace</h3>',
+                unsafe_allow_html=True)
+    pace_col1, pace_col2, pace_col3, pace_col4 = st.columns(4)
+    with pace_col1:
+        st.metric(
+            label="📅 This Month So Far",
+            value=format_amount(velocity['month_to_date'], base_currency),
+            delta=_signed_amount(velocity['month_to_date'] - velocity['previous_month_to_date'], base_currency),
+            delta_color="inverse",
+            help="Spent since the 1st, compared with the same point last month"
+        )
+    with pace_col2:
+        st.metric(
+            label="⚡ Daily Pace",
+            value=format_amount(velocity['daily_rate'], base_currency, grouped=False),
+            help="Average spend per day this month"
+        )
+    with pace_col3:
+        st.metric(
+            label="🕒 Last 7 Days",
+            value=format_amount(velocity['recent_rate'], base_currency, grouped=False),
+            delta=_signed_amount(velocity['recent_rate'] - velocity['daily_rate'], base_currency),
+            delta_color="inverse",
+            help="Average spend per day over the last week, compared with this month's pace"
+        )
+    with pace_col4:
+        st.metric(
+            label="🎯 Projected Month End",
+            value=format_amount(velocity['projected'], base_currency),
+            help=f"At this month's pace; last month ended at {format_amount(velocity['previous_month_total'], base_currency)}"
+        )
+
+    trend_col1, trend_col2 = st.columns(2)
+    with trend_col1:
+        _moving_average_chart(data, analytics)
+    with trend_col2:
+        month_chart = analytics.create_month_to_date_chart(rolling)
+        if month_chart:
+            st.plotly_chart(month_chart, use_container_width=True)
+
     # Recent expenses section
     st.markdown('<h3><i class="fas fa-clock icon"></i>Recent Expenses</h3>',
                 unsafe_allow_html=True)
 
-    recent_expenses = expenses_df.head(5)
-    for _, expense in recent_expenses.iterrows():
-        st.markdown(f'''
-        <div class="expense-card">
-            <div style="display: flex; justify-content: space-between; align-items: center;">
-                <div>
-                    <strong style="font-size: 1.1rem; color: #1f2937;">₹{expense['amount']:.2f}</strong>
-                    <span style="margin-left: 1rem; color: #6b7280;">→ {expense['category']}</span>
+    # All recent cards go out as a single markdown element, in the currency they were paid in
+    recent_expenses = expenses_df.head(5).assign(amount=lambda df: df['original_amount'])
+    st.markdown(render_section(recent_expenses, expense_card,
+                               ['amount', 'category', 'date', 'description', 'currency']),
+                unsafe_allow_html=True)
+
+    # Anomaly detection (incremental across reruns via the session detector)
+    detector = get_detector(st.session_state, st.session_state.user['id'])
+    detector.refresh(expenses_df)
+
+    if not detector.duplicates.empty or not detector.outliers.empty:
+        st.markdown('<h3><i class="fas fa-search icon"></i>Needs Your Attention</h3>',
+                    unsafe_allow_html=True)
+        expense_columns = expenses_df[['id', 'amount', 'category', 'date']].assign(currency=base_currency)
+        duplicate_rows = detector.duplicates[['id']].merge(expense_columns, on='id')
+        outlier_rows = detector.outliers[['id', 'median']].merge(expense_columns, on='id')
+
+        anomaly_col1, anomaly_col2 = st.columns(2)
+
+        with anomaly_col1:
+            if not duplicate_rows.empty:
+                st.markdown(f'''
+                <div class="alert-warning">
+                    <h5><i class="fas fa-clone icon"></i>Possible Duplicates ({len(duplicate_rows)})</h5>
+                    <ul style="margin: 0;">{render_section(duplicate_rows, duplicate_item)}</ul>
                 </div>
-                <div style="text-align: right; color: #9ca3af; font-size: 0.9rem;">
-                    {expense['date']}
+                ''', unsafe_allow_html=True)
+
+        with anomaly_col2:
+            if not outlier_rows.empty:
+                st.markdown(f'''
+                <div class="alert-error">
+                    <h5><i class="fas fa-exclamation-circle icon"></i>Unusual Expenses ({len(outlier_rows)})</h5>
+                    <ul style="margin: 0;">{render_section(outlier_rows, outlier_item)}</ul>
                 </div>
-            </div>
-            <div style="margin-top: 0.5rem; color: #6b7280; font-size: 0.9rem;">
-                <i class="fas fa-comment-alt" style="margin-right: 0.5rem;"></i>
-                {expense['description'] if expense['description'] else 'No description'}
-            </div>
-        </div>
-        ''', unsafe_allow_html=True)
+                ''', unsafe_allow_html=True)
+
+
+@section("rolling")
+def _moving_average_chart(data: PageData, analytics: ExpenseAnalytics, rolling: RollingStats):
+    """Moving-average chart; changing its span rebuilds only this chart"""
+    span = st.radio("Span", options=list(AVERAGE_SPANS), index=1, horizontal=True,
+                    key="dashboard_average_span", label_visibility="collapsed")
+    average_chart = analytics.create_moving_average_chart(rolling, days=AVERAGE_SPANS[span])
+    if average_chart:
+        st.plotly_chart(average_chart, use_container_width=True)
@@ -0,0 +1,15 @@
+# pages/diagnostics.py
+import streamlit as st
+from backend import StorageBackend
+from prefetch import prefetch_diagnostics
+from session_memory import memory_diagnostics
+
+
+def show_diagnostics_panel(db: StorageBackend):
+    """Display runtime instrumentation in a collapsed sidebar panel"""
+    with st.expander("🩺 Diagnostics", expanded=False):
+        details = db.get_diagnostics(st.session_state.user['id'])
+        details.update(memory_diagnostics(st.session_state))
+        details.update(prefetch_diagnostics())
+        for label, value in details.items():
+            st.markdown(f"**{label}:** `{value}`")
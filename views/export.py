@@ -1,19 +1,26 @@
 # pages/export.py
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from database import ExpenseTrackerDB
+from backend import StorageBackend
 from analytics import ExpenseAnalytics
+from calendar_dim import attach_calendar
+from currency import convert_frame, converted_stats, format_amount, session_currency
+from prefetch import get_prefetcher
+from sketches import merge_all, month_sketches, percentile_table, range_sketches
 
 
-def show_export_data(db: ExpenseTrackerDB):
+def show_export_data(db: StorageBackend):
     """Display comprehensive data export interface"""
     st.markdown('<h2><i class="fas fa-download icon"></i>Export Your Data</h2>',
                 unsafe_allow_html=True)
 
-    expenses_df = db.get_expenses(st.session_state.user['id'])
+    # Totals are shown in the display currency; files keep each row's own currency.
+    # Header figures come from the per-user stats row, not the full frame
+    base_currency = session_currency(st.session_state)
+    stats = converted_stats(db.get_user_stats(st.session_state.user['id']),
+                            st.session_state.user['id'], base_currency)
 
-    if expenses_df.empty:
+    if not stats['count']:
         st.markdown('''
         <div style="text-align: center; padding: 3rem; background: #f8fafc; border-radius: 15px;">
             <i class="fas fa-file-export" style="font-size: 4rem; color: #9ca3af; margin-bottom: 1rem;"></i>
@@ -23,6 +30,22 @@ def show_export_data(db: ExpenseTrackerDB):
         ''', unsafe_allow_html=True)
         return
 
+    # Only the submitted date range is loaded, so archived months are read
+    # back only when the range reaches them
+    min_date = datetime.strptime(stats['min_date'], '%Y-%m-%d').date()
+    max_date = datetime.strptime(stats['max_date'], '%Y-%m-%d').date()
+    export_date_range = st.session_state.get("export_date_filter", (min_date, max_date))
+    range_start, range_end = (export_date_range if len(export_date_range) == 2
+                              else (min_date, max_date))
+    # The full range is the dashboard's frame, which may already have been prefetched
+    expenses_df = None
+    if (range_start, range_end) == (min_date, max_date):
+        expenses_df = get_prefetcher().take(st.session_state, ("expenses", base_currency),
+                                            lambda: stats['version'])
+    if expenses_df is None:
+        expenses_df = convert_frame(db.get_expenses(
+            st.session_state.user['id'], range_start.isoformat(), range_end.isoformat()), base_currency)
+
     # Data summary
     export_col1, export_col2 = st.columns(2)
 
@@ -30,24 +53,29 @@ def show_export_data(db: ExpenseTrackerDB):
         st.markdown(
             '<h3><i class="fas fa-chart-bar icon"></i>Export Summary</h3>', unsafe_allow_html=True)
 
-        total_expenses = len(expenses_df)
-        total_amount = expenses_df['amount'].sum()
-        avg_amount = expenses_df['amount'].mean()
-        date_range = f"{expenses_df['date'].min()} to {expenses_df['date'].max()}"
-        categories_count = expenses_df['category'].nunique()
+        total_expenses = stats['count']
+        total_amount = stats['total']
+        avg_amount = total_amount / total_expenses if total_expenses else 0.0
+        date_range = f"{stats['min_date']} to {stats['max_date']}"
+        categories_count = len(stats['categories'])
+        # Distribution figures merge the stored monthly sketches instead of scanning every expense
+        overall = merge_all(month_sketches(db, st.session_state.user['id'], base_currency,
+                                           stats['version']).values())
 
         st.markdown(f'''
         <div class="metric-card">
             <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 1rem;">
                 <div>
                     <p style="margin: 0.25rem 0;"><i class="fas fa-list icon"></i><strong>Total Records:</strong> {total_expenses}</p>
-                    <p style="margin: 0.25rem 0;"><i class="fas fa-dollar-sign icon"></i><strong>Total Amount:</strong> ₹{total_amount:,.2f}</p>
-                    <p style="margin: 0.25rem 0;"><i class="fas fa-chart-line icon"></i><strong>Average:</strong> ₹{avg_amount:.2f}</p>
+                    <p style="margin: 0.25rem 0;"><i class="fas fa-dollar-sign icon"></i><strong>Total Amount:</strong> {format_amount(total_amount, base_currency)}</p>
+                    <p style="margin: 0.25rem 0;"><i class="fas fa-chart-line icon"></i><strong>Average:</strong> {format_amount(avg_amount, base_currency, grouped=False)}</p>
+                    <p style="margin: 0.25rem 0;"><i class="fas fa-divide icon"></i><strong>Median:</strong> ~{format_amount(overall.quantile(0.5), base_currency, grouped=False)}</p>
                 </div>
                 <div>
                     <p style="margin: 0.25rem 0;"><i class="fas fa-calendar icon"></i><strong>Date Range:</strong></p>
                     <p style="margin: 0 0 0.25rem 1.5rem; font-size: 0.9rem;">{date_range}</p>
                     <p style="margin: 0.25rem 0;"><i class="fas fa-tags icon"></i><strong>Categories:</strong> {categories_count}</p>
+                    <p style="margin: 0.25rem 0;"><i class="fas fa-signal icon"></i><strong>90th Percentile:</strong> ~{format_amount(overall.quantile(0.9), base_currency, grouped=False)}</p>
                 </div>
             </div>
         </div>
@@ -63,9 +91,6 @@ def show_export_data(db: ExpenseTrackerDB):
                         unsafe_allow_html=True)
 
             # Date range filter
-            min_date = pd.to_datetime(expenses_df['date']).min().date()
-            max_date = pd.to_datetime(expenses_df['date']).max().date()
-
             export_date_range = st.date_input(
                 "📅 Date Range",
                 value=(min_date, max_date),
@@ -74,7 +99,7 @@ def show_export_data(db: ExpenseTrackerDB):
 
             # Category filter
             all_categories = ['All Categories'] + \
-                sorted(expenses_df['category'].unique().tolist())
+                sorted(stats['categories'])
             export_categories = st.multiselect(
                 "📂 Categories",
                 options=all_categories[1:],  # Exclude 'All Categories'
@@ -82,8 +107,9 @@ def show_export_data(db: ExpenseTrackerDB):
             )
 
             # Amount range filter
-            min_amount = float(expenses_df['amount'].min())
-            max_amount = float(expenses_df['amount'].max())
+            min_amount = float(expenses_df['amount'].min()) if not expenses_df.empty else 0.0
+            max_amount = max(float(expenses_df['amount'].max()) if not expenses_df.empty else 0.0,
+                             min_amount + 0.01)
             export_amount_range = st.slider(
                 "💰 Amount Range",
                 min_value=min_amount,
@@ -96,15 +122,10 @@ def show_export_data(db: ExpenseTrackerDB):
                 "🔄 Apply Filters", type="secondary")
 
     # Apply export filters
-    export_df = expenses_df.copy()
-    export_df['date'] = pd.to_datetime(export_df['date'])
-
-    if len(export_date_range) == 2:
-        start_date, end_date = export_date_range
-        export_df = export_df[
-            (export_df['date'].dt.date >= start_date) &
-            (export_df['date'].dt.date <= end_date)
-        ]
+    # The date range was applied by the query above
+    export_df = attach_calendar(expenses_df, columns=())
+    export_df = export_df.drop(columns='day').assign(
+        date=export_df['day'].to_numpy().astype('datetime64[D]'))
 
     if export_categories:
         export_df = export_df[export_df['category'].isin(export_categories)]
@@ -114,6 +135,15 @@ def show_export_data(db: ExpenseTrackerDB):
         (export_df['amount'] <= export_amount_range[1])
     ]
 
+    # Percentiles of the filtered rows: whole months come from the stored sketches,
+    # the partial months at either end from the rows already loaded
+    sketches = range_sketches(db, st.session_state.user['id'], base_currency, stats['version'],
+                              range_start, range_end, expenses_df)
+    if export_categories:
+        sketches = {category: sketch for category, sketch in sketches.items() if category in export_categories}
+    sketches = {category: sketch.clip(*export_amount_range) for category, sketch in sketches.items()}
+    filtered_sketch = merge_all(sketches.values())
+
     # Show filtered results
     filtered_count = len(export_df)
     filtered_total = export_df['amount'].sum()
@@ -122,7 +152,7 @@ def show_export_data(db: ExpenseTrackerDB):
         st.markdown(f'''
         <div class="alert-warning">
             <i class="fas fa-filter icon"></i>
-            <strong>Filtered Results:</strong> {filtered_count} records (₹{filtered_total:,.2f}) will be exported
+            <strong>Filtered Results:</strong> {filtered_count} records ({format_amount(filtered_total, base_currency)}) will be exported
         </div>
         ''', unsafe_allow_html=True)
 
@@ -134,8 +164,9 @@ def show_export_data(db: ExpenseTrackerDB):
 
     download_col1, download_col2, download_col3 = st.columns(3)
 
-    # Prepare data for export
-    export_data = export_df.copy()
+    # Prepare data for export: amounts as entered, plus the display-currency value
+    export_data = export_df.rename(columns={'amount': f'amount_{base_currency.lower()}'})
+    export_data = export_data.rename(columns={'original_amount': 'amount'})
     export_data['date'] = export_data['date'].dt.strftime('%Y-%m-%d')
 
     with download_col1:
@@ -187,7 +218,7 @@ def show_export_data(db: ExpenseTrackerDB):
     with advanced_col1:
         # Summary report
         if st.button("📈 Generate Summary Report", use_container_width=True):
-            analytics = ExpenseAnalytics(export_df)
+            analytics = ExpenseAnalytics(export_df, base_currency)
             category_summary = analytics.get_category_spending()
             monthly_summary = analytics.get_monthly_spending()
 
@@ -203,9 +234,11 @@ Period: {export_date_range[0] if len(export_date_range) == 2 else 'All'} to {exp
 OVERVIEW
 --------
 Total Expenses: {len(export_df)}
-Total Amount: ₹{export_df['amount'].sum():,.2f}
-Average Amount: ₹{export_df['amount'].mean():.2f}
-Median Amount: ₹{export_df['amount'].median():.2f}
+Currency: {base_currency}
+Total Amount: {format_amount(export_df['amount'].sum(), base_currency)}
+Average Amount: {format_amount(export_df['amount'].mean(), base_currency, grouped=False)}
+Median Amount: ~{format_amount(filtered_sketch.quantile(0.5), base_currency, grouped=False)}
+90th Percentile: ~{format_amount(filtered_sketch.quantile(0.9), base_currency, grouped=False)}
 
 SPENDING BY CATEGORY
 -------------------
@@ -213,7 +246,19 @@ SPENDING BY CATEGORY
 
             for _, row in category_summary.iterrows():
                 percentage = (row['amount'] / export_df['amount'].sum()) * 100
-                summary_report += f"{row['category']}: ₹{row['amount']:,.2f} ({percentage:.1f}%)\n"
+                summary_report += f"{row['category']}: {format_amount(row['amount'], base_currency)} ({percentage:.1f}%)\n"
+
+            summary_report += """
+
+TYPICAL EXPENSE BY CATEGORY (middle half of amounts)
+-------------------------------------------------
+"""
+
+            for _, row in percentile_table(sketches).iterrows():
+                summary_report += (f"{row['category']}: {format_amount(row['typical_low'], base_currency, grouped=False)}"
+                                   f" - {format_amount(row['typical_high'], base_currency, grouped=False)}"
+                                   f" (median {format_amount(row['median'], base_currency, grouped=False)},"
+                                   f" p90 {format_amount(row['p90'], base_currency, grouped=False)})\n")
 
             summary_report += f"""
 
@@ -222,7 +267,7 @@ MONTHLY BREAKDOWN
 """
 
             for _, row in monthly_summary.iterrows():
-                summary_report += f"{row['month']}: ₹{row['amount']:,.2f}\n"
+                summary_report += f"{row['month']}: {format_amount(row['amount'], base_currency)}\n"
 
             st.download_button(
                 label="📄 Download Summary Report",
@@ -235,7 +280,7 @@ MONTHLY BREAKDOWN
     with advanced_col2:
         # Category breakdown
         if st.button("📊 Export Category Breakdown", use_container_width=True):
-            analytics = ExpenseAnalytics(export_df)
+            analytics = ExpenseAnalytics(export_df, base_currency)
             category_data = analytics.get_category_spending()
 
             if not category_data.empty:
@@ -248,6 +293,29 @@ MONTHLY BREAKDOWN
                     use_container_width=True
                 )
 
+    # Typical amounts per category for the filtered data
+    percentiles = percentile_table(sketches)
+    if not percentiles.empty:
+        st.markdown("---")
+        st.markdown('<h4><i class="fas fa-ruler-horizontal icon"></i>Typical Expenses</h4>',
+                    unsafe_allow_html=True)
+        amount_format = f"{base_currency} %.2f"
+        st.dataframe(
+            percentiles,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'category': st.column_config.TextColumn("Category"),
+                'count': st.column_config.NumberColumn("Expenses"),
+                'median': st.column_config.NumberColumn("Median", format=amount_format),
+                'typical_low': st.column_config.NumberColumn("Typical From", format=amount_format),
+                'typical_high': st.column_config.NumberColumn("Typical To", format=amount_format),
+                'p90': st.column_config.NumberColumn("90th Percentile", format=amount_format),
+            }
+        )
+        st.caption("Typical is the middle half of amounts; figures come from amount sketches "
+                   "and are within about 2% of the exact values.")
+
     # Data preview
     st.markdown("---")
     st.markdown('<h4><i class="fas fa-eye icon"></i>Data Preview</h4>',
@@ -259,7 +327,8 @@ MONTHLY BREAKDOWN
         preview_data['date'] = preview_data['date'].dt.strftime('%Y-%m-%d')
 
         st.dataframe(
-            preview_data[['date', 'category', 'amount', 'description']],
+            preview_data[['date', 'category', 'original_amount', 'currency', 'description']]
+            .rename(columns={'original_amount': 'amount'}),
             use_container_width=True,
             hide_index=True
         )
@@ -1,15 +1,29 @@
 # pages/manage_expenses.py
 import streamlit as st
 import pandas as pd
-from database import ExpenseTrackerDB
+from backend import StorageBackend
+from anomalies import get_detector
+from calendar_dim import attach_calendar, filter_day_range
+from currency import available_currencies, format_amount, session_currency
+from fragments import PageData, rerun_section, section
+from session_memory import collect_stale_flags
 
+ANOMALY_BADGES = {"duplicate": "🔁 Possible duplicate", "outlier": "📈 Unusual amount"}
 
-def show_manage_expenses(db: ExpenseTrackerDB):
+
+def show_manage_expenses(db: StorageBackend):
     """Display expense management interface with enhanced filtering"""
     st.markdown('<h2><i class="fas fa-edit icon"></i>Manage Your Expenses</h2>',
                 unsafe_allow_html=True)
 
-    expenses_df = db.get_expenses(st.session_state.user['id'])
+    # Filters and totals work in the display currency; each row keeps its original amount
+    data = PageData(db, st.session_state.user['id'], session_currency(st.session_state))
+    archive_horizon = data["archive_horizon"]
+    expenses_df = data["editable_expenses"]
+
+    if archive_horizon:
+        st.info(f"Expenses before {archive_horizon} are archived. They still count in the dashboard "
+                "and can be downloaded from Export Data, but can no longer be edited here.")
 
     if expenses_df.empty:
         st.markdown('''
@@ -21,6 +35,24 @@ def show_manage_expenses(db: ExpenseTrackerDB):
         ''', unsafe_allow_html=True)
         return
 
+    # Drop edit/delete flags that were cleared or point at expenses no longer listed
+    collect_stale_flags(st.session_state, expenses_df['id'])
+
+    # Flag duplicates and outliers; only rows added since the last rerun are scanned.
+    # With an archive this page sees only part of the history, so it reuses the
+    # flags from the last full-history refresh instead of rescanning.
+    detector = get_detector(st.session_state, st.session_state.user['id'])
+    if not archive_horizon:
+        detector.refresh(expenses_df)
+
+    _expense_list(data, detector.flags())
+
+
+@section("editable_expenses")
+def _expense_list(data: PageData, anomaly_flags, editable_expenses: pd.DataFrame):
+    """Filters, totals and the expense list; filtering and sorting rerun only this section"""
+    db, base_currency, expenses_df = data.db, data.base, editable_expenses
+
     # Enhanced filtering section
     st.markdown('<h4><i class="fas fa-filter icon"></i>Filter & Search</h4>',
                 unsafe_allow_html=True)
@@ -59,19 +91,18 @@ def show_manage_expenses(db: ExpenseTrackerDB):
             placeholder="Search descriptions..."
         )
 
-    # Apply filters
-    filtered_df = expenses_df.copy()
-    filtered_df['date'] = pd.to_datetime(filtered_df['date'])
-
-    if selected_category != 'All Categories':
-        filtered_df = filtered_df[filtered_df['category'] == selected_category]
+    # Apply filters; the date range is an integer day-number range
+    filtered_df = attach_calendar(expenses_df, columns=())
 
     if len(date_range) == 2:
         start_date, end_date = date_range
-        filtered_df = filtered_df[
-            (filtered_df['date'].dt.date >= start_date) &
-            (filtered_df['date'].dt.date <= end_date)
-        ]
+        filtered_df = filter_day_range(filtered_df, start_date, end_date)
+
+    filtered_df = filtered_df.copy()
+    filtered_df['date'] = filtered_df['day'].to_numpy().astype('datetime64[D]')
+
+    if selected_category != 'All Categories':
+        filtered_df = filtered_df[filtered_df['category'] == selected_category]
 
     filtered_df = filtered_df[
         (filtered_df['amount'] >= amount_range[0]) &
@@ -94,7 +125,7 @@ def show_manage_expenses(db: ExpenseTrackerDB):
         <div style="display: flex; justify-content: space-between; align-items: center;">
             <div>
                 <h4><i class="fas fa-list icon"></i>Filtered Results</h4>
-                <p style="margin: 0;">Showing <strong>{total_filtered}</strong> expenses totaling <strong>₹{total_amount:,.2f}</strong></p>
+                <p style="margin: 0;">Showing <strong>{total_filtered}</strong> expenses totaling <strong>{format_amount(total_amount, base_currency)}</strong></p>
             </div>
             <div style="text-align: right;">
                 <button onclick="window.print()" style="background: #667eea; color: white; border: none; padding: 0.5rem 1rem; border-radius: 5px; cursor: pointer;">
@@ -133,8 +164,13 @@ def show_manage_expenses(db: ExpenseTrackerDB):
 
     # Display expenses with edit/delete functionality
     for idx, (_, expense) in enumerate(filtered_df.iterrows()):
+        badges = "".join(
+            f" • {ANOMALY_BADGES[flag]}" for flag in anomaly_flags.get(expense['id'], []))
+        paid = format_amount(expense['original_amount'], expense['currency'], grouped=False)
+        if expense['currency'] != base_currency:
+            paid += f" (≈ {format_amount(expense['amount'], base_currency, grouped=False)})"
         with st.expander(
-            f"₹{expense['amount']:.2f} • {expense['category']} • {expense['date'].strftime('%b %d, %Y')}",
+            f"{paid} • {expense['category']} • {expense['date'].strftime('%b %d, %Y')}{badges}",
             expanded=False
         ):
             expense_col1, expense_col2 = st.columns([3, 1])
@@ -142,7 +178,7 @@ def show_manage_expenses(db: ExpenseTrackerDB):
             with expense_col1:
                 st.markdown(f'''
                 <div style="background: #f9fafb; padding: 1rem; border-radius: 8px; margin-bottom: 1rem;">
-                    <p style="margin: 0.25rem 0;"><strong>💰 Amount:</strong> ₹{expense['amount']:.2f}</p>
+                    <p style="margin: 0.25rem 0;"><strong>💰 Amount:</strong> {paid}</p>
                     <p style="margin: 0.25rem 0;"><strong>📂 Category:</strong> {expense['category']}</p>
                     <p style="margin: 0.25rem 0;"><strong>📅 Date:</strong> {expense['date'].strftime('%B %d, %Y')}</p>
                     <p style="margin: 0.25rem 0;"><strong>📝 Description:</strong> {expense['description'] if expense['description'] else 'No description'}</p>
@@ -154,8 +190,9 @@ def show_manage_expenses(db: ExpenseTrackerDB):
 
                 with action_col1:
                     if st.button("✏️ Edit", key=f"edit_{expense['id']}", use_container_width=True):
+                        # Opening or cancelling a form only redraws the list; writes rerun the app
                         st.session_state[f"editing_{expense['id']}"] = True
-                        st.rerun()
+                        rerun_section()
 
                 with action_col2:
                     if st.button("🗑️ Delete", key=f"delete_{expense['id']}", use_container_width=True, type="secondary"):
@@ -165,7 +202,7 @@ def show_manage_expenses(db: ExpenseTrackerDB):
                                 st.rerun()
                         else:
                             st.session_state[f"confirm_delete_{expense['id']}"] = True
-                            st.rerun()
+                            rerun_section()
 
             # Confirmation for delete
             if st.session_state.get(f"confirm_delete_{expense['id']}", False):
@@ -183,7 +220,7 @@ def show_manage_expenses(db: ExpenseTrackerDB):
                 with confirm_col2:
                     if st.button("Cancel", key=f"confirm_no_{expense['id']}"):
                         st.session_state[f"confirm_delete_{expense['id']}"] = False
-                        st.rerun()
+                        rerun_section()
 
             # Edit form
             if st.session_state.get(f"editing_{expense['id']}", False):
@@ -196,17 +233,22 @@ def show_manage_expenses(db: ExpenseTrackerDB):
 
                     with edit_col1:
                         new_amount = st.number_input(
-                            "Amount (₹)",
-                            value=float(expense['amount']),
+                            "Amount",
+                            value=float(expense['original_amount']),
                             min_value=0.01,
                             step=0.01
                         )
 
-                        categories = [
-                            "Food & Dining", "Transportation", "Housing", "Shopping",
-                            "Healthcare", "Entertainment", "Education", "Business",
-                            "Travel", "Utilities", "Clothing", "Gifts", "Other"
-                        ]
+                        currencies = available_currencies()
+                        new_currency = st.selectbox(
+                            "Currency",
+                            currencies,
+                            index=currencies.index(
+                                expense['currency']) if expense['currency'] in currencies else 0
+                        )
+
+                        # Loaded the first time a form opens, then kept for this page's data
+                        categories = data["categories"]
 
                         current_category_index = categories.index(
                             expense['category']) if expense['category'] in categories else 0
@@ -239,7 +281,8 @@ def show_manage_expenses(db: ExpenseTrackerDB):
                                 new_amount,
                                 new_category,
                                 new_description.strip(),
-                                new_date.strftime('%Y-%m-%d')
+                                new_date.strftime('%Y-%m-%d'),
+                                new_currency
                             ):
                                 st.session_state[f"editing_{expense['id']}"] = False
                                 st.success("Expense updated successfully!")
@@ -250,4 +293,4 @@ def show_manage_expenses(db: ExpenseTrackerDB):
                     with form_col2:
                         if st.form_submit_button("❌ Cancel", use_container_width=True):
                             st.session_state[f"editing_{expense['id']}"] = False
-                            st.rerun()
+                            rerun_section()
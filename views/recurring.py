@@ -0,0 +1,145 @@
+# pages/recurring.py
+import streamlit as st
+from datetime import datetime, timedelta
+from backend import StorageBackend
+from currency import available_currencies, format_amount, session_currency
+from recurring import FREQUENCIES, RecurringScheduler, parse_cron, project_recurring
+
+
+def show_recurring_expenses(db: StorageBackend):
+    """Display recurring expense rules and upcoming charges"""
+    st.markdown('<h2><i class="fas fa-redo icon"></i>Recurring Expenses</h2>',
+                unsafe_allow_html=True)
+
+    categories = db.get_categories(st.session_state.user['id'])['name'].tolist()
+
+    with st.form("recurring_form", clear_on_submit=True):
+        st.markdown(
+            '<h4><i class="fas fa-calendar-plus icon"></i>New Recurring Expense</h4>', unsafe_allow_html=True)
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            amount_col, currency_col = st.columns([2, 1])
+            with amount_col:
+                amount = st.number_input(
+                    "💰 Amount",
+                    min_value=1.00,
+                    step=1.00,
+                    format="%.2f"
+                )
+            with currency_col:
+                currencies = available_currencies()
+                base_currency = session_currency(st.session_state)
+                currency = st.selectbox(
+                    "💱 Currency",
+                    options=currencies,
+                    index=currencies.index(base_currency) if base_currency in currencies else 0
+                )
+            category = st.selectbox("📂 Category", options=categories)
+            description = st.text_input(
+                "📝 Description",
+                placeholder="e.g. Rent, Netflix, Gym membership",
+                max_chars=200
+            )
+
+        with col2:
+            frequency = st.selectbox(
+                "🔁 Frequency",
+                options=FREQUENCIES,
+                format_func=lambda x: x.capitalize()
+            )
+            interval = st.number_input(
+                "Every N periods",
+                min_value=1,
+                value=1,
+                step=1,
+                help="For example, 2 with weekly frequency means every other week"
+            )
+            cron = st.text_input(
+                "Custom schedule",
+                placeholder="day-of-month month day-of-week, e.g. 1,15 * *",
+                help="Only used with Custom frequency. Day-of-week 0 is Monday."
+            )
+            date_col1, date_col2 = st.columns(2)
+            with date_col1:
+                start_date = st.date_input("📅 Starts", value=datetime.now().date())
+            with date_col2:
+                end_date = st.date_input("📅 Ends (optional)", value=None)
+
+        if st.form_submit_button("💾 Save Recurring Expense", type="primary", use_container_width=True):
+            if frequency == "custom":
+                try:
+                    parse_cron(cron)
+                except ValueError as error:
+                    st.error(f"Invalid custom schedule: {error}")
+                    st.stop()
+
+            if end_date and end_date < start_date:
+                st.warning("End date must be after the start date.")
+            elif db.add_recurring_expense(
+                st.session_state.user['id'],
+                amount,
+                category,
+                description.strip(),
+                frequency,
+                start_date.strftime('%Y-%m-%d'),
+                interval=int(interval),
+                cron=cron.strip() if frequency == "custom" else None,
+                end_date=end_date.strftime('%Y-%m-%d') if end_date else None,
+                currency=currency
+            ):
+                # Materialize anything already due (e.g. a rule starting today)
+                RecurringScheduler(db).run()
+                st.success("Recurring expense saved!")
+            else:
+                st.error("Failed to save recurring expense.")
+
+    st.markdown("---")
+
+    rules_df = db.get_recurring_expenses(st.session_state.user['id'])
+
+    if rules_df.empty:
+        st.info("No recurring expenses yet. Add rent, subscriptions or bills above.")
+        return
+
+    st.markdown('<h4><i class="fas fa-list icon"></i>Active Rules</h4>',
+                unsafe_allow_html=True)
+
+    for _, rule in rules_df.iterrows():
+        if rule['frequency'] == "custom":
+            schedule = f"custom ({rule['cron']})"
+        elif rule['interval'] > 1:
+            schedule = f"every {rule['interval']} × {rule['frequency']}"
+        else:
+            schedule = rule['frequency']
+        rule_col1, rule_col2 = st.columns([4, 1])
+        with rule_col1:
+            st.markdown(f'''
+            <div class="expense-card">
+                <strong>{format_amount(rule['amount'], rule['currency'], grouped=False)}</strong> → {rule['category']} • {rule['description'] or 'No description'}
+                <div style="color: #6b7280; font-size: 0.9rem;">
+                    {schedule} from {rule['start_date']}{f" until {rule['end_date']}" if rule['end_date'] else ''}
+                    • added through {rule['materialized_through'] or 'not yet'}
+                </div>
+            </div>
+            ''', unsafe_allow_html=True)
+        with rule_col2:
+            if st.button("⏹️ Stop", key=f"stop_recurring_{rule['id']}", use_container_width=True):
+                if db.deactivate_recurring_expense(rule['id'], st.session_state.user['id']):
+                    st.rerun()
+
+    # Preview of the next 30 days
+    st.markdown('<h4><i class="fas fa-calendar-alt icon"></i>Next 30 Days</h4>',
+                unsafe_allow_html=True)
+    today = datetime.now().date()
+    upcoming = project_recurring(rules_df, today + timedelta(days=1), today + timedelta(days=30))
+    if upcoming.empty:
+        st.info("No recurring charges in the next 30 days.")
+    else:
+        upcoming['date'] = upcoming['date'].dt.strftime('%Y-%m-%d')
+        st.dataframe(
+            upcoming[['date', 'category', 'amount', 'currency', 'description']],
+            use_container_width=True,
+            hide_index=True
+        )